@@ -0,0 +1,95 @@
+"""Suite de benchmarks: python -m benchmarks [--suite micro,poll,db] [--quick]
+
+Los resultados se guardan en JSON (--output) y se comparan con la línea
+base (--baseline, por defecto benchmarks/baseline.json). Una mediana que
+empeora más que --threshold se marca como regresión y el proceso termina
+con código 1. --save-baseline convierte la corrida en la nueva línea base.
+
+La línea base es local a cada máquina (los tiempos dependen del equipo y
+no se versiona): en un checkout nuevo hay que generarla primero con
+
+    python -m benchmarks --save-baseline
+
+y desde entonces cada corrida se compara contra ella. Sin línea base no se
+puede detectar ninguna regresión y el reporte lo advierte.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import (  # noqa: E402
+    DEFAULT_BASELINE, REGRESSION_THRESHOLD, VERDICT_REGRESSION,
+    compare, load_results, save_results, print_report
+)
+
+SUITES = ('micro', 'poll', 'db')
+
+
+def run_suite(name, args):
+    if name == 'micro':
+        from benchmarks import micro
+        return micro.run(args.quick)
+    if name == 'poll':
+        from benchmarks import polling
+        return polling.run(args.quick)
+    from benchmarks import database
+    return database.run(args.quick, args.db, args.pg_dbname)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite', default=','.join(SUITES),
+                        help=f"suites separadas por coma ({', '.join(SUITES)})")
+    parser.add_argument('--quick', action='store_true', help='menos iteraciones (verificación rápida)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='línea base JSON para comparar')
+    parser.add_argument('--save-baseline', action='store_true', help='guardar esta corrida como línea base')
+    parser.add_argument('--output', help='guardar los resultados de esta corrida en JSON')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='cambio relativo de la mediana considerado regresión (0.15 = 15%%)')
+    parser.add_argument('--db', choices=('sqlite', 'postgres'), default='sqlite',
+                        help='base de datos para la suite db')
+    parser.add_argument('--pg-dbname', default='test_bench_benchmark',
+                        help='base PostgreSQL dedicada para --db postgres')
+    args = parser.parse_args(argv)
+
+    suites = [name.strip() for name in args.suite.split(',') if name.strip()]
+    unknown = [name for name in suites if name not in SUITES]
+    if unknown:
+        parser.error(f"unknown suite: {', '.join(unknown)}")
+
+    results = {}
+    for name in suites:
+        print(f"[BENCH] ▶️ {name}...", flush=True)
+        try:
+            results.update(run_suite(name, args))
+        except ImportError as ex:
+            print(f"[BENCH] ⚠️ Suite {name} omitida: {ex}")
+
+    baseline = load_results(args.baseline)
+    comparison = compare(results, baseline, args.threshold)
+    print()
+    print_report(results, comparison)
+    if not baseline and not args.save_baseline:
+        print(f"[BENCH] ⚠️ Sin línea base en {args.baseline}: no se evaluaron regresiones. "
+              f"Generarla con: python -m benchmarks --save-baseline")
+
+    if args.output:
+        save_results(args.output, results)
+        print(f"[BENCH] Resultados guardados en {args.output}")
+    if args.save_baseline:
+        # Se conservan las mediciones de suites que no corrieron esta vez
+        save_results(args.baseline, dict(baseline, **results))
+        print(f"[BENCH] Línea base actualizada: {args.baseline}")
+
+    regressions = [row[0] for row in comparison if row[4] == VERDICT_REGRESSION]
+    if regressions and not args.save_baseline:
+        print(f"[BENCH] ❌ {len(regressions)} regresiones: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
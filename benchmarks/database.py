@@ -0,0 +1,144 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from benchmarks.harness import bench_latency, quiet
+from services import db_service
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db', 'schema.sql')
+
+# Base PostgreSQL dedicada: los benchmarks insertan y borran sus propias filas
+POSTGRES_DBNAME = 'test_bench_benchmark'
+
+BENCH_METERS = 50
+
+
+class SqliteCursor:
+    """Cursor sqlite3 que acepta los marcadores %s de psycopg2."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql.replace('%s', '?'), params)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class SqliteConnection:
+    """Conexión sqlite3 con la interfaz que usa services.db_service."""
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path)
+
+    def cursor(self):
+        return SqliteCursor(self._connection.cursor())
+
+    def commit(self):
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+
+def sqlite_schema():
+    # Tipos de PostgreSQL que SQLite no entiende
+    with open(SCHEMA_FILE, encoding='utf-8') as f:
+        return f.read().replace('SERIAL PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT')
+
+
+def postgres_factory(dbname=POSTGRES_DBNAME):
+    import psycopg2
+    settings = dict(db_service.DB_SETTINGS, dbname=dbname)
+    return lambda: psycopg2.connect(**settings)
+
+
+def _seed(meters):
+    client_id = db_service.insert_client('BENCHMARK')
+    technician_id = db_service.insert_technician('BENCHMARK')
+    group_id = db_service.insert_meter_group({
+        'brand': 'BENCH', 'model': 'B-1', 'ratio': 100, 'nominal_flow': 2.5,
+        'diameter': 15, 'type': 'volumetric', 'batch': 'new',
+    }, client_id, technician_id)
+    meter_ids = [db_service.save_meter_if_not_exists(f'BENCH-{i:05d}', group_id) for i in range(meters)]
+    return client_id, technician_id, group_id, meter_ids
+
+
+def _cleanup(client_id, technician_id):
+    # Los lotes, medidores y pruebas se borran en cascada
+    connection = db_service.connect()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM clients WHERE id = %s", (client_id,))
+        cursor.execute("DELETE FROM technicians WHERE id = %s", (technician_id,))
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+
+def run(quick=False, backend='sqlite', dbname=POSTGRES_DBNAME):
+    count = (lambda n: max(5, n // 10)) if quick else (lambda n: n)
+    workdir = None
+    if backend == 'sqlite':
+        workdir = tempfile.mkdtemp(prefix='bench_db_')
+        path = os.path.join(workdir, 'test_bench.sqlite3')
+        with sqlite3.connect(path) as connection:
+            connection.executescript(sqlite_schema())
+        factory = lambda: SqliteConnection(path)
+    elif backend == 'postgres':
+        factory = postgres_factory(dbname)
+        connection = factory()
+        try:
+            with open(SCHEMA_FILE, encoding='utf-8') as f:
+                connection.cursor().execute(f.read())
+            connection.commit()
+        finally:
+            connection.close()
+    else:
+        raise ValueError(f"Unsupported database backend: {backend}")
+
+    results = {}
+    db_service.set_connection_factory(factory)
+    try:
+        with quiet():
+            client_id, technician_id, _, meter_ids = _seed(BENCH_METERS)
+            serials = [f'BENCH-{i:05d}' for i in range(BENCH_METERS)]
+            state = {'n': 0}
+
+            def insert_test():
+                n = state['n'] = state['n'] + 1
+                db_service.save_test_for_meter(meter_ids[n % len(meter_ids)], {
+                    'test_type': ('Q1', 'Q2', 'Q3', 'Q4')[n % 4], 'test_number': n,
+                    'initial_reading': 100.0, 'final_reading': 1101.5,
+                    'reference_value': 1000.0, 'error': 0.15, 'passed': True,
+                })
+
+            def next_serial():
+                state['n'] += 1
+                return serials[state['n'] % len(serials)]
+
+            results[f'db.{backend}.insert_test'] = bench_latency(insert_test, count(1000))
+            results[f'db.{backend}.save_meter_existing'] = bench_latency(
+                lambda: db_service.save_meter_if_not_exists(next_serial(), None), count(500))
+            results[f'db.{backend}.test_count'] = bench_latency(
+                lambda: db_service.get_existing_test_count(next_serial(), 'Q1'), count(500))
+            results[f'db.{backend}.report'] = bench_latency(
+                lambda: db_service.fetch_report_for_serial(next_serial()), count(500))
+            _cleanup(client_id, technician_id)
+    finally:
+        db_service.set_connection_factory(None)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
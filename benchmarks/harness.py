@@ -0,0 +1,156 @@
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+# Línea base por defecto (se genera con --save-baseline; depende de la máquina)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Cambio relativo de la mediana que se marca como regresión o mejora
+REGRESSION_THRESHOLD = 0.15
+
+# Microbenchmarks: muestras y duración mínima (s) de cada muestra
+SAMPLES = 7
+MIN_SAMPLE_TIME = 0.05
+
+VERDICT_REGRESSION = 'regression'
+VERDICT_IMPROVED = 'improved'
+VERDICT_OK = 'ok'
+VERDICT_NEW = 'new'
+
+
+def _time_loop(func, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return time.perf_counter() - start
+
+
+def bench_ops(func, samples=SAMPLES, min_time=MIN_SAMPLE_TIME):
+    """Microbenchmark al estilo timeit: llamadas por muestra calibradas a min_time.
+
+    Retorna median_us/min_us (tiempo por llamada), ops_per_sec y calls.
+    """
+    number = 1
+    while True:
+        elapsed = _time_loop(func, number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / elapsed * 1.2)) if elapsed else number * 10
+    times = [_time_loop(func, number) / number for _ in range(samples)]
+    median = statistics.median(times)
+    return {
+        'median_us': median * 1e6,
+        'min_us': min(times) * 1e6,
+        'ops_per_sec': 1.0 / median,
+        'calls': number * samples,
+    }
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench_latency(func, iterations, warmup=5):
+    """Mide cada llamada por separado: rendimiento y percentiles de latencia."""
+    for _ in range(warmup):
+        func()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        begin = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - begin)
+    total = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'median_us': statistics.median(latencies) * 1e6,
+        'p95_us': _percentile(latencies, 0.95) * 1e6,
+        'p99_us': _percentile(latencies, 0.99) * 1e6,
+        'max_us': latencies[-1] * 1e6,
+        'ops_per_sec': iterations / total,
+        'calls': iterations,
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """Descarta la salida estándar (los servicios registran cada comando)."""
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def environment():
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+    }
+
+
+def load_results(path):
+    """Lee un archivo de resultados; retorna {} si no existe."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f).get('results', {})
+
+
+def save_results(path, results):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'meta': environment(), 'results': results}, f, indent=2, sort_keys=True)
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Compara la mediana de cada benchmark con la línea base.
+
+    Retorna [(nombre, base_us, actual_us, cambio relativo, veredicto)].
+    """
+    rows = []
+    for name, result in sorted(results.items()):
+        current = result['median_us']
+        base = baseline.get(name, {}).get('median_us')
+        if not base:
+            rows.append((name, None, current, None, VERDICT_NEW))
+            continue
+        change = current / base - 1.0
+        if change > threshold:
+            verdict = VERDICT_REGRESSION
+        elif change < -threshold:
+            verdict = VERDICT_IMPROVED
+        else:
+            verdict = VERDICT_OK
+        rows.append((name, base, current, change, verdict))
+    return rows
+
+
+def format_us(value):
+    if value is None:
+        return '-'
+    if value >= 1e6:
+        return f'{value / 1e6:.2f} s'
+    if value >= 1e3:
+        return f'{value / 1e3:.2f} ms'
+    return f'{value:.2f} us'
+
+
+def print_report(results, comparison, out=sys.stdout):
+    marks = {VERDICT_REGRESSION: '❌', VERDICT_IMPROVED: '✅', VERDICT_OK: '  ', VERDICT_NEW: '🆕'}
+    width = max((len(name) for name in results), default=10)
+    print(f"{'benchmark':<{width}}  {'mediana':>10}  {'p99':>10}  {'ops/s':>12}  {'base':>10}  cambio",
+          file=out)
+    for name, base, current, change, verdict in comparison:
+        result = results[name]
+        change_text = f'{change:+.1%}' if change is not None else ''
+        print(f"{name:<{width}}  {format_us(current):>10}  {format_us(result.get('p99_us')):>10}  "
+              f"{result['ops_per_sec']:>12.1f}  {format_us(base):>10}  {marks[verdict]} {change_text}",
+              file=out)
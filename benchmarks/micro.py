@@ -0,0 +1,55 @@
+from benchmarks.harness import bench_ops
+from utils.address_utils import resolve_address, get_address
+from utils.meter_error import recalculate_rows
+from utils.modbus_utils import (
+    build_modbus_ascii_command, parse_modbus_ascii_response, encode_ascii_frame, pack_floats
+)
+from utils.poll_map import compile_reads, INSTANT_POINTS
+
+TABLE_SIZES = (20, 200)
+
+
+def _instant_response():
+    """Respuesta de la lectura coalescida de los valores instantáneos (D136-D157)."""
+    block = compile_reads(tuple(INSTANT_POINTS))[0]
+    payload = bytearray(2 * block['quantity'])
+    floats = pack_floats([125.5, 250.0, 375.2], 'little_word')
+    payload[:len(floats)] = floats
+    frame = encode_ascii_frame(bytes((1, 3, len(payload))) + payload)
+    return block, frame
+
+
+def _table_rows(size):
+    types = ('Q1', 'Q2', 'Q3', 'Q4')
+    return [
+        [str(i), str(1000 + i // 8), types[i % 4], f'{i * 10.0:.1f}', f'{i * 10.0 + 1010.0:.1f}', '', '', '']
+        for i in range(size)
+    ]
+
+
+def run(quick=False):
+    results = {}
+    options = {'samples': 3, 'min_time': 0.01} if quick else {}
+    block, response = _instant_response()
+    high, low = block['start'] >> 8, block['start'] & 0xFF
+
+    results['codec.build_read'] = bench_ops(
+        lambda: build_modbus_ascii_command(1, 3, high, low, quantity=block['quantity']), **options)
+    results['codec.build_write_float'] = bench_ops(
+        lambda: build_modbus_ascii_command(1, 16, 0x10, 0x90, quantity=2, value=[375.0], value_type='float'),
+        **options)
+    results['codec.parse_read_legacy'] = bench_ops(
+        lambda: parse_modbus_ascii_response(response), **options)
+    results['codec.parse_read_plan'] = bench_ops(
+        lambda: parse_modbus_ascii_response(response, plan=block['plan']), **options)
+
+    results['address.resolve'] = bench_ops(lambda: resolve_address('D', 136), **options)
+    results['address.resolve_symbol'] = bench_ops(lambda: resolve_address('D136'), **options)
+    results['address.get_address'] = bench_ops(lambda: get_address('D', 136), **options)
+
+    instant_values = {'Q1': 1000.0, 'Q2': 2000.0, 'Q3': 3000.0, 'Q4': 4000.0}
+    for size in TABLE_SIZES:
+        rows = _table_rows(size)
+        results[f'table.recalculate_{size}_rows'] = bench_ops(
+            lambda rows=rows: recalculate_rows(rows, instant_values, 'Nuevo'), **options)
+    return results
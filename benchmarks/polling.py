@@ -0,0 +1,107 @@
+import time
+from benchmarks.harness import bench_latency, quiet
+from services.modbus_service import ModbusService
+from services.poll_scheduler import NORMAL_PERIOD
+from services.transports import MODE_LOOPBACK
+from tests.com_simulator import ModbusSimulator
+from tests.fault_injection import FaultInjector
+from tests.simulator_scenarios import VirtualClock, SCENARIOS, scenario_duration
+from utils.poll_map import INSTANT_POINTS, TEST_POINTS
+
+# Servicio propio: no comparte cola ni conexión con la instancia de la app
+BENCH_SERVICE_KEY = 'benchmark'
+BENCH_SEED = 1234
+
+# Velocidad modelada en el cable para la medición con tiempos reales
+WIRE_BAUDRATE = 9600
+
+
+def _service(responder, baudrate=None):
+    service = ModbusService(BENCH_SERVICE_KEY)
+    if not service.connect(responder, baudrate, MODE_LOOPBACK):
+        raise RuntimeError("Loopback connection failed")
+    service.breaker.reset()
+    return service
+
+
+def _poll_cycle(service):
+    """Un ciclo del lazo de lectura: estados FC y valores instantáneos."""
+    service.read_coils(277, 26)
+    service.read_points(INSTANT_POINTS)
+
+
+def _batch_replay(iterations):
+    """Lote completo (tests/simulator_scenarios.py) sondeado cada NORMAL_PERIOD virtual."""
+    clock = VirtualClock(speed=None)
+    simulator = ModbusSimulator(verbose=False, clock=clock, seed=BENCH_SEED)
+    service = _service(simulator)
+    cycles = int(scenario_duration(SCENARIOS['batch']) / NORMAL_PERIOD) + 1
+    durations = []
+    for _ in range(iterations):
+        simulator.scenarios.start('batch')
+        start = time.perf_counter()
+        for _ in range(cycles):
+            _poll_cycle(service)
+            clock.advance(NORMAL_PERIOD)
+        durations.append(time.perf_counter() - start)
+        if simulator.scenarios.active:
+            raise RuntimeError("Batch scenario did not finish")
+    durations.sort()
+    median = durations[len(durations) // 2]
+    return {
+        'median_us': median * 1e6,
+        'max_us': durations[-1] * 1e6,
+        # Lotes por segundo y ciclos de sondeo por lote
+        'ops_per_sec': 1.0 / median,
+        'cycles': cycles,
+        'calls': iterations,
+    }
+
+
+def _turnaround_result(service):
+    """Tiempo de respuesta del PLC medido por el transporte (fin de envío -> primer byte)."""
+    summary = service.turnaround_stats()
+    if not summary or not summary['samples']:
+        return None
+    turnaround, transaction = summary['turnaround'], summary['transaction']
+    return {
+        'median_us': turnaround['median_ms'] * 1e3,
+        'p95_us': turnaround['p95_ms'] * 1e3,
+        'max_us': turnaround['max_ms'] * 1e3,
+        'transaction_median_us': transaction['median_ms'] * 1e3,
+        # Transacciones por segundo que admite el enlace con esa mediana
+        'ops_per_sec': 1e3 / transaction['median_ms'],
+        'calls': summary['samples'],
+    }
+
+
+def run(quick=False):
+    scale = 0.1 if quick else 1.0
+    count = lambda n: max(5, int(n * scale))
+    results = {}
+    with quiet():
+        service = _service(ModbusSimulator(verbose=False, seed=BENCH_SEED))
+        results['poll.instant_points'] = bench_latency(
+            lambda: service.read_points(INSTANT_POINTS), count(2000))
+        results['poll.test_points'] = bench_latency(
+            lambda: service.read_points(TEST_POINTS), count(2000))
+        results['poll.status_coils'] = bench_latency(
+            lambda: service.read_coils(277, 26), count(2000))
+        results['poll.cycle'] = bench_latency(lambda: _poll_cycle(service), count(1000))
+        results['poll.setpoint_write'] = bench_latency(
+            lambda: service.write_setpoints({'ratio': 100}), count(500))
+
+        service = _service(ModbusSimulator(verbose=False, seed=BENCH_SEED), WIRE_BAUDRATE)
+        results[f'poll.cycle_{WIRE_BAUDRATE}_baud'] = bench_latency(
+            lambda: _poll_cycle(service), count(30), warmup=1)
+        turnaround = _turnaround_result(service)
+        if turnaround:
+            results[f'poll.turnaround_{WIRE_BAUDRATE}_baud'] = turnaround
+
+        injector = FaultInjector(ModbusSimulator(verbose=False), 'noisy_line', seed=BENCH_SEED)
+        service = _service(injector)
+        results['poll.cycle_noisy_line'] = bench_latency(lambda: _poll_cycle(service), count(300))
+
+        results['poll.batch_replay'] = _batch_replay(3 if quick else 5)
+        service.close()
+    return results
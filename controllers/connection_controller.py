@@ -1,17 +1,29 @@
-import threading
-import time
-from services.serial_service import detect_com_port
+from services.modbus_service import ModbusService
+from services.port_watcher import (
+    watch_port, EVENT_CONNECTED, EVENT_LOST, EVENT_RESTORED, EVENT_WAITING
+)
 
-def monitor_com_connection(on_ready_callback, update_ui_callback):
-    def loop():
-        while True:
-            port = detect_com_port()
-            if port:
-                update_ui_callback(f"✅ COM Port Detected: {port}")
-                time.sleep(1)
+def monitor_com_connection(on_ready_callback, update_ui_callback, service=None):
+    """Vigila el puerto durante toda la sesión.
+
+    Conecta el adaptador del banco (el de la última conexión o uno guardado
+    en la configuración de enlaces) y llama a on_ready_callback una vez; si
+    el cable se desconecta, reconecta el mismo adaptador al volver.
+    """
+    service = service or ModbusService()
+    ready = []
+
+    def on_event(event, port):
+        if event == EVENT_CONNECTED:
+            update_ui_callback(f"✅ COM Port Detected: {port}")
+            if not ready:
+                ready.append(port)
                 on_ready_callback()
-                break
-            else:
-                update_ui_callback("⚠️ No COM Port found. Waiting...")
-                time.sleep(2)
-    threading.Thread(target=loop, daemon=True).start()
+        elif event == EVENT_WAITING:
+            update_ui_callback("⚠️ Bench COM adapter not found. Waiting...")
+        elif event == EVENT_LOST:
+            update_ui_callback(f"🔌 COM Port disconnected: {port}. Waiting for it to come back...")
+        elif event == EVENT_RESTORED:
+            update_ui_callback(f"✅ COM Port reconnected: {port}")
+
+    return watch_port(service, on_event)
@@ -1,8 +1,9 @@
 from services.modbus_service import ModbusService
 
 class ModbusController:
-    def __init__(self, update_ui_callback):
-        self.service = ModbusService()
+    def __init__(self, update_ui_callback, service=None):
+        # service permite atar el controlador a otro puerto (ver ModbusServicePool)
+        self.service = service or ModbusService()
         self.update_ui_callback = update_ui_callback
 
     def start_reading(self, esclavo):
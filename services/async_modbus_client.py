@@ -0,0 +1,394 @@
+import asyncio
+import heapq
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from services.command_scheduler import PRIORITY_OPERATOR, PRIORITY_POLL, PRIORITY_SAFETY
+from services.frame_cache import FrameCache
+from services.link_policy import CircuitBreaker, TransactionRetry, DEFAULT_POLICIES
+from services.modbus_requests import (
+    words_to_bytes, coil_bits, read_data, write_acknowledged, read_plan, cached_reads, fill_reads,
+    decode_blocks, stale_gaps, block_data, write_frame, setpoint_results
+)
+from services.modbus_service import (
+    BYTE_ORDER_FLOAT, SAFETY_COILS, BUTTON_COILS, STATUS_MAX_AGE_MS,
+    SafetyCommandError, active_fc_messages, link_parameters
+)
+from services.poll_scheduler import PollTimer, RefreshSchedule, select_poll_period
+from services.register_image import RegisterImage
+from services.serial_service import list_serial_ports
+from services.transports import create_transport, MODE_ASCII
+from utils.modbus_utils import build_modbus_ascii_command
+from utils.address_utils import resolve_address, address_bytes
+from utils.poll_map import plan_reads, plan_writes
+
+# Espera (s) entre el ON y el OFF de un botón momentáneo (como ModbusService.send_boolean)
+PULSE_DELAY = 0.1
+
+
+class _PriorityGate:
+    """Acceso exclusivo al bus; entre los que esperan pasa primero la menor prioridad."""
+
+    def __init__(self):
+        self._busy = False
+        self._waiters = []
+        self._seq = itertools.count()
+
+    async def acquire(self, priority):
+        if not self._busy and not self._waiters:
+            self._busy = True
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Cancelado después de que release() le cediera el bus: pasarlo al siguiente
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._busy = False
+
+
+class AsyncModbusClient:
+    """Cliente Modbus sobre asyncio con los transportes de services.transports.
+
+    Sirve para ASCII, RTU, TCP y loopback con la misma configuración de enlace
+    que ModbusService (incluida la negociada y guardada por puerto). En Linux
+    el puerto serie ASCII se atiende desde el propio loop (el descriptor se
+    vigila con add_reader, ver LinuxSerialAsciiTransport.transact_async); los
+    demás transportes corren en un único hilo del bus y el loop solo espera
+    su resultado. Timeout, reintentos y disyuntor siguen DEFAULT_POLICIES
+    según la prioridad de cada solicitud.
+    """
+
+    def __init__(self, slave=1):
+        self.slave = slave
+        self.transport = None
+        self.connected = False
+        # Últimos parámetros de conexión (para reconectar)
+        self.port = None
+        self.mode = MODE_ASCII
+        self.baudrate = None
+        self.framing = None
+        self.frames = FrameCache()
+        self.image = RegisterImage()
+        self.breaker = CircuitBreaker()
+        self._gate = _PriorityGate()
+        self._bus = ThreadPoolExecutor(max_workers=1, thread_name_prefix='modbus-bus')
+
+    async def _on_bus(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._bus, func, *args)
+
+    async def _exchange(self, commands, timeout):
+        transport = self.transport
+        if getattr(transport, 'pollable', False):
+            return [await transport.transact_async(command, timeout) for command in commands]
+        # Sin descriptor vigilable: las transacciones bloqueantes van al hilo del bus
+        return await self._on_bus(transport.transact_many, commands, timeout)
+
+    async def connect(self, port, baudrate=None, mode=MODE_ASCII, framing=None):
+        """Abre el transporte (ver ModbusService.connect)."""
+        baudrate, framing = link_parameters(port, mode, baudrate, framing)
+        transport = create_transport(mode, port, baudrate, framing=framing)
+        await self.close()
+        try:
+            await self._on_bus(transport.open)
+        except Exception as ex:
+            print(f"[AsyncModbusClient] ❌ No se pudo conectar a {port} ({mode}): {ex}")
+            return False
+        self.transport = transport
+        self.breaker.reset()
+        self.port, self.mode, self.baudrate, self.framing = port, mode, baudrate, framing
+        self.connected = True
+        return True
+
+    async def reconnect(self, port=None):
+        return await self.connect(port or self.port, self.baudrate, self.mode, self.framing)
+
+    async def close(self):
+        transport, self.transport = self.transport, None
+        self.connected = False
+        if transport and transport.is_open:
+            try:
+                await self._on_bus(transport.close)
+            except Exception as ex:
+                print(f"[AsyncModbusClient] ⚠️ Error cerrando el puerto: {ex}")
+
+    async def transact_many(self, commands, priority=PRIORITY_OPERATOR):
+        """Envía tramas ASCII y retorna sus respuestas validadas (None si faltan).
+
+        Solo se reintentan las tramas sin respuesta. Con el disyuntor abierto
+        se retorna None sin tocar el puerto, salvo las órdenes de seguridad.
+        """
+        commands = [c.encode('ascii') if isinstance(c, str) else c for c in commands]
+        if not self.connected:
+            return [None] * len(commands)
+        policy = DEFAULT_POLICIES.get(priority, DEFAULT_POLICIES[PRIORITY_OPERATOR])
+        retry = TransactionRetry(policy, self.breaker, len(commands), priority == PRIORITY_SAFETY)
+        await self._gate.acquire(priority)
+        try:
+            for delay, pending in retry.attempts():
+                if delay:
+                    await asyncio.sleep(delay)
+                if not retry.allowed():
+                    break
+                try:
+                    results = await self._exchange([commands[i] for i in pending], policy.timeout)
+                except Exception as ex:
+                    print(f"[AsyncModbusClient] ❌ Error en el enlace: {ex}")
+                    results = None
+                retry.record(results)
+        finally:
+            self._gate.release()
+        responses = retry.responses
+        for command, response in zip(commands, responses):
+            if response:
+                self._record(command, response)
+        return responses
+
+    async def transact(self, command, priority=PRIORITY_OPERATOR):
+        """Envía un comando ASCII y retorna la respuesta validada (o None)."""
+        return (await self.transact_many([command], priority))[0]
+
+    def _record(self, command_bytes, response):
+        try:
+            self.image.record(command_bytes, response)
+        except Exception as ex:
+            print(f"[AsyncModbusClient] ⚠️ No se pudo actualizar la imagen: {ex}")
+
+    def _command(self, function_code, device, index, slave=None, **kwargs):
+        high, low = address_bytes(device, index)
+        return build_modbus_ascii_command(
+            self.slave if slave is None else slave, function_code, high, low,
+            float_byte_order=BYTE_ORDER_FLOAT, **kwargs
+        )
+
+    async def read_registers(self, index, quantity, slave=None, priority=PRIORITY_OPERATOR, max_age_ms=None):
+        """Función 3 sobre registros D. Retorna los bytes crudos o None.
+
+        Con max_age_ms se usa la imagen si los valores son recientes.
+        """
+        slave = self.slave if slave is None else slave
+        address = resolve_address('D', index)
+        if max_age_ms is not None:
+            words = self.image.get_registers(slave, address, quantity, max_age_ms)
+            if words is not None:
+                return words_to_bytes(words)
+        response = await self.transact(self.frames.get(slave, 3, address, quantity), priority)
+        return read_data(response, "AsyncModbusClient")
+
+    async def read_coils(self, index, quantity, slave=None, priority=PRIORITY_OPERATOR, max_age_ms=None):
+        """Función 1 sobre bobinas M. Retorna la lista de bits o None."""
+        slave = self.slave if slave is None else slave
+        address = resolve_address('M', index)
+        if max_age_ms is not None:
+            bits = self.image.get_coils(slave, address, quantity, max_age_ms)
+            if bits is not None:
+                return bits
+        response = await self.transact(self.frames.get(slave, 1, address, quantity), priority)
+        data = read_data(response, "AsyncModbusClient")
+        return None if data is None else coil_bits(data, quantity)
+
+    async def write_coil(self, index, value, slave=None, priority=None):
+        """Función 5 sobre una bobina M."""
+        if priority is None:
+            priority = PRIORITY_SAFETY if index in SAFETY_COILS else PRIORITY_OPERATOR
+        slave = self.slave if slave is None else slave
+        command = self.frames.get(slave, 5, resolve_address('M', index), value=1 if value else 0)
+        return write_acknowledged(await self.transact(command, priority))
+
+    async def write_registers(self, index, values, value_type='int', slave=None, priority=PRIORITY_OPERATOR):
+        """Escribe registros D: función 6 para un entero, función 16 en otro caso."""
+        if value_type == 'int' and len(values) == 1:
+            command = self._command(6, 'D', index, slave, value=int(values[0]), value_type='int')
+        elif value_type == 'int':
+            data = []
+            for v in values:
+                data += [(int(v) >> 8) & 0xFF, int(v) & 0xFF]
+            command = self._command(16, 'D', index, slave, quantity=len(values), custom_bytes=data)
+        else:
+            command = self._command(16, 'D', index, slave, quantity=2 * len(values),
+                                    value=list(values), value_type='float')
+        return write_acknowledged(await self.transact(command, priority))
+
+    async def _read_blocks(self, slave, blocks, priority, max_age_ms=None):
+        raws, missing = cached_reads(self.image, self.frames, slave, blocks, max_age_ms)
+        if missing:
+            responses = await self.transact_many([cmd for _, cmd in missing], priority)
+            fill_reads(raws, missing, responses, "AsyncModbusClient")
+        return raws
+
+    async def read_points(self, points, slave=None, priority=PRIORITY_OPERATOR, max_age_ms=None):
+        """Lee puntos del mapa de sondeo con lecturas coalescidas (en TCP, en paralelo)."""
+        slave = self.slave if slave is None else slave
+        blocks = read_plan(points)
+        raws = await self._read_blocks(slave, blocks, priority, max_age_ms)
+        return decode_blocks(blocks, raws, "AsyncModbusClient")
+
+    async def write_setpoints(self, values, slave=None, read_back=(), priority=PRIORITY_OPERATOR):
+        """Escribe consignas {nombre: valor} y las verifica (ver ModbusService.write_setpoints).
+
+        Siempre con función 16 y una lectura de verificación aparte.
+        Retorna {nombre: True/False} por cada consigna.
+        """
+        slave = self.slave if slave is None else slave
+        blocks = plan_writes(values)
+        addresses = [resolve_address(b['device'], b['start']) for b in blocks]
+
+        # Los huecos entre consignas se reescriben con su valor actual
+        stale = stale_gaps(self.image, slave, blocks, addresses)
+        if stale:
+            await self._read_blocks(slave, plan_reads(stale), priority)
+
+        written = set()
+        for block, address in zip(blocks, addresses):
+            data = block_data(self.image, slave, block, address, "AsyncModbusClient")
+            if data is not None and write_acknowledged(
+                    await self.transact(write_frame(slave, address, data), priority)):
+                written.update(point['name'] for point in block['points'])
+
+        verify = list(values) + [p for p in read_back if p not in values]
+        read_values = await self.read_points(verify, slave, priority)
+        return setpoint_results(blocks, values, written, read_values, "AsyncModbusClient")
+
+    async def send_coil_pulse(self, bit, slave=None):
+        """ON y luego OFF a la bobina M (ver ModbusService.send_coil_pulse)."""
+        results = [await self.write_coil(bit, value, slave) for value in (1, 0)]
+        if bit in SAFETY_COILS and not results[0]:
+            print(f"[AsyncModbusClient] ❌ Orden de seguridad M{bit} sin respuesta del PLC")
+            raise SafetyCommandError(f"M{bit} was not acknowledged by slave {self.slave if slave is None else slave}")
+        return results
+
+    async def send_boolean(self, name, value):
+        """Botón por nombre (BUTTON_COILS); con value=True se suelta tras PULSE_DELAY."""
+        if name not in BUTTON_COILS:
+            print(f"[AsyncModbusClient] ❌ Botón '{name}' no encontrado en mapeo")
+            return False
+        index = int(BUTTON_COILS[name][1:])
+        if not await self.write_coil(index, value):
+            print(f"[AsyncModbusClient] ❌ Error enviando {name} = {value}")
+            return False
+        if value:
+            await asyncio.sleep(PULSE_DELAY)
+            if not await self.write_coil(index, False):
+                print(f"[AsyncModbusClient] ⚠️ Error enviando {name} = False automático")
+        return True
+
+    async def read_system_status(self):
+        """Mensajes de los estados FC0-FC25 (M277-M302) activos."""
+        bits = await self.read_coils(277, 26, priority=PRIORITY_POLL, max_age_ms=STATUS_MAX_AGE_MS)
+        return active_fc_messages(bits) if bits else []
+
+    async def read_loop(self, slave, callback):
+        """Lazo de lectura de ModbusService (mismos PollTimer y RefreshSchedule) sobre el loop.
+
+        callback(kind, data) recibe ("instant", {"data": [...]}) cuando cambian
+        los valores instantáneos; puede ser una corrutina.
+        """
+        timer = PollTimer()
+        schedule = RefreshSchedule()
+        while True:
+            fc_bits = None
+            try:
+                fc_bits = await self.read_coils(277, 26, slave, PRIORITY_POLL, STATUS_MAX_AGE_MS)
+                values = await self.read_points(schedule.due(), slave, PRIORITY_POLL)
+                instant_data = schedule.update(values)
+                if instant_data is not None:
+                    result = callback("instant", {"data": instant_data})
+                    if asyncio.iscoroutine(result):
+                        await result
+            except Exception as ex:
+                callback("log", {"log": f"Error in Modbus read: {ex}"})
+            timer.set_period(select_poll_period(fc_bits))
+            await asyncio.sleep(timer.next_delay())
+
+
+class SyncModbusClient:
+    """Fachada síncrona: ejecuta un AsyncModbusClient en un loop propio.
+
+    Expone los métodos de ModbusService que usan vistas y controladores,
+    con las mismas firmas.
+    """
+
+    def __init__(self, slave=1):
+        self.client = AsyncModbusClient(slave=slave)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        # Lazos de lectura activos por esclavo: {slave: Future}
+        self._read_loops = {}
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    @property
+    def connected(self):
+        return self.client.connected
+
+    @property
+    def slave(self):
+        return self.client.slave
+
+    @slave.setter
+    def slave(self, slave):
+        self.client.slave = slave
+
+    def detect_port(self):
+        ports = list_serial_ports()
+        return ports[0].device if ports else None
+
+    def connect(self, port, baudrate=None, mode=MODE_ASCII, framing=None):
+        return self._run(self.client.connect(port, baudrate, mode, framing))
+
+    def reconnect(self, port=None):
+        return self._run(self.client.reconnect(port))
+
+    def close(self):
+        self._run(self.client.close())
+
+    def send_command(self, command, priority=PRIORITY_OPERATOR):
+        return self._run(self.client.transact(command, priority))
+
+    def read_registers(self, index, quantity, max_age_ms=None, priority=PRIORITY_OPERATOR, slave=None):
+        return self._run(self.client.read_registers(index, quantity, slave, priority, max_age_ms))
+
+    def read_coils(self, index, quantity, max_age_ms=None, priority=PRIORITY_OPERATOR, slave=None):
+        return self._run(self.client.read_coils(index, quantity, slave, priority, max_age_ms))
+
+    def read_points(self, points, priority=PRIORITY_OPERATOR, slave=None, max_age_ms=None):
+        return self._run(self.client.read_points(points, slave, priority, max_age_ms))
+
+    def write_setpoints(self, values, slave=None, read_back=(), priority=PRIORITY_OPERATOR):
+        return self._run(self.client.write_setpoints(values, slave, read_back, priority))
+
+    def send_coil_pulse(self, bit, slave=None):
+        return self._run(self.client.send_coil_pulse(bit, slave))
+
+    def send_boolean(self, name, value):
+        return self._run(self.client.send_boolean(name, value))
+
+    def read_system_status(self):
+        return self._run(self.client.read_system_status())
+
+    def start_read_loop(self, slave, update_ui_callback):
+        loop = self._read_loops.get(slave)
+        if loop and not loop.done():
+            return
+        self._read_loops[slave] = asyncio.run_coroutine_threadsafe(
+            self.client.read_loop(slave, update_ui_callback), self._loop)
+
+    def stop_read_loop(self, slave=None):
+        """Detiene el lazo de lectura del esclavo indicado (o todos)."""
+        slaves = list(self._read_loops) if slave is None else [slave]
+        for key in slaves:
+            loop = self._read_loops.pop(key, None)
+            if loop:
+                loop.cancel()
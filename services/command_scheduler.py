@@ -0,0 +1,77 @@
+import itertools
+import queue
+import threading
+import time
+
+# Clases de prioridad (menor valor = se atiende antes)
+PRIORITY_SAFETY = 0     # Parada de emergencia, Reiniciar
+PRIORITY_OPERATOR = 1   # Escrituras y lecturas pedidas por el operador
+PRIORITY_POLL = 2       # Lecturas periódicas en segundo plano
+
+# Tiempo máximo (s) que una lectura periódica puede esperar en la cola
+POLL_DEADLINE = 1.0
+
+
+class ScheduledCommand:
+    __slots__ = ("func", "args", "kwargs", "result_queue", "priority", "deadline", "policy")
+
+    def __init__(self, func, args, kwargs, result_queue, priority, deadline, policy=None):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.result_queue = result_queue
+        self.priority = priority
+        self.deadline = deadline
+        self.policy = policy
+
+    def expired(self, now=None):
+        if self.deadline is None:
+            return False
+        return (now if now is not None else time.monotonic()) > self.deadline
+
+
+class CommandScheduler:
+    """Cola de comandos por prioridad con plazo por solicitud.
+
+    Dentro de una misma prioridad se respeta el orden de llegada. Los comandos
+    cuyo plazo venció antes de llegar al bus se descartan y su solicitante
+    recibe None.
+    """
+
+    def __init__(self):
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, func, args=(), kwargs=None, result_queue=None,
+               priority=PRIORITY_OPERATOR, deadline=None, policy=None):
+        """Encola un comando. deadline es el tiempo máximo de espera en segundos.
+
+        policy (RequestPolicy) acompaña al comando hasta el worker que lo ejecuta.
+        """
+        if deadline is None and priority == PRIORITY_POLL:
+            deadline = POLL_DEADLINE
+        expires = time.monotonic() + deadline if deadline is not None else None
+        command = ScheduledCommand(func, args, kwargs or {}, result_queue, priority, expires, policy)
+        self._queue.put((priority, next(self._seq), command))
+        return command
+
+    def get(self):
+        """Bloquea hasta obtener el siguiente comando vigente de mayor prioridad."""
+        while True:
+            _, _, command = self._queue.get()
+            if not command.expired():
+                return command
+            with self._lock:
+                self.dropped += 1
+            print(f"[CommandScheduler] ⏱️ Descartado comando vencido: {command.func.__name__}")
+            if command.result_queue:
+                command.result_queue.put(None)
+            self._queue.task_done()
+
+    def task_done(self):
+        self._queue.task_done()
+
+    def qsize(self):
+        return self._queue.qsize()
@@ -1,14 +1,27 @@
-import psycopg2
-
 # --- Conexión base ---
+DB_SETTINGS = {
+    "dbname": "test_bench",
+    "user": "postgres",
+    "password": "admin",
+    "host": "localhost",
+    "port": "5432",
+}
+
+# Fábrica alternativa de conexiones DB-API (p. ej. la base local de benchmarks/)
+_connection_factory = None
+
+
+def set_connection_factory(factory):
+    """Usa factory() en lugar de PostgreSQL; None vuelve a DB_SETTINGS."""
+    global _connection_factory
+    _connection_factory = factory
+
+
 def connect():
-    return psycopg2.connect(
-        dbname="test_bench",
-        user="postgres",
-        password="admin",
-        host="localhost",
-        port="5432"
-    )
+    if _connection_factory is not None:
+        return _connection_factory()
+    import psycopg2
+    return psycopg2.connect(**DB_SETTINGS)
 
 
 # --- CLIENTES ---
@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+from utils.modbus_utils import build_modbus_ascii_command
+
+# Tramas distintas que se conservan (lecturas del sondeo, pulsadores, estado)
+FRAME_CACHE_SIZE = 256
+
+
+class FrameCache:
+    """Tramas ASCII ya armadas, listas para escribir en el transporte.
+
+    Indexadas por (esclavo, función, dirección, cantidad, valor). Las tramas
+    fijas del sondeo y de los pulsadores se arman una sola vez; el resto se
+    descarta por antigüedad al superar maxsize. Se vacía con clear() cuando
+    cambian el esclavo o el modo de transporte.
+    """
+
+    def __init__(self, maxsize=FRAME_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, slave, function_code, address, quantity=1, value=None):
+        key = (slave, function_code, address, quantity, value)
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return frame
+        frame = build_modbus_ascii_command(
+            slave, function_code, (address >> 8) & 0xFF, address & 0xFF,
+            quantity=quantity, value=value)
+        with self._lock:
+            self.misses += 1
+            self._frames[key] = frame
+            if len(self._frames) > self.maxsize:
+                self._frames.popitem(last=False)
+        return frame
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+
+    def __len__(self):
+        return len(self._frames)
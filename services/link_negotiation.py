@@ -0,0 +1,102 @@
+import statistics
+import time
+from services.link_policy import RequestPolicy
+from services.serial_service import save_link_setting, DEFAULT_ASCII_FRAMING, DEFAULT_RTU_FRAMING
+from services.transports import MODE_ASCII, MODE_RTU
+from utils.address_utils import resolve_address
+from utils.modbus_utils import build_modbus_ascii_command, parse_modbus_ascii_response
+
+# Velocidades a probar, de la más rápida a la más lenta
+PROBE_BAUDRATES = (115200, 57600, 38400, 19200, 9600)
+# Tramas serie admitidas por los PLC Delta en cada modo
+PROBE_FRAMINGS = {
+    MODE_ASCII: (DEFAULT_ASCII_FRAMING, '7O1', '8E1', '8N1'),
+    MODE_RTU: (DEFAULT_RTU_FRAMING, '8N1', '8O1', '8N2'),
+}
+# Solicitudes por configuración y tasa de error máxima para considerarla estable
+PROBE_SAMPLES = 20
+MAX_ERROR_RATE = 0.05
+# Las pruebas fallan rápido: una configuración equivocada no contesta nunca
+PROBE_POLICY = RequestPolicy(timeout=0.2, retries=0)
+
+# Sondas: lectura barata de D122 (ratio) o eco de diagnóstico (función 8)
+PROBE_READ = 'read'
+PROBE_ECHO = 'echo'
+ECHO_DATA = 0xA537
+
+
+def probe_frame(slave, method=PROBE_READ):
+    if method == PROBE_ECHO:
+        return build_modbus_ascii_command(slave, 8, 0x00, 0x00, value=ECHO_DATA)
+    address = resolve_address('D122')
+    return build_modbus_ascii_command(slave, 3, address >> 8, address & 0xFF, quantity=1)
+
+
+def probe_link(service, samples=PROBE_SAMPLES, method=PROBE_READ, policy=PROBE_POLICY):
+    """Mide el enlace ya abierto del servicio.
+
+    Retorna {'error_rate', 'rtt_ms'} con la mediana del tiempo de ida y
+    vuelta de las respuestas válidas. Si la primera solicitud no tiene
+    respuesta se abandona la medición (error_rate 1.0).
+    """
+    frame = probe_frame(service.slave, method)
+    errors = 0
+    rtts = []
+    for sample in range(samples):
+        start = time.perf_counter()
+        response = service.send_command(frame, policy=policy)
+        elapsed = time.perf_counter() - start
+        parsed = parse_modbus_ascii_response(response) if response else {}
+        if parsed.get('type') in ('read', 'diagnostic'):
+            rtts.append(elapsed * 1000.0)
+        else:
+            errors += 1
+            if not rtts:
+                return {'error_rate': 1.0, 'rtt_ms': None}
+    return {
+        'error_rate': errors / samples,
+        'rtt_ms': statistics.median(rtts) if rtts else None,
+    }
+
+
+def negotiate_link(service, port, mode=MODE_ASCII, baudrates=PROBE_BAUDRATES, framings=None,
+                   samples=PROBE_SAMPLES, max_error_rate=MAX_ERROR_RATE, method=PROBE_READ,
+                   persist=True):
+    """Prueba velocidades y tramas contra el PLC y deja el enlace en la mejor.
+
+    La mejor es la de menor tiempo de ida y vuelta entre las que no superan
+    max_error_rate. Con persist se guarda como configuración del puerto, y
+    ModbusService.connect la usa cuando no se indica baudrate. Retorna la
+    configuración elegida o None (el servicio vuelve a la anterior).
+    """
+    previous = (service.port, service.baudrate, service.mode, service.framing, service.connected)
+    operator_closed = service.operator_closed
+    results = []
+    for baudrate in baudrates:
+        for framing in framings or PROBE_FRAMINGS[mode]:
+            if not service.connect(port, baudrate, mode, framing):
+                continue
+            measure = probe_link(service, samples, method)
+            print(f"[LinkNegotiation] {port} {baudrate} {framing}: "
+                  f"errores {measure['error_rate']:.0%}, rtt {measure['rtt_ms']} ms")
+            if measure['error_rate'] <= max_error_rate:
+                results.append({'mode': mode, 'baudrate': baudrate, 'framing': framing, **measure})
+
+    if not results:
+        print(f"[LinkNegotiation] ❌ Ninguna configuración estable en {port}")
+        port_, baudrate, mode_, framing, connected = previous
+        if connected:
+            service.connect(port_, baudrate, mode_, framing)
+        elif operator_closed:
+            service.close()
+        else:
+            service.drop_link()
+        return None
+
+    best = min(results, key=lambda result: result['rtt_ms'])
+    service.connect(port, best['baudrate'], mode, best['framing'])
+    print(f"[LinkNegotiation] ✅ {port}: {best['baudrate']} baudios {best['framing']} "
+          f"({best['rtt_ms']:.1f} ms)")
+    if persist:
+        save_link_setting(port, best)
+    return best
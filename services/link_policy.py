@@ -0,0 +1,155 @@
+import threading
+import time
+from services.command_scheduler import PRIORITY_SAFETY, PRIORITY_OPERATOR, PRIORITY_POLL
+
+# Estados del disyuntor
+BREAKER_CLOSED = 'closed'        # Enlace sano: todo pasa
+BREAKER_OPEN = 'open'            # Enlace caído: se falla de inmediato sin tocar el puerto
+BREAKER_HALF_OPEN = 'half_open'  # Se deja pasar una sola solicitud de prueba
+
+# Fallos seguidos que abren el disyuntor y espera (s) antes de probar de nuevo
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_RESET_TIMEOUT = 2.0
+BREAKER_MAX_RESET_TIMEOUT = 30.0
+
+
+class RequestPolicy:
+    """Tiempo de espera y reintentos de una transacción.
+
+    Tras el intento n (empezando en 0) se espera backoff * 2**n, con un
+    máximo de max_backoff, antes de reintentar.
+    """
+
+    __slots__ = ("timeout", "retries", "backoff", "max_backoff")
+
+    def __init__(self, timeout=1.0, retries=0, backoff=0.05, max_backoff=0.5):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt):
+        return min(self.backoff * (2 ** attempt), self.max_backoff)
+
+    def __repr__(self):
+        return (f"RequestPolicy(timeout={self.timeout}, retries={self.retries}, "
+                f"backoff={self.backoff}, max_backoff={self.max_backoff})")
+
+
+# Política por clase de prioridad: un sondeo perdido lo repone el siguiente ciclo,
+# una orden del operador o de seguridad se reintenta.
+DEFAULT_POLICIES = {
+    PRIORITY_SAFETY: RequestPolicy(timeout=0.5, retries=3, backoff=0.02),
+    PRIORITY_OPERATOR: RequestPolicy(timeout=1.0, retries=2, backoff=0.05),
+    PRIORITY_POLL: RequestPolicy(timeout=0.3, retries=0),
+}
+
+
+class TransactionRetry:
+    """Reintentos de un grupo de tramas según su RequestPolicy y el disyuntor.
+
+    No hace E/S: quien la usa envía las tramas pendientes de cada intento y
+    entrega las respuestas con record(). Solo se reintentan las tramas sin
+    respuesta. Mientras el disyuntor está abierto no se intenta nada, salvo
+    las órdenes de seguridad, que siempre salen al bus.
+
+        retry = TransactionRetry(policy, breaker, len(commands))
+        for delay, pending in retry.attempts():
+            time.sleep(delay)
+            if not retry.allowed():
+                break
+            retry.record(transport.transact_many([commands[i] for i in pending]))
+        return retry.responses
+    """
+
+    def __init__(self, policy, breaker, count, safety=False):
+        self.policy = policy
+        self.breaker = breaker
+        self.safety = safety
+        self.responses = [None] * count
+        self.pending = list(range(count))
+
+    def attempts(self):
+        """(espera previa en s, posiciones pendientes) de cada intento que queda."""
+        for attempt in range(self.policy.retries + 1):
+            if not self.pending:
+                return
+            yield (self.policy.delay(attempt - 1) if attempt else 0.0), list(self.pending)
+
+    def allowed(self):
+        return self.safety or self.breaker.allow()
+
+    def record(self, results):
+        """Respuestas del intento en curso (None si el enlace falló por completo)."""
+        if results is None:
+            results = [None] * len(self.pending)
+        if any(results):
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        for i, response in zip(self.pending, results):
+            self.responses[i] = response
+        self.pending = [i for i in self.pending if not self.responses[i]]
+
+
+class CircuitBreaker:
+    """Disyuntor del enlace: tras varios fallos seguidos deja de usar el puerto.
+
+    Mientras está abierto allow() retorna False y las solicitudes fallan al
+    instante. Pasado reset_timeout deja pasar una solicitud de prueba; si
+    falla, la espera hasta la siguiente prueba se duplica (hasta
+    max_reset_timeout).
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout=BREAKER_RESET_TIMEOUT, max_reset_timeout=BREAKER_MAX_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._current_reset = reset_timeout
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True si la solicitud puede usar el enlace."""
+        with self._lock:
+            if self.state == BREAKER_CLOSED:
+                return True
+            if self.state == BREAKER_OPEN and time.monotonic() - self._opened_at >= self._current_reset:
+                self.state = BREAKER_HALF_OPEN
+                print("[CircuitBreaker] 🔎 Probando el enlace")
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != BREAKER_CLOSED:
+                print("[CircuitBreaker] ✅ Enlace recuperado")
+            self.state = BREAKER_CLOSED
+            self.failures = 0
+            self._current_reset = self.reset_timeout
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == BREAKER_HALF_OPEN:
+                self._current_reset = min(self._current_reset * 2, self.max_reset_timeout)
+                self._open()
+            elif self.state == BREAKER_CLOSED and self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self.state = BREAKER_OPEN
+        self._opened_at = time.monotonic()
+        print(f"[CircuitBreaker] ⛔ Enlace caído tras {self.failures} fallos; "
+              f"próxima prueba en {self._current_reset:.1f}s")
+
+    def reset(self):
+        with self._lock:
+            self.state = BREAKER_CLOSED
+            self.failures = 0
+            self._current_reset = self.reset_timeout
@@ -0,0 +1,253 @@
+import asyncio
+import os
+import selectors
+import sys
+import time
+from services.transports import SerialAsciiTransport, SerialRtuTransport, TurnaroundStats, character_time
+from utils.modbus_utils import (
+    expected_response_length, check_response_frame, MAX_ASCII_FRAME_LENGTH, EXCEPTION_RESPONSE_LENGTH
+)
+
+try:
+    import termios
+except ImportError:  # Windows
+    termios = None
+
+# VMIN es un byte en termios
+MAX_VMIN = 255
+# ':' + esclavo + función: a partir de aquí se sabe si es una respuesta de excepción
+FUNCTION_END = 5
+
+
+def low_latency_supported():
+    return sys.platform.startswith('linux') and termios is not None
+
+
+def _enable_low_latency(serial_port, name):
+    # ASYNC_LOW_LATENCY (TIOCSSERIAL); los adaptadores USB que no lo admiten siguen igual
+    try:
+        serial_port.set_low_latency_mode(True)
+        return True
+    except (AttributeError, OSError, ValueError) as ex:
+        print(f"[{name}] ⚠️ ASYNC_LOW_LATENCY no disponible: {ex}")
+        return False
+
+
+class LinuxSerialAsciiTransport(SerialAsciiTransport):
+    """Modbus ASCII sobre Linux con lecturas propias por epoll y VMIN ajustado.
+
+    VMIN se fija a los bytes que faltan de la trama esperada (VTIME=0), así
+    el núcleo despierta al lector una vez por trama y no por cada carácter.
+    Mientras no se sabe si la respuesta es de excepción, VMIN no pasa de la
+    longitud de una excepción.
+    """
+
+    def __init__(self, port, baudrate=9600, timeout=1, framing=None):
+        super().__init__(port, baudrate, timeout, framing)
+        self.low_latency = False
+        self.stats = TurnaroundStats()
+        self._fd = None
+        self._vmin = None
+        self._selector = None
+
+    def open(self):
+        super().open()
+        self.low_latency = _enable_low_latency(self.serial_port, type(self).__name__)
+        self._vmin = None
+        try:
+            self._fd = self.serial_port.fileno()
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(self._fd, selectors.EVENT_READ)
+            termios.tcgetattr(self._fd)
+        except (AttributeError, OSError, ValueError, termios.error) as ex:
+            # Sin descriptor termios (puertos virtuales): lecturas de pyserial
+            print(f"[LinuxSerialAsciiTransport] ⚠️ Lectura por epoll no disponible: {ex}")
+            if self._selector:
+                self._selector.close()
+            self._fd = None
+            self._selector = None
+
+    def close(self):
+        if self._selector:
+            self._selector.close()
+            self._selector = None
+        super().close()
+
+    def _set_timeout(self, timeout):
+        # Con epoll las lecturas no pasan por pyserial: no reconfigurar el puerto
+        if self._selector is None:
+            super()._set_timeout(timeout)
+
+    def _set_vmin(self, vmin):
+        vmin = max(1, min(vmin, MAX_VMIN))
+        if vmin == self._vmin:
+            return
+        attrs = termios.tcgetattr(self._fd)
+        attrs[6][termios.VMIN] = vmin
+        attrs[6][termios.VTIME] = 0
+        termios.tcsetattr(self._fd, termios.TCSANOW, attrs)
+        self._vmin = vmin
+
+    def transact(self, command_bytes, timeout=None):
+        if self._selector is None:
+            return super().transact(command_bytes, timeout)
+        timeout = self.timeout if timeout is None else timeout
+        self.serial_port.reset_input_buffer()
+        self.serial_port.write(command_bytes)
+        # tcdrain: el tiempo de respuesta se mide desde que salió el último carácter
+        self.serial_port.flush()
+        sent_at = time.perf_counter()
+        response, first_byte_at = self._read_frame(command_bytes, sent_at + timeout)
+        if response is None:
+            return None
+        self.stats.add(first_byte_at - sent_at, time.perf_counter() - sent_at)
+        error = check_response_frame(command_bytes, response)
+        if error:
+            print(f"[LinuxSerialAsciiTransport] ❌ Respuesta rechazada ({error}): {response!r}")
+            return None
+        return response
+
+    def _read_frame(self, command_bytes, deadline):
+        """Lee desde ':' hasta CRLF. Retorna (trama, instante del primer byte) o (None, None)."""
+        reader = AsciiFrameReader(command_bytes)
+        first_byte_at = None
+        while True:
+            self._set_vmin(reader.missing())
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not self._selector.select(remaining):
+                print("[LinuxSerialAsciiTransport] ⚠️ Timeout esperando respuesta")
+                return None, None
+            try:
+                chunk = os.read(self._fd, MAX_ASCII_FRAME_LENGTH)
+            except BlockingIOError:
+                continue
+            if not chunk:
+                raise OSError("Serial device disconnected")
+            if first_byte_at is None:
+                first_byte_at = time.perf_counter()
+            try:
+                frame = reader.feed(chunk)
+            except ValueError as ex:
+                print(f"[LinuxSerialAsciiTransport] ❌ {ex}")
+                return None, None
+            if frame is not None:
+                return frame, first_byte_at
+
+    @property
+    def pollable(self):
+        """True si transact_async puede vigilar el descriptor desde un loop de asyncio."""
+        return self._selector is not None
+
+    async def transact_async(self, command_bytes, timeout=None):
+        """transact sin bloquear el loop: el descriptor se vigila con loop.add_reader.
+
+        Requiere pollable. VMIN se ajusta igual que en transact, así el loop
+        despierta una vez por trama. El envío no espera a tcdrain: el fin de
+        la transmisión se estima con el tiempo de cada carácter.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        reader = AsciiFrameReader(command_bytes)
+        done = loop.create_future()
+        first_byte = []
+
+        def on_readable():
+            if done.done():
+                return
+            try:
+                chunk = os.read(self._fd, MAX_ASCII_FRAME_LENGTH)
+            except BlockingIOError:
+                return
+            except OSError as ex:
+                done.set_exception(ex)
+                return
+            if not chunk:
+                done.set_exception(OSError("Serial device disconnected"))
+                return
+            if not first_byte:
+                first_byte.append(time.perf_counter())
+            try:
+                frame = reader.feed(chunk)
+            except ValueError as ex:
+                print(f"[LinuxSerialAsciiTransport] ❌ {ex}")
+                done.set_result(None)
+                return
+            if frame is not None:
+                done.set_result(frame)
+            else:
+                self._set_vmin(reader.missing())
+
+        self.serial_port.reset_input_buffer()
+        self._set_vmin(reader.missing())
+        self.serial_port.write(command_bytes)
+        sent_at = time.perf_counter() + len(command_bytes) * character_time(self.baudrate, self.framing)
+        loop.add_reader(self._fd, on_readable)
+        try:
+            response = await asyncio.wait_for(done, timeout)
+        except asyncio.TimeoutError:
+            print("[LinuxSerialAsciiTransport] ⚠️ Timeout esperando respuesta")
+            return None
+        finally:
+            loop.remove_reader(self._fd)
+        if response is None:
+            return None
+        self.stats.add(max(0.0, first_byte[0] - sent_at), time.perf_counter() - sent_at)
+        error = check_response_frame(command_bytes, response)
+        if error:
+            print(f"[LinuxSerialAsciiTransport] ❌ Respuesta rechazada ({error}): {response!r}")
+            return None
+        return response
+
+
+class AsciiFrameReader:
+    """Arma una respuesta ASCII a partir de los bytes que van llegando, sin E/S.
+
+    Descarta lo previo a ':' y termina en CRLF. missing() dice cuántos bytes
+    faltan como mínimo (para VMIN): mientras no se sabe si la respuesta es de
+    excepción, no más que la longitud de una excepción.
+    """
+
+    def __init__(self, command_bytes):
+        self.expected = expected_response_length(command_bytes) or MAX_ASCII_FRAME_LENGTH
+        self.buffer = bytearray()
+
+    def missing(self):
+        buffer = self.buffer
+        if len(buffer) >= FUNCTION_END:
+            try:
+                is_exception = int(buffer[3:5], 16) & 0x80
+            except ValueError:
+                is_exception = False
+            target = EXCEPTION_RESPONSE_LENGTH if is_exception else self.expected
+        else:
+            target = min(self.expected, EXCEPTION_RESPONSE_LENGTH)
+        return target - len(buffer)
+
+    def feed(self, chunk):
+        """Agrega bytes recibidos. Retorna la trama completa o None si aún falta.
+
+        Lanza ValueError si la trama supera el largo máximo sin CRLF.
+        """
+        buffer = self.buffer
+        if not buffer:
+            start = chunk.find(b':')
+            if start < 0:
+                return None
+            if start > 0:
+                print(f"[LinuxSerialAsciiTransport] ⚠️ Descartados {start} bytes sueltos: {bytes(chunk[:start])!r}")
+            chunk = chunk[start:]
+        buffer += chunk
+        end = buffer.find(b'\r\n')
+        if end >= 0:
+            return bytes(buffer[:end + 2])
+        if len(buffer) >= MAX_ASCII_FRAME_LENGTH:
+            raise ValueError("Trama sin CRLF")
+        return None
+
+
+class LinuxSerialRtuTransport(SerialRtuTransport):
+    """Modbus RTU con ASYNC_LOW_LATENCY; el fin de trama lo sigue marcando pyserial."""
+
+    def open(self):
+        super().open()
+        self.low_latency = _enable_low_latency(self.serial_port, type(self).__name__)
@@ -0,0 +1,103 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from services.modbus_service import ModbusService
+from services.transports import MODE_ASCII
+from services.command_scheduler import PRIORITY_OPERATOR, PRIORITY_POLL
+
+
+class SlaveHandle:
+    """Acceso a un PLC concreto: servicio del puerto + id de esclavo."""
+
+    def __init__(self, service, slave):
+        self.service = service
+        self.slave = slave
+
+    @property
+    def connected(self):
+        return self.service.connected
+
+    def send_command(self, command, priority=PRIORITY_OPERATOR, deadline=None):
+        return self.service.send_command(command, priority=priority, deadline=deadline)
+
+    def read_points(self, points, priority=PRIORITY_OPERATOR, max_age_ms=None):
+        return self.service.read_points(points, priority=priority, slave=self.slave, max_age_ms=max_age_ms)
+
+    def read_coils(self, index, quantity, max_age_ms=None, priority=PRIORITY_OPERATOR):
+        return self.service.read_coils(index, quantity, max_age_ms=max_age_ms, priority=priority, slave=self.slave)
+
+    def send_coil_pulse(self, bit):
+        return self.service.send_coil_pulse(bit, slave=self.slave)
+
+    def start_read_loop(self, update_ui_callback):
+        self.service.start_read_loop(self.slave, update_ui_callback)
+
+    def stop_read_loop(self):
+        self.service.stop_read_loop(self.slave)
+
+
+class ModbusServicePool:
+    """Registro de servicios Modbus por puerto físico y esclavo.
+
+    Cada puerto tiene su propio ModbusService (cola y worker), de modo que
+    los bancos conectados a puertos distintos se atienden en paralelo. Un
+    puerto que ya usa la instancia por defecto (ModbusService(), la de las
+    vistas) se atiende con esa misma instancia: dos servicios no pueden
+    abrir el mismo puerto. El pool no cierra la instancia por defecto.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ports = {}
+
+    def service(self, port, baudrate=None, mode=MODE_ASCII):
+        """Retorna el servicio del puerto, conectándolo si hace falta."""
+        with self._lock:
+            service = self._ports.get(port)
+            if service is None:
+                default = ModbusService()
+                service = default if default.port == port else ModbusService(port)
+                self._ports[port] = service
+        if not service.connected:
+            service.connect(port, baudrate, mode)
+        return service
+
+    def slave(self, port, slave, baudrate=None, mode=MODE_ASCII):
+        return SlaveHandle(self.service(port, baudrate, mode), slave)
+
+    def slaves(self):
+        """Esclavos con lazo de lectura activo: [(puerto, esclavo)]."""
+        with self._lock:
+            ports = list(self._ports.items())
+        return [(port, slave) for port, service in ports for slave in service.polled_slaves()]
+
+    def read_points_all(self, targets, points, priority=PRIORITY_POLL, max_age_ms=None):
+        """Lee los mismos puntos en varios (puerto, esclavo) a la vez.
+
+        Retorna {(puerto, esclavo): {nombre: valor}}. Las lecturas de un mismo
+        puerto se serializan en su worker; las de puertos distintos corren en paralelo.
+        """
+        targets = list(targets)
+        if not targets:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            futures = {
+                (port, slave): executor.submit(
+                    self.slave(port, slave).read_points, points, priority, max_age_ms)
+                for port, slave in targets
+            }
+        return {key: future.result() for key, future in futures.items()}
+
+    def broadcast(self, port, command, priority=PRIORITY_OPERATOR):
+        """Escritura broadcast (esclavo 0) para configurar todos los PLC de un puerto."""
+        return self.service(port).broadcast_command(command, priority=priority)
+
+    def close_all(self):
+        with self._lock:
+            services = list(self._ports.values())
+            self._ports.clear()
+        default = ModbusService()
+        for service in services:
+            if service is default:
+                continue
+            service.stop_read_loop()
+            service.close()
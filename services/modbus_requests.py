@@ -0,0 +1,131 @@
+"""Armado de lecturas y escrituras del mapa de sondeo, sin E/S.
+
+ModbusService (cola y worker) y AsyncModbusClient (asyncio) usan las mismas
+tramas, la misma imagen de registros y la misma interpretación de las
+respuestas; solo cambia cómo envían las tramas al transporte. source es el
+prefijo de los mensajes de registro de quien llama.
+"""
+from utils.address_utils import resolve_address
+from utils.modbus_utils import build_modbus_ascii_command, parse_modbus_ascii_response, response_data
+from utils.poll_map import plan_reads, compile_reads, decode_block, encode_point
+
+# Antigüedad máxima de la imagen para reescribir los huecos entre consignas
+SETPOINT_GAP_MAX_AGE_MS = 1000
+
+
+def words_to_bytes(words):
+    return b''.join(word.to_bytes(2, 'big') for word in words)
+
+
+def coil_bits(data, quantity):
+    """Bits de una respuesta función 1 (el primero es el bit menos significativo)."""
+    return [(data[i // 8] >> (i % 8)) & 0x01 for i in range(min(quantity, 8 * len(data)))]
+
+
+def read_data(response, source):
+    """Bytes de datos de una respuesta de lectura, o None si falta o es inválida."""
+    if not response:
+        return None
+    try:
+        return response_data(response)
+    except ValueError as ex:
+        print(f"[{source}] ❌ Lectura rechazada: {ex}")
+        return None
+
+
+def write_acknowledged(response):
+    return bool(response) and parse_modbus_ascii_response(response).get('type') == 'write'
+
+
+def read_plan(points):
+    """Bloques función 3 de los puntos; las listas de nombres (las del sondeo)
+    reutilizan sus planes compilados."""
+    if all(isinstance(point, str) for point in points):
+        return compile_reads(tuple(points))
+    return plan_reads(points)
+
+
+def cached_reads(image, frames, slave, blocks, max_age_ms):
+    """Separa los bloques que la imagen tiene recientes de los que hay que leer.
+
+    Retorna (raws, missing): raws con los bytes de cada bloque tomado de la
+    imagen (None en el resto) y missing = [(posición, trama función 3)].
+    """
+    raws = [None] * len(blocks)
+    missing = []
+    for i, block in enumerate(blocks):
+        address = resolve_address(block['device'], block['start'])
+        if max_age_ms is not None:
+            words = image.get_registers(slave, address, block['quantity'], max_age_ms)
+            if words is not None:
+                raws[i] = words_to_bytes(words)
+                continue
+        missing.append((i, frames.get(slave, 3, address, block['quantity'])))
+    return raws, missing
+
+
+def fill_reads(raws, missing, responses, source):
+    """Completa raws con las respuestas de las tramas de missing."""
+    for (i, _), response in zip(missing, responses):
+        raws[i] = read_data(response, source)
+    return raws
+
+
+def decode_blocks(blocks, raws, source):
+    """{nombre: valor} de los bloques leídos; los que fallan se omiten."""
+    values = {}
+    for block, raw in zip(blocks, raws):
+        if raw is None:
+            continue
+        try:
+            values.update(decode_block(block, raw))
+        except ValueError as ex:
+            print(f"[{source}] ❌ Bloque {block['device']}{block['start']} inválido: {ex}")
+    return values
+
+
+def stale_gaps(image, slave, blocks, addresses):
+    """Puntos uint16 de los huecos entre consignas que la imagen no tiene recientes."""
+    stale = []
+    for block, address in zip(blocks, addresses):
+        for offset, word in enumerate(block['words']):
+            if word is None and image.get_registers(
+                    slave, address + offset, 1, SETPOINT_GAP_MAX_AGE_MS) is None:
+                stale.append({'name': f"D{block['start'] + offset}", 'device': block['device'],
+                              'index': block['start'] + offset, 'type': 'uint16'})
+    return stale
+
+
+def block_data(image, slave, block, address, source):
+    """Bytes a escribir del bloque con los huecos tomados de la imagen, o None si falta alguno."""
+    data = []
+    for offset, word in enumerate(block['words']):
+        if word is None:
+            current = image.get_registers(slave, address + offset, 1, SETPOINT_GAP_MAX_AGE_MS)
+            if current is None:
+                print(f"[{source}] ❌ No se pudo leer el hueco de D{block['start']}; bloque no escrito")
+                return None
+            word = current[0]
+        data += [(word >> 8) & 0xFF, word & 0xFF]
+    return data
+
+
+def write_frame(slave, address, data):
+    """Trama función 16 con los bytes de data desde address."""
+    return build_modbus_ascii_command(
+        slave, 16, (address >> 8) & 0xFF, address & 0xFF,
+        quantity=len(data) // 2, custom_bytes=data
+    )
+
+
+def setpoint_results(blocks, values, written, read_values, source):
+    """{nombre: True/False}: escrita y leída de vuelta con el mismo valor codificado."""
+    results = {}
+    for block in blocks:
+        for point in block['points']:
+            name = point['name']
+            ok = (name in written and name in read_values
+                  and encode_point(point, read_values[name]) == encode_point(point, values[name]))
+            results[name] = ok
+            print(f"[{source}] {'✅' if ok else '❌'} Consigna {name} = {values[name]}")
+    return results
@@ -1,44 +1,174 @@
-import serial
-import serial.tools.list_ports
 import threading
 import time
 import queue
-from utils.modbus_utils import build_modbus_ascii_command, parse_modbus_ascii_response
-from utils.address_utils import get_address
+from services.register_image import RegisterImage
+from services.serial_service import list_serial_ports, saved_link_setting
+from services.frame_cache import FrameCache
+from services.link_policy import CircuitBreaker, TransactionRetry, DEFAULT_POLICIES
+from services.modbus_requests import (
+    words_to_bytes, coil_bits, read_data, read_plan, cached_reads, fill_reads, decode_blocks,
+    stale_gaps, block_data, write_frame, setpoint_results
+)
+from services.poll_scheduler import PollTimer, RefreshSchedule, select_poll_period
+from services.command_scheduler import (
+    CommandScheduler, PRIORITY_SAFETY, PRIORITY_OPERATOR, PRIORITY_POLL
+)
+from services.transports import create_transport, MODE_ASCII, SERIAL_MODES
+from utils.modbus_utils import build_modbus_ascii_command, parse_modbus_ascii_response, unpack_floats
+from utils.address_utils import resolve_address, address_bytes
+from utils.poll_map import plan_reads, plan_writes, MAX_READ_REGISTERS
 
 BYTE_ORDER_FLOAT = 'little_word'
 
+# Bobinas de seguridad: Parada de Emergencia (M262) y Reiniciar (M263)
+SAFETY_COILS = (262, 263)
+
+# Antigüedad máxima aceptada para los estados FC0-FC25 (M277-M302)
+STATUS_MAX_AGE_MS = 1000
+
+# Espera tras una escritura broadcast (esclavo 0), que no tiene respuesta
+BROADCAST_TURNAROUND = 0.1
+
+# Cada cuántos segundos el lazo de lectura registra los tiempos de respuesta del PLC
+TURNAROUND_REPORT_INTERVAL = 60.0
+
+# Bobinas de los botones momentáneos (ver send_boolean)
+BUTTON_COILS = {
+    "Caudal Q1": "M264",
+    "Caudal Q2": "M265",
+    "Caudal Q3": "M266",
+    "Caudal Q4": "M267",
+    "Hidrostática": "M268",
+    "Iniciar Prueba": "M269",
+    "Modo Automático": "M271",
+    "Finalizar Prueba": "M270",
+    "Reiniciar": "M263",
+}
+
+# Mensajes de los estados FC0-FC25 (M277-M302)
+FC_MESSAGES = {
+    0: "✅ Activación de FC0 para selección del modo de trabajo",
+    1: "📝 Introducción de valores de ratio, Q3 y selección de la prueba",
+    2: "🔧 Inicio de purga de la línea Q1",
+    3: "⚙️ Inicio de calibración Q1",
+    4: "✅ Fin de calibración Q1",
+    5: "🧪 Inicio de prueba Q1",
+    6: "✅ Fin de prueba Q1",
+    7: "🔧 Inicio de purga de la línea Q2",
+    8: "⚙️ Inicio de calibración Q2",
+    9: "✅ Fin de calibración Q2",
+    10: "🧪 Inicio de prueba Q2",
+    11: "✅ Fin de prueba Q2",
+    12: "⚙️ Inicio de calibración Q3",
+    13: "✅ Fin de calibración Q3",
+    14: "🧪 Inicio de prueba Q3",
+    15: "✅ Fin de prueba Q3",
+    16: "⚙️ Inicio de calibración Q4",
+    17: "✅ Fin de calibración Q4",
+    18: "🧪 Inicio de prueba Q4",
+    19: "✅ Fin de prueba Q4",
+    20: "💧 Inicio prueba hidrostática",
+    21: "🔚 Fin de prueba, cierre de válvula de entrada de forma manual",
+    22: "⚡ Apagado del variador, inicia la prueba",
+    23: "⏳ Estado de espera, vuelta a inicio de la selección de la prueba",
+    24: "🔧 Inicio modo mantenimiento en modo manual",
+    25: "✅ Fin modo mantenimiento en modo manual",
+}
+
+
+def active_fc_messages(bits):
+    """Mensajes de los estados FC activos en los bits M277-M302."""
+    return [FC_MESSAGES[i] for i, bit in enumerate(bits[:len(FC_MESSAGES)]) if bit]
+
+
+def link_parameters(port, mode, baudrate=None, framing=None):
+    """(baudrate, framing) para conectar: sin baudrate, en los modos serie se usa
+    la configuración negociada y guardada del puerto (ver services.link_negotiation)
+    o, si no hay, 9600 baudios.
+    """
+    if baudrate is None and mode in SERIAL_MODES:
+        setting = saved_link_setting(port, mode)
+        baudrate = setting['baudrate'] if setting else 9600
+        framing = framing or (setting.get('framing') if setting else None)
+    return baudrate, framing
+
+
+class SafetyCommandError(ConnectionError):
+    """Una orden de seguridad (M262/M263) no llegó al PLC."""
+
+
 class ModbusService:
-    _instance = None
+    """Servicio Modbus con su propia cola y worker.
+
+    ModbusService() retorna la instancia por defecto (la que usan las vistas);
+    ModbusService(key) retorna una instancia independiente por puerto físico.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
 
-    def __new__(cls, *args, **kwargs):
-        if cls._instance is None:
-            cls._instance = super(ModbusService, cls).__new__(cls)
-            cls._instance._initialized = False
-        return cls._instance
+    def __new__(cls, key=None, *args, **kwargs):
+        with cls._instances_lock:
+            if key not in cls._instances:
+                instance = super(ModbusService, cls).__new__(cls)
+                instance._initialized = False
+                cls._instances[key] = instance
+            return cls._instances[key]
 
-    def __init__(self):
+    def __init__(self, key=None):
         if self._initialized:
             return
-        self.serial_port = None
+        self.key = key
+        self.transport = None
         self.connected = False
-        self.slave = 1
-        self._reading = False
-        self._read_thread = None
+        # Tramas fijas (sondeo, estado, pulsadores) ya armadas
+        self.frames = FrameCache()
+        self._slave = 1
+        self.mode = MODE_ASCII
+        # Últimos parámetros de conexión (para reconectar). Se fijan al conectar:
+        # mientras son None, connect usa la configuración guardada del puerto
+        self.port = None
+        self.baudrate = None
+        self.framing = None
+        # El operador cerró el puerto (close): el vigilante no lo reabre hasta un connect
+        self.operator_closed = False
+        self._connect_error = None
+        # Activar si el PLC soporta la función 23 (lectura/escritura en una trama)
+        self.supports_fc23 = False
+        # Lazos de lectura activos por esclavo: {slave: (thread, stop_event, PollTimer)}
+        self._read_loops = {}
         self._lock = threading.Lock()
+        # Imagen de registros D y bobinas M vistos en el bus
+        self.image = RegisterImage()
+        # Disyuntor del enlace y política (timeout/reintentos) del comando en curso
+        self.breaker = CircuitBreaker()
+        self._policy = None
+        self._priority = None
         self._initialized = True
 
-        # Cola FIFO y worker thread para comandos
-        self.command_queue = queue.Queue()
+        # Cola por prioridades y worker thread para comandos
+        self.scheduler = CommandScheduler()
         self.worker_thread = threading.Thread(target=self._process_queue, daemon=True)
         self.worker_thread.start()
 
+    @property
+    def slave(self):
+        return self._slave
+
+    @slave.setter
+    def slave(self, slave):
+        if slave != self._slave:
+            self.frames.clear()
+        self._slave = slave
+
     def _process_queue(self):
         while True:
-            func, args, kwargs, result_queue = self.command_queue.get()
+            command = self.scheduler.get()
+            func, result_queue = command.func, command.result_queue
+            self._policy = command.policy or DEFAULT_POLICIES.get(command.priority)
+            self._priority = command.priority
             print(f"[ModbusService] Ejecutando comando en la cola: {func.__name__}")
             try:
-                result = func(*args, **kwargs)
+                result = func(*command.args, **command.kwargs)
                 if result_queue:
                     result_queue.put(result)
             except Exception as ex:
@@ -46,55 +176,140 @@ class ModbusService:
                 if result_queue:
                     result_queue.put(None)
             print(f"[ModbusService] Comando finalizado: {func.__name__}")
-            self.command_queue.task_done()
+            self.scheduler.task_done()
+
+    def enqueue_command(self, func, *args, wait_result=False,
+                        priority=PRIORITY_OPERATOR, deadline=None, policy=None, **kwargs):
+        """Agrega un comando a la cola. Si wait_result=True, espera y retorna el resultado.
 
-    def enqueue_command(self, func, *args, wait_result=False, **kwargs):
-        """Agrega un comando a la cola. Si wait_result=True, espera y retorna el resultado."""
+        priority define la clase de servicio y deadline (s) el tiempo máximo que
+        puede esperar en la cola antes de descartarse. policy (RequestPolicy)
+        fija timeout y reintentos de sus transacciones; por defecto la de su
+        prioridad (DEFAULT_POLICIES).
+        """
         result_queue = queue.Queue() if wait_result else None
-        self.command_queue.put((func, args, kwargs, result_queue))
+        self.scheduler.submit(func, args, kwargs, result_queue,
+                              priority=priority, deadline=deadline, policy=policy)
         if wait_result:
             return result_queue.get()
         return None
 
     def detect_port(self):
-        ports = list(serial.tools.list_ports.comports())
+        # Los adaptadores USB-serie primero (ver services.serial_service)
+        ports = list_serial_ports()
         return ports[0].device if ports else None
 
-    def connect(self, port, baudrate=9600):
+    def connect(self, port, baudrate=None, mode=MODE_ASCII, framing=None):
+        """Abre el transporte: puerto serie (ascii/rtu), 'host[:puerto]' (tcp)
+        o un simulador en proceso (loopback).
+
+        Sin baudrate se usa la configuración negociada y guardada para el
+        puerto (ver services.link_negotiation) o, si no hay, 9600 baudios.
+        En loopback, sin baudrate no se modela el tiempo del cable.
+        """
+        baudrate, framing = link_parameters(port, mode, baudrate, framing)
+        transport = create_transport(mode, port, baudrate, framing=framing)
         try:
-            if self.serial_port and self.serial_port.is_open:
-                self.serial_port.close()
-            self.serial_port = serial.Serial(
-                port=port,
-                baudrate=baudrate,
-                bytesize=serial.SEVENBITS,
-                parity=serial.PARITY_EVEN,
-                stopbits=serial.STOPBITS_ONE,
-                timeout=1
-            )
+            self.drop_link()
+            transport.open()
+            self.transport = transport
+            self.breaker.reset()
+            if mode != self.mode:
+                self.frames.clear()
+            self.mode = mode
+            self.port = port
+            self.baudrate = baudrate
+            self.framing = framing
             self.connected = True
+            self.operator_closed = False
+            self._connect_error = None
             return True
-        except Exception:
+        except Exception as ex:
+            # Un mismo fallo repetido (reintentos del vigilante) se registra una vez
+            error = (port, mode, str(ex))
+            if error != self._connect_error:
+                self._connect_error = error
+                print(f"[ModbusService] ❌ No se pudo conectar a {port} ({mode}): {ex}")
             self.connected = False
             return False
 
+    def reconnect(self, port=None):
+        """Reabre el enlace con la misma velocidad, trama y modo (el adaptador puede cambiar de nombre).
+
+        Esclavo, caché de tramas y lazos de lectura se conservan: los lazos
+        retoman el sondeo en cuanto el enlace vuelve. Si aún no hubo conexión
+        se usa la configuración guardada del puerto.
+        """
+        return self.connect(port or self.port, self.baudrate, self.mode, self.framing)
+
     def close(self):
-        if self.serial_port and self.serial_port.is_open:
-            self.serial_port.close()
-            self.connected = False
+        """Cierra el puerto por pedido del operador: no se reabre solo (ver services.port_watcher)."""
+        self.operator_closed = True
+        self.drop_link()
+
+    def drop_link(self):
+        """Cierra el transporte sin marcarlo como cerrado por el operador (p. ej. el adaptador desapareció)."""
+        if self.transport and self.transport.is_open:
+            try:
+                self.transport.close()
+            except Exception as ex:
+                print(f"[ModbusService] ⚠️ Error cerrando el puerto: {ex}")
+        self.connected = False
 
     # --- Métodos Modbus adaptados para usar la cola ---
 
-    def send_command(self, command):
+    def send_command(self, command, priority=PRIORITY_OPERATOR, deadline=None, policy=None):
         """Encola el comando y espera la respuesta."""
-        return self.enqueue_command(self._send_command_internal, command, wait_result=True)
+        return self.enqueue_command(
+            self._send_command_internal, command,
+            wait_result=True, priority=priority, deadline=deadline, policy=policy
+        )
+
+    def broadcast_command(self, command, priority=PRIORITY_OPERATOR):
+        """Envía una escritura al esclavo 0 (todos los PLC del puerto); no hay respuesta."""
+        return self.enqueue_command(
+            self._broadcast_internal, command, wait_result=True, priority=priority)
+
+    def _broadcast_internal(self, command):
+        if not self.connected or not self.transport:
+            return False
+        command_bytes = command.encode('ascii') if isinstance(command, str) else command
+        if command_bytes[1:3] != b'00':
+            raise ValueError("Broadcast commands must target slave 0")
+        try:
+            with self._lock:
+                print(f"[ModbusService] Broadcast: {command_bytes.strip()!r}")
+                self.transport.broadcast(command_bytes)
+                time.sleep(BROADCAST_TURNAROUND)
+                return True
+        except Exception as e:
+            print(f"❌ Error sending broadcast: {str(e)}")
+            return False
+
+    def send_coil_pulse(self, bit, slave=None):
+        """Envía ON y luego OFF a la bobina M indicada (pulsador momentáneo).
+
+        Retorna las dos respuestas (None si no hubo). Si el ON de una bobina
+        de seguridad no llega al PLC se lanza SafetyCommandError.
+        """
+        address = resolve_address('M', bit)
+        slave = self.slave if slave is None else slave
+        safety = bit in SAFETY_COILS
+        priority = PRIORITY_SAFETY if safety else PRIORITY_OPERATOR
+        responses = []
+        for value in (1, 0):
+            command = self.frames.get(slave, 5, address, value=value)
+            responses.append(self.send_command(command, priority=priority))
+        if safety and not responses[0]:
+            print(f"[ModbusService] ❌ Orden de seguridad M{bit} sin respuesta del PLC")
+            raise SafetyCommandError(f"M{bit} was not acknowledged by slave {slave}")
+        return responses
 
     def _send_command_internal(self, command):
-        if not self.connected or not self.serial_port:
+        if not self.connected or not self.transport:
             return None
         try:
             with self._lock:
-                self.serial_port.reset_input_buffer()
                 if isinstance(command, str):
                     print(f"[ModbusService] Sending command: {command.strip()}")
                     command_bytes = command.encode('ascii')
@@ -104,110 +319,323 @@ class ModbusService:
                         print(f"[ModbusService] Sending command: {command_bytes.decode('ascii').strip()}")
                     except Exception:
                         print(f"[ModbusService] Sending command (bytes): {command_bytes}")
-                self.serial_port.write(command_bytes)
-                time.sleep(0.01)
-                response = self.serial_port.read(100)
+                response = self._transact_many([command_bytes])[0]
+                self._record(command_bytes, response)
                 return response
         except Exception as e:
             print(f"❌ Error sending command: {str(e)}")
             return
 
+    def _send_commands_internal(self, commands):
+        """Envía varias tramas; en Modbus TCP viajan en paralelo."""
+        if not self.connected or not self.transport:
+            return [None] * len(commands)
+        try:
+            with self._lock:
+                command_list = [c.encode('ascii') if isinstance(c, str) else c for c in commands]
+                responses = self._transact_many(command_list)
+                for command_bytes, response in zip(command_list, responses):
+                    self._record(command_bytes, response)
+                return responses
+        except Exception as e:
+            print(f"❌ Error sending commands: {str(e)}")
+            return [None] * len(commands)
+
+    def _transact_many(self, commands):
+        """Transacciones con la política del comando en curso y el disyuntor.
+
+        Solo se reintentan las tramas sin respuesta. Mientras el disyuntor
+        está abierto se retorna None sin tocar el puerto, así una cola llena
+        no espera un timeout por cada comando. Las órdenes de seguridad no
+        esperan al disyuntor: siempre salen al bus y, si responden, lo cierran.
+        """
+        policy = self._policy or DEFAULT_POLICIES[PRIORITY_OPERATOR]
+        retry = TransactionRetry(policy, self.breaker, len(commands), self._priority == PRIORITY_SAFETY)
+        for delay, pending in retry.attempts():
+            if delay:
+                time.sleep(delay)
+            if not retry.allowed():
+                break
+            try:
+                results = self.transport.transact_many([commands[i] for i in pending], policy.timeout)
+            except Exception as ex:
+                print(f"[ModbusService] ❌ Error en el enlace: {ex}")
+                results = None
+            retry.record(results)
+        return retry.responses
+
+    def _record(self, command_bytes, response):
+        if not response:
+            return
+        try:
+            self.image.record(command_bytes, response)
+        except Exception as ex:
+            print(f"[ModbusService] ⚠️ No se pudo actualizar la imagen: {ex}")
+
     def start_read_loop(self, slave, update_ui_callback):
-        if self._read_thread and self._read_thread.is_alive():
+        loop = self._read_loops.get(slave)
+        if loop and loop[0].is_alive():
             return
-        self._reading = True
-        self.slave = slave
-        self._read_thread = threading.Thread(
+        if not self._read_loops:
+            self.slave = slave
+        stop_event = threading.Event()
+        timer = PollTimer()
+        thread = threading.Thread(
             target=self._read_loop,
-            args=(update_ui_callback,)
+            args=(slave, update_ui_callback, stop_event, timer)
         )
-        self._read_thread.daemon = True
-        self._read_thread.start()
+        thread.daemon = True
+        self._read_loops[slave] = (thread, stop_event, timer)
+        thread.start()
+
+    def stop_read_loop(self, slave=None):
+        """Detiene el lazo de lectura del esclavo indicado (o todos)."""
+        slaves = list(self._read_loops) if slave is None else [slave]
+        for key in slaves:
+            loop = self._read_loops.pop(key, None)
+            if loop:
+                loop[1].set()
+
+    def polled_slaves(self):
+        """Esclavos con lazo de lectura activo."""
+        return [slave for slave, loop in list(self._read_loops.items()) if loop[0].is_alive()]
+
+    def get_poll_timer(self, slave=None):
+        loop = self._read_loops.get(self.slave if slave is None else slave)
+        return loop[2] if loop else None
 
-    def stop_read_loop(self):
-        self._reading = False
+    def turnaround_stats(self):
+        """Tiempos de respuesta recientes del enlace (ver TurnaroundStats.summary).
 
-    def _read_loop(self, update_ui_callback):
-        while self._reading:
+        Retorna None si el transporte no los mide (Modbus TCP, serie sin el backend Linux).
+        """
+        stats = getattr(self.transport, 'stats', None)
+        return stats.summary() if stats is not None else None
+
+    def _report_turnaround(self, slave):
+        stats = getattr(self.transport, 'stats', None)
+        line = stats.describe() if stats is not None else None
+        if line:
+            print(f"[ModbusService] ⏱️ Esclavo {slave}: {line}")
+
+    def _read_loop(self, slave, update_ui_callback, stop_event, timer):
+        schedule = RefreshSchedule()
+        next_report = time.monotonic() + TURNAROUND_REPORT_INTERVAL
+        while not stop_event.is_set():
             try:
-                # Read flow (caudal) values
-                flow_info = get_address('D', 136)
-                flow_cmd = build_modbus_ascii_command(
-                    self.slave, 3,
-                    int(flow_info['high_byte'], 16), int(flow_info['low_byte'], 16),
-                    quantity=6
-                )
-                flow_response = self.enqueue_command(self._send_command_internal, flow_cmd, wait_result=True)
-                flow_data = []
-                if flow_response:
-                    parsed = parse_modbus_ascii_response(flow_response, float_byte_order=BYTE_ORDER_FLOAT)
-                    flow_data = parsed.get('data', [])
-    
-                # Read volume values
-                volume_info = get_address('D', 150)
-                volume_cmd = build_modbus_ascii_command(
-                    self.slave, 3,
-                    int(volume_info['high_byte'], 16), int(volume_info['low_byte'], 16),
-                    quantity=8
-                )
-                volume_response = self.enqueue_command(self._send_command_internal, volume_cmd, wait_result=True)
-                volume_data = []
-                if volume_response:
-                    parsed = parse_modbus_ascii_response(volume_response, float_byte_order=BYTE_ORDER_FLOAT)
-                    volume_data = parsed.get('data', [])
-    
-                instant_data = flow_data + volume_data
-                if len(instant_data) < 6:
-                    instant_data += [0] * (6 - len(instant_data))
-    
-                update_ui_callback("instant", {"data": instant_data})
-    
-                time.sleep(0.5)
+                # El periodo depende del estado FC: rápido en prueba, lento en espera
+                fc_bits = self.read_coils(277, 26, max_age_ms=STATUS_MAX_AGE_MS,
+                                          priority=PRIORITY_POLL, slave=slave)
+                timer.set_period(select_poll_period(fc_bits))
+
+                # Los grupos del mapa de sondeo que vencen en este ciclo, coalescidos
+                values = self.read_points(schedule.due(), priority=PRIORITY_POLL, slave=slave)
+
+                # Solo refrescar la UI si algún valor cambió
+                instant_data = schedule.update(values)
+                if instant_data is not None:
+                    update_ui_callback("instant", {"data": instant_data})
             except Exception as ex:
                 update_ui_callback("log", {"log": f"Error in Modbus read: {ex}"})
+            if time.monotonic() >= next_report:
+                self._report_turnaround(slave)
+                next_report = time.monotonic() + TURNAROUND_REPORT_INTERVAL
+            if not timer.wait(stop_event):
+                break
+
+
+    def read_registers(self, index, quantity, max_age_ms=None, priority=PRIORITY_OPERATOR, slave=None):
+        """Lee registros D. Retorna los bytes crudos (big endian por palabra) o None.
+
+        Con max_age_ms se usa la imagen en memoria si todos los valores son
+        suficientemente recientes; si no, se lee del bus.
+        """
+        slave = self.slave if slave is None else slave
+        address = resolve_address('D', index)
+        if max_age_ms is not None:
+            words = self.image.get_registers(slave, address, quantity, max_age_ms)
+            if words is not None:
+                return words_to_bytes(words)
+        return self.enqueue_command(
+            self._read_internal, 3, slave, address, quantity, max_age_ms,
+            wait_result=True, priority=priority
+        )
+
+    def read_coils(self, index, quantity, max_age_ms=None, priority=PRIORITY_OPERATOR, slave=None):
+        """Lee bobinas M. Retorna la lista de bits o None (ver read_registers)."""
+        slave = self.slave if slave is None else slave
+        address = resolve_address('M', index)
+        if max_age_ms is not None:
+            bits = self.image.get_coils(slave, address, quantity, max_age_ms)
+            if bits is not None:
+                return bits
+        return self.enqueue_command(
+            self._read_internal, 1, slave, address, quantity, max_age_ms,
+            wait_result=True, priority=priority
+        )
 
+    def _read_internal(self, function_code, slave, address, quantity, max_age_ms):
+        # Otra lectura encolada antes pudo haber refrescado la imagen mientras esperábamos
+        if max_age_ms is not None:
+            if function_code == 3:
+                words = self.image.get_registers(slave, address, quantity, max_age_ms)
+                if words is not None:
+                    return words_to_bytes(words)
+            else:
+                bits = self.image.get_coils(slave, address, quantity, max_age_ms)
+                if bits is not None:
+                    return bits
+        cmd = self.frames.get(slave, function_code, address, quantity)
+        data = read_data(self._send_command_internal(cmd), "ModbusService")
+        if data is None or function_code == 3:
+            return data
+        return coil_bits(data, quantity)
+
+    def read_floats(self, index, count, byte_order=BYTE_ORDER_FLOAT, priority=PRIORITY_OPERATOR,
+                    slave=None, max_age_ms=None):
+        """Lee count float32 consecutivos desde D<index> (históricos, tendencias).
+
+        Se leen en bloques de hasta MAX_READ_REGISTERS registros y se
+        decodifican todos en una sola llamada. Retorna la lista o None.
+        """
+        slave = self.slave if slave is None else slave
+        step = MAX_READ_REGISTERS - MAX_READ_REGISTERS % 2
+        blocks = [
+            {'device': 'D', 'start': index + offset,
+             'quantity': min(step, 2 * count - offset), 'points': []}
+            for offset in range(0, 2 * count, step)
+        ]
+        raws = self.enqueue_command(
+            self._read_blocks_internal, slave, blocks, max_age_ms,
+            wait_result=True, priority=priority
+        )
+        if not raws or any(raw is None for raw in raws):
+            return None
+        return unpack_floats(b''.join(raws), byte_order)
+
+    def read_points(self, points, priority=PRIORITY_OPERATOR, slave=None, max_age_ms=None):
+        """Lee los puntos del mapa de sondeo con el mínimo de tramas función 3.
+
+        Retorna {nombre: valor}; los bloques que fallan se omiten del resultado.
+        Los bloques que no están en la imagen se envían juntos al transporte
+        (en Modbus TCP viajan en paralelo).
+        """
+        slave = self.slave if slave is None else slave
+        blocks = read_plan(points)
+        raws = self.enqueue_command(
+            self._read_blocks_internal, slave, blocks, max_age_ms,
+            wait_result=True, priority=priority
+        ) or []
+        return decode_blocks(blocks, raws, "ModbusService")
+
+    def _read_blocks_internal(self, slave, blocks, max_age_ms):
+        raws, missing = cached_reads(self.image, self.frames, slave, blocks, max_age_ms)
+        if missing:
+            responses = self._send_commands_internal([cmd for _, cmd in missing])
+            fill_reads(raws, missing, responses, "ModbusService")
+        return raws
+
+    def write_setpoints(self, values, slave=None, read_back=(), priority=PRIORITY_OPERATOR):
+        """Escribe consignas {nombre: valor} del mapa de sondeo y las verifica.
+
+        Los registros cercanos se agrupan en tramas función 16 (los huecos se
+        reescriben con su valor actual) y después se hace una lectura
+        coalescida de verificación que incluye también los puntos de read_back.
+        Con supports_fc23 la última escritura y la verificación viajan juntas
+        en una trama función 23. Retorna {nombre: True/False} por cada consigna.
+        """
+        slave = self.slave if slave is None else slave
+        return self.enqueue_command(
+            self._write_setpoints_internal, slave, values, list(read_back),
+            wait_result=True, priority=priority
+        ) or {name: False for name in values}
+
+    def _write_setpoints_internal(self, slave, values, read_back):
+        blocks = plan_writes(values)
+        addresses = [resolve_address(b['device'], b['start']) for b in blocks]
+
+        # 1) Completar huecos con la imagen; si no es reciente, leerlos del bus
+        stale = stale_gaps(self.image, slave, blocks, addresses)
+        if stale:
+            self._read_blocks_internal(slave, plan_reads(stale), None)
+
+        # 2) Armar los datos de cada bloque con los huecos ya resueltos
+        frames = []
+        for block, address in zip(blocks, addresses):
+            data = block_data(self.image, slave, block, address, "ModbusService")
+            if data is not None:
+                frames.append((block, address, data))
+
+        # 3) Escribir; con función 23 la última escritura trae también la verificación
+        verify_blocks = plan_reads(list(values) + [p for p in read_back if p not in values])
+        combined = self.supports_fc23 and len(verify_blocks) == 1 and frames
+        written = set()
+        verify_raws = None
+        for i, (block, address, data) in enumerate(frames):
+            if combined and i == len(frames) - 1:
+                verify = verify_blocks[0]
+                read_address = resolve_address(verify['device'], verify['start'])
+                cmd = build_modbus_ascii_command(
+                    slave, 23, (read_address >> 8) & 0xFF, read_address & 0xFF,
+                    quantity=verify['quantity'], write_address=address, custom_bytes=data
+                )
+            else:
+                cmd = write_frame(slave, address, data)
+            response = self._send_command_internal(cmd)
+            parsed = parse_modbus_ascii_response(response) if response else {}
+            if parsed.get('type') in ('write', 'read'):
+                written.update(point['name'] for point in block['points'])
+            if parsed.get('type') == 'read':
+                verify_raws = [parsed.get('raw_bytes')]
+
+        # 4) Verificar con una lectura coalescida (si la función 23 no la trajo ya)
+        if verify_raws is None:
+            verify_raws = self._read_blocks_internal(slave, verify_blocks, None)
+        read_values = decode_blocks(verify_blocks, verify_raws, "ModbusService")
+        return setpoint_results(blocks, values, written, read_values, "ModbusService")
+
+    def write_coils(self, index, values, slave=None, priority=PRIORITY_OPERATOR):
+        """Escribe varias bobinas M consecutivas en una sola trama (función 15)."""
+        high, low = address_bytes('M', index)
+        slave = self.slave if slave is None else slave
+        command = build_modbus_ascii_command(
+            slave, 15, high, low,
+            value=[1 if v else 0 for v in values])
+        response = self.send_command(command, priority=priority)
+        return bool(response) and parse_modbus_ascii_response(response).get('type') == 'write'
+
+    def loopback(self, data=0xA537, slave=None, priority=PRIORITY_OPERATOR):
+        """Diagnóstico función 8 / subfunción 0: el PLC debe devolver el mismo dato."""
+        slave = self.slave if slave is None else slave
+        command = build_modbus_ascii_command(slave, 8, 0x00, 0x00, value=data)
+        response = self.send_command(command, priority=priority)
+        if not response:
+            return False
+        parsed = parse_modbus_ascii_response(response)
+        return parsed.get('type') == 'diagnostic' and parsed.get('data') == [(data >> 8) & 0xFF, data & 0xFF]
 
     def send_boolean(self, name, value):
         """Encola el envío de un valor booleano a un registro M específico"""
-        return self.enqueue_command(self._send_boolean_internal, name, value, wait_result=True)
+        priority = PRIORITY_SAFETY if name == "Reiniciar" else PRIORITY_OPERATOR
+        return self.enqueue_command(self._send_boolean_internal, name, value,
+                                    wait_result=True, priority=priority)
 
     def _send_boolean_internal(self, name, value):
         try:
             print(f"[send_boolean] INICIO: name={name}, value={value}")
-            button_mapping = {
-                "Caudal Q1": "M264",
-                "Caudal Q2": "M265", 
-                "Caudal Q3": "M266",
-                "Caudal Q4": "M267",
-                "Hidrostática": "M268",
-                "Iniciar Prueba": "M269",
-                "Modo Automático": "M271",
-                "Finalizar Prueba": "M270",
-                "Reiniciar": "M263"
-            }
-            if name not in button_mapping:
-                print(f"[send_boolean] ❌ Botón '{name}' no encontrado en mapeo. Disponibles: {list(button_mapping.keys())}")
+            if name not in BUTTON_COILS:
+                print(f"[send_boolean] ❌ Botón '{name}' no encontrado en mapeo. Disponibles: {list(BUTTON_COILS.keys())}")
                 return False
-            address_str = button_mapping[name]
+            address_str = BUTTON_COILS[name]
             print(f"[send_boolean] [MODBUS] Enviando {name} -> {address_str} = {value}")
-            info = get_address('M', int(address_str[1:]))
-            print(f"[send_boolean] Dirección obtenida: {info}")
-            if not info:
-                print(f"[send_boolean] ❌ No se pudo obtener información para {address_str}")
-                return False
+            address = resolve_address(address_str)
+            print(f"[send_boolean] Dirección obtenida: {address_str} -> {address:04X}")
             def send_single_command(val):
                 print(f"[send_boolean] Preparando comando para valor: {val}")
-                command = build_modbus_ascii_command(
-                    slave_address=self.slave,
-                    function_code=5,
-                    address_high=int(info['high_byte'], 16),
-                    address_low=int(info['low_byte'], 16),
-                    quantity=1,
-                    value=0xFF00 if val else 0x0000,
-                    value_type="bool"
-                )
+                command = self.frames.get(self.slave, 5, address, value=1 if val else 0)
                 print(f"[send_boolean] Comando generado: {command}")
-                resp = self.send_command(command)
+                # Ya estamos en el worker: escribir directo para no bloquear la cola
+                resp = self._send_command_internal(command)
                 print(f"[send_boolean] Respuesta de send_command: {resp}")
                 return resp
             print(f"[send_boolean] Enviando valor principal: {value}")
@@ -235,58 +663,14 @@ class ModbusService:
     
     def read_system_status(self):
         """Lee los estados FC0-FC25 (M277-M302) y retorna los mensajes activos"""
-        if not self.connected or not self.serial_port:
+        if not self.connected or not self.transport:
             return []
         try:
-            # Leer desde M277 hasta M302 (26 bits)
-            info = get_address('M', 277)
-            cmd = build_modbus_ascii_command(
-                self.slave, 1,  # Función 1 = Read Coils
-                int(info['high_byte'], 16), int(info['low_byte'], 16),
-                quantity=26
-            )
-            response = self.send_command(cmd)  # Esto ya pasa por la cola FIFO
-            if not response:
-                return []
-            parsed = parse_modbus_ascii_response(response)
-            if parsed.get('type') != 'read' or 'bits' not in parsed:
+            # Leer desde M277 hasta M302 (26 bits), reutilizando la imagen si es reciente
+            bits = self.read_coils(277, 26, max_age_ms=STATUS_MAX_AGE_MS, priority=PRIORITY_POLL)
+            if not bits:
                 return []
-            bits = parsed['bits']
-            # Mapeo de FC a mensajes
-            fc_messages = {
-                0: "✅ Activación de FC0 para selección del modo de trabajo",
-                1: "📝 Introducción de valores de ratio, Q3 y selección de la prueba",
-                2: "🔧 Inicio de purga de la línea Q1",
-                3: "⚙️ Inicio de calibración Q1",
-                4: "✅ Fin de calibración Q1",
-                5: "🧪 Inicio de prueba Q1", 
-                6: "✅ Fin de prueba Q1",
-                7: "🔧 Inicio de purga de la línea Q2",
-                8: "⚙️ Inicio de calibración Q2",
-                9: "✅ Fin de calibración Q2",
-                10: "🧪 Inicio de prueba Q2",
-                11: "✅ Fin de prueba Q2",
-                12: "⚙️ Inicio de calibración Q3",
-                13: "✅ Fin de calibración Q3",
-                14: "🧪 Inicio de prueba Q3",
-                15: "✅ Fin de prueba Q3",
-                16: "⚙️ Inicio de calibración Q4",
-                17: "✅ Fin de calibración Q4",
-                18: "🧪 Inicio de prueba Q4",
-                19: "✅ Fin de prueba Q4",
-                20: "💧 Inicio prueba hidrostática",
-                21: "🔚 Fin de prueba, cierre de válvula de entrada de forma manual",
-                22: "⚡ Apagado del variador, inicia la prueba",
-                23: "⏳ Estado de espera, vuelta a inicio de la selección de la prueba",
-                24: "🔧 Inicio modo mantenimiento en modo manual",
-                25: "✅ Fin modo mantenimiento en modo manual"
-            }
-            # Recopilar mensajes activos
-            active_messages = []
-            for i, bit_value in enumerate(bits[:26]):  # Solo los primeros 26 bits
-                if bit_value and i in fc_messages:
-                    active_messages.append(fc_messages[i])
-            return active_messages
+            return active_fc_messages(bits)
         except Exception as e:
             print(f"❌ Error leyendo estados del sistema: {e}")
             return []
\ No newline at end of file
@@ -0,0 +1,97 @@
+import time
+from utils.poll_map import POLL_GROUPS, INSTANT_POINTS
+
+# Periodos de sondeo (s) según el estado del banco. El normal es el
+# refresh_ms más corto del mapa de sondeo (utils.poll_map).
+FAST_PERIOD = 0.2     # Prueba en curso: más muestras mientras se mide
+NORMAL_PERIOD = POLL_GROUPS[0][0] / 1000 if POLL_GROUPS else 0.5
+IDLE_PERIOD = 2.0     # "Sistema en espera": ningún FC activo
+
+# FC activos durante "Inicio de prueba Qx" (Q1, Q2, Q3, Q4)
+TEST_RUNNING_FCS = (5, 10, 14, 18)
+
+
+def select_poll_period(fc_bits):
+    """Elige el periodo de sondeo a partir de los bits FC0-FC25."""
+    if not fc_bits:
+        return IDLE_PERIOD
+    if any(fc_bits[fc] for fc in TEST_RUNNING_FCS if fc < len(fc_bits)):
+        return FAST_PERIOD
+    if not any(fc_bits):
+        return IDLE_PERIOD
+    return NORMAL_PERIOD
+
+
+class RefreshSchedule:
+    """Qué puntos del sondeo leer en cada ciclo, según su refresh_ms.
+
+    El lazo avanza al periodo base (el refresh_ms más corto, ajustado por
+    select_poll_period); un grupo con refresh_ms n veces mayor se lee uno de
+    cada n ciclos. update() acumula lo leído y dice si hay que refrescar la UI.
+    """
+
+    def __init__(self, groups=POLL_GROUPS, points=INSTANT_POINTS):
+        base = groups[0][0] if groups else 1
+        self.groups = tuple((max(1, round(refresh_ms / base)), names) for refresh_ms, names in groups)
+        self.points = tuple(points)
+        self.latest = {}
+        self.cycles = 0
+        self._last_data = None
+
+    def due(self):
+        """Tupla de nombres a leer en este ciclo."""
+        cycle = self.cycles
+        self.cycles += 1
+        return tuple(name for every, names in self.groups if cycle % every == 0 for name in names)
+
+    def update(self, values):
+        """Guarda los valores leídos. Retorna la lista de points si alguno cambió, o None."""
+        if not values:
+            # Enlace caído o sin respuesta: no pisar la UI con ceros
+            return None
+        self.latest.update(values)
+        data = [self.latest.get(name, 0) for name in self.points]
+        if data == self._last_data:
+            return None
+        self._last_data = data
+        return data
+
+
+class PollTimer:
+    """Temporizador sobre plazos monotónicos que no acumula deriva.
+
+    Cada ciclo termina en start + n * period, independientemente de lo que
+    tarde el bus. Si un ciclo se pasa del plazo se cuenta como overrun y se
+    reprograma desde el instante actual.
+    """
+
+    def __init__(self, period=NORMAL_PERIOD):
+        self.period = period
+        self.cycles = 0
+        self.overruns = 0
+        self._next_deadline = time.monotonic()
+
+    def set_period(self, period):
+        # El nuevo periodo se cuenta desde el último plazo cumplido
+        self.period = period
+
+    def next_delay(self):
+        """Avanza al siguiente plazo y retorna cuánto falta (s); 0 si el ciclo se pasó."""
+        self.cycles += 1
+        self._next_deadline += self.period
+        delay = self._next_deadline - time.monotonic()
+        if delay < 0:
+            self.overruns += 1
+            self._next_deadline = time.monotonic()
+            return 0.0
+        return delay
+
+    def wait(self, stop_event=None):
+        """Espera hasta el siguiente plazo. Retorna False si stop_event se activó."""
+        delay = self.next_delay()
+        if not delay:
+            return not (stop_event and stop_event.is_set())
+        if stop_event is not None:
+            return not stop_event.wait(delay)
+        time.sleep(delay)
+        return True
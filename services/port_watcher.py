@@ -0,0 +1,170 @@
+import threading
+import time
+from services.serial_service import (
+    list_serial_ports, port_identity, find_port, save_port_identity, saved_port_identities,
+    LINK_SETTINGS_FILE
+)
+from services.transports import SERIAL_MODES
+
+# Intervalo (s) entre revisiones de los puertos presentes
+PORT_WATCH_INTERVAL = 0.5
+
+# Espera máxima (s) entre reintentos cuando el adaptador está pero no abre
+RECONNECT_BACKOFF_MAX = 10.0
+
+# Eventos notificados a on_event(evento, puerto)
+EVENT_CONNECTED = 'connected'   # Primera conexión
+EVENT_LOST = 'lost'             # El adaptador desapareció
+EVENT_RESTORED = 'restored'     # Reconectado tras una pérdida
+EVENT_WAITING = 'waiting'       # No hay adaptador conocido disponible
+
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+class PortWatcher:
+    """Vigila el adaptador USB-serie de un ModbusService y lo reconecta al volver.
+
+    El adaptador se reconoce por VID/PID/número de serie, así que se
+    recupera aunque el sistema le asigne otro nombre (COM5 -> COM6). Solo
+    se abre un adaptador conocido: el aprendido en una conexión anterior o
+    uno guardado en la configuración de enlaces (settings_path); cualquier
+    otro adaptador presente se ignora. Un puerto cerrado por el operador
+    (ModbusService.close) no se reabre hasta el siguiente connect. Al
+    reconectar se reutilizan velocidad, modo y esclavo del servicio, y los
+    lazos de lectura activos siguen sondeando sin intervención del operador.
+    """
+
+    def __init__(self, service, interval=PORT_WATCH_INTERVAL, on_event=None,
+                 settings_path=LINK_SETTINGS_FILE):
+        self.service = service
+        self.interval = interval
+        self.on_event = on_event
+        # Sin settings_path las identidades aprendidas no se guardan
+        self.settings_path = settings_path
+        self.identity = None
+        self.reconnects = 0
+        self._was_connected = False
+        self._waiting = False
+        self._failed_device = None
+        self._retry_delay = interval
+        self._retry_at = 0.0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _emit(self, event, port):
+        if self.on_event:
+            try:
+                self.on_event(event, port)
+            except Exception as ex:
+                print(f"[PortWatcher] ⚠️ Error notificando {event}: {ex}")
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.check()
+            except Exception as ex:
+                print(f"[PortWatcher] ❌ Error revisando puertos: {ex}")
+            self._stop_event.wait(self.interval)
+
+    def _learn(self, info):
+        identity = port_identity(info)
+        if identity is None or identity == self.identity:
+            return
+        self.identity = identity
+        if self.settings_path:
+            try:
+                save_port_identity(info.device, identity, self.settings_path)
+            except OSError as ex:
+                print(f"[PortWatcher] ⚠️ No se pudo guardar el adaptador: {ex}")
+
+    def _known_device(self, ports, devices):
+        """Puerto del adaptador conocido, o None."""
+        if self.identity is not None:
+            return find_port(self.identity, ports)
+        if self.settings_path:
+            for identity in saved_port_identities(self.settings_path):
+                device = find_port(identity, ports)
+                if device is not None:
+                    return device
+        # Un puerto nativo (sin VID/PID) no cambia de nombre: se reabre el mismo
+        port = self.service.port
+        if port in devices and port_identity(devices[port]) is None:
+            return port
+        return None
+
+    def check(self, ports=None):
+        """Una revisión: detecta la pérdida del adaptador o lo reconecta."""
+        service = self.service
+        if service.mode not in SERIAL_MODES:
+            return
+        ports = list_serial_ports() if ports is None else ports
+        devices = {info.device: info for info in ports}
+
+        if service.connected:
+            if service.port in devices:
+                self._learn(devices[service.port])
+                if not self._was_connected:
+                    self._was_connected = True
+                    self._emit(EVENT_CONNECTED, service.port)
+                return
+            print(f"[PortWatcher] 🔌 Adaptador desconectado: {service.port}")
+            service.drop_link()
+            self._emit(EVENT_LOST, service.port)
+            return
+
+        if service.operator_closed:
+            return
+
+        device = self._known_device(ports, devices)
+        if device is None:
+            if not self._waiting:
+                self._waiting = True
+                self._emit(EVENT_WAITING, None)
+            return
+        self._waiting = False
+
+        if device == self._failed_device and time.monotonic() < self._retry_at:
+            return
+        if not service.reconnect(device):
+            # Espera creciente entre reintentos; se registra solo el primer fallo
+            if device != self._failed_device:
+                self._failed_device = device
+                self._retry_delay = self.interval
+                print(f"[PortWatcher] ⚠️ {device} presente pero no abre; reintentando con espera creciente")
+            else:
+                self._retry_delay = min(self._retry_delay * 2, RECONNECT_BACKOFF_MAX)
+            self._retry_at = time.monotonic() + self._retry_delay
+            return
+        self._failed_device = None
+        self._learn(devices[device])
+        if self._was_connected:
+            self.reconnects += 1
+            print(f"[PortWatcher] ✅ Enlace restablecido en {device}")
+            self._emit(EVENT_RESTORED, device)
+        else:
+            self._was_connected = True
+            self._emit(EVENT_CONNECTED, device)
+
+
+def watch_port(service, on_event=None, interval=PORT_WATCH_INTERVAL):
+    """Retorna el vigilante del servicio (uno por servicio), arrancado."""
+    with _watchers_lock:
+        watcher = _watchers.get(service.key)
+        if watcher is None:
+            watcher = PortWatcher(service, interval)
+            _watchers[service.key] = watcher
+    if on_event is not None:
+        watcher.on_event = on_event
+    watcher.start()
+    return watcher
@@ -0,0 +1,98 @@
+import threading
+import time
+from utils.modbus_utils import ascii_frame_to_bytes
+
+
+class RegisterImage:
+    """Imagen en memoria de los registros y bobinas vistos en el bus.
+
+    Cada valor se guarda con la marca de tiempo (time.monotonic) en que se
+    leyó o escribió, indexado por (esclavo, dirección Modbus).
+    """
+
+    def __init__(self):
+        self._registers = {}
+        self._coils = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._registers.clear()
+            self._coils.clear()
+
+    def update_registers(self, slave, address, words, timestamp=None):
+        stamp = time.monotonic() if timestamp is None else timestamp
+        with self._lock:
+            for offset, word in enumerate(words):
+                self._registers[(slave, address + offset)] = (word, stamp)
+
+    def update_coils(self, slave, address, bits, timestamp=None):
+        stamp = time.monotonic() if timestamp is None else timestamp
+        with self._lock:
+            for offset, bit in enumerate(bits):
+                self._coils[(slave, address + offset)] = (1 if bit else 0, stamp)
+
+    @staticmethod
+    def _lookup(table, slave, address, quantity, max_age_ms):
+        oldest = time.monotonic() - max_age_ms / 1000.0
+        values = []
+        for offset in range(quantity):
+            entry = table.get((slave, address + offset))
+            if entry is None or entry[1] < oldest:
+                return None
+            values.append(entry[0])
+        return values
+
+    def get_registers(self, slave, address, quantity, max_age_ms):
+        """Retorna las palabras si todas tienen como máximo max_age_ms, si no None."""
+        with self._lock:
+            return self._lookup(self._registers, slave, address, quantity, max_age_ms)
+
+    def get_coils(self, slave, address, quantity, max_age_ms):
+        """Retorna los bits si todos tienen como máximo max_age_ms, si no None."""
+        with self._lock:
+            return self._lookup(self._coils, slave, address, quantity, max_age_ms)
+
+    def record(self, request, response):
+        """Actualiza la imagen a partir de una transacción ASCII exitosa."""
+        req = ascii_frame_to_bytes(request)
+        res = ascii_frame_to_bytes(response)
+        slave, function_code = req[0], req[1]
+        if res[1] != function_code:
+            return  # Respuesta de excepción
+        address = (req[2] << 8) | req[3]
+        if function_code == 3:
+            byte_count = res[2]
+            data = res[3:3 + byte_count]
+            words = [(data[i] << 8) | data[i + 1] for i in range(0, byte_count - 1, 2)]
+            self.update_registers(slave, address, words)
+        elif function_code == 1:
+            quantity = (req[4] << 8) | req[5]
+            data = res[3:3 + res[2]]
+            bits = [(data[i // 8] >> (i % 8)) & 0x01 for i in range(quantity)]
+            self.update_coils(slave, address, bits)
+        elif function_code == 5:
+            self.update_coils(slave, address, [req[4] == 0xFF])
+        elif function_code == 6:
+            self.update_registers(slave, address, [(req[4] << 8) | req[5]])
+        elif function_code == 16:
+            byte_count = req[6]
+            data = req[7:7 + byte_count]
+            words = [(data[i] << 8) | data[i + 1] for i in range(0, byte_count - 1, 2)]
+            self.update_registers(slave, address, words)
+        elif function_code == 15:
+            quantity = (req[4] << 8) | req[5]
+            data = req[7:7 + req[6]]
+            bits = [(data[i // 8] >> (i % 8)) & 0x01 for i in range(quantity)]
+            self.update_coils(slave, address, bits)
+        elif function_code == 23:
+            # La escritura se aplica antes que la lectura
+            write_address = (req[6] << 8) | req[7]
+            byte_count = req[10]
+            data = req[11:11 + byte_count]
+            words = [(data[i] << 8) | data[i + 1] for i in range(0, byte_count - 1, 2)]
+            self.update_registers(slave, write_address, words)
+            byte_count = res[2]
+            data = res[3:3 + byte_count]
+            words = [(data[i] << 8) | data[i + 1] for i in range(0, byte_count - 1, 2)]
+            self.update_registers(slave, address, words)
@@ -1,20 +1,106 @@
+import json
+import os
 import serial
 import serial.tools.list_ports
 
+# Mejor configuración de enlace encontrada por puerto (ver services.link_negotiation),
+# junto a la aplicación y no en el directorio de trabajo
+LINK_SETTINGS_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "link_settings.json")
+
+DEFAULT_ASCII_FRAMING = '7E1'
+DEFAULT_RTU_FRAMING = '8E1'
+
+_BYTESIZES = {7: serial.SEVENBITS, 8: serial.EIGHTBITS}
+_PARITIES = {'E': serial.PARITY_EVEN, 'O': serial.PARITY_ODD, 'N': serial.PARITY_NONE}
+_STOPBITS = {1: serial.STOPBITS_ONE, 2: serial.STOPBITS_TWO}
+
 def detect_com_port():
     ports = list(serial.tools.list_ports.comports())
     return ports[0].device if ports else None
 
-def create_serial_connection(port, baudrate=9600, timeout=1):
+def list_serial_ports():
+    """Puertos serie presentes; los adaptadores USB primero."""
+    ports = list(serial.tools.list_ports.comports())
+    return sorted(ports, key=lambda info: info.vid is None)
+
+def port_identity(port_info):
+    """(VID, PID, número de serie) de un adaptador USB-serie, o None si no es USB."""
+    if port_info is None or port_info.vid is None:
+        return None
+    return (port_info.vid, port_info.pid, port_info.serial_number)
+
+def find_port(identity, ports=None):
+    """Nombre actual (COMx, /dev/ttyUSBx) del adaptador con esa identidad, o None."""
+    for info in list_serial_ports() if ports is None else ports:
+        if port_identity(info) == identity:
+            return info.device
+    return None
+
+def parse_framing(framing):
+    """'7E1' -> dict con bytesize, parity y stopbits para serial.Serial"""
+    try:
+        return {
+            'bytesize': _BYTESIZES[int(framing[0])],
+            'parity': _PARITIES[framing[1].upper()],
+            'stopbits': _STOPBITS[int(framing[2])],
+        }
+    except (IndexError, KeyError, ValueError, TypeError):
+        raise ValueError(f"Invalid serial framing '{framing}'") from None
+
+def create_serial_connection(port, baudrate=9600, timeout=1, framing=DEFAULT_ASCII_FRAMING):
     try:
         ser = serial.Serial(
             port=port,
             baudrate=baudrate,
-            bytesize=serial.SEVENBITS,
-            parity=serial.PARITY_EVEN,
-            stopbits=serial.STOPBITS_ONE,
-            timeout=timeout
+            timeout=timeout,
+            **parse_framing(framing)
         )
         return ser
     except Exception as e:
         return None
+
+def load_link_settings(path=LINK_SETTINGS_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError) as ex:
+        print(f"[SerialService] ⚠️ No se pudo leer {path}: {ex}")
+        return {}
+
+def _write_link_settings(settings, path):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(settings, file, indent=2)
+
+def save_link_setting(port, setting, path=LINK_SETTINGS_FILE):
+    """Guarda {'mode', 'baudrate', 'framing', ...} como configuración del puerto."""
+    settings = load_link_settings(path)
+    identity = (settings.get(port) or {}).get('identity')
+    settings[port] = dict(setting, identity=identity) if identity else setting
+    _write_link_settings(settings, path)
+
+def save_port_identity(port, identity, path=LINK_SETTINGS_FILE):
+    """Recuerda el adaptador (VID, PID, número de serie) del puerto del banco."""
+    settings = load_link_settings(path)
+    setting = settings.setdefault(port, {})
+    if setting.get('identity') == list(identity):
+        return
+    setting['identity'] = list(identity)
+    _write_link_settings(settings, path)
+
+def saved_port_identities(path=LINK_SETTINGS_FILE):
+    """Identidades de adaptador guardadas (ver save_port_identity)."""
+    return [tuple(setting['identity']) for setting in load_link_settings(path).values()
+            if isinstance(setting, dict) and setting.get('identity')]
+
+def saved_link_setting(port, mode=None, path=LINK_SETTINGS_FILE):
+    """Configuración guardada del puerto (opcionalmente solo si es del modo indicado)."""
+    setting = load_link_settings(path).get(port)
+    if setting and (mode is None or setting.get('mode') == mode):
+        return setting
+    return None
@@ -0,0 +1,522 @@
+import collections
+import itertools
+import queue
+import socket
+import statistics
+import struct
+import threading
+import time
+import serial
+from services.frame_cache import FRAME_CACHE_SIZE
+from services.serial_service import parse_framing, DEFAULT_ASCII_FRAMING, DEFAULT_RTU_FRAMING
+from utils.modbus_utils import (
+    expected_response_length, check_response_frame, MAX_ASCII_FRAME_LENGTH,
+    ascii_to_rtu, rtu_to_ascii, expected_rtu_response_length, rtu_silent_interval,
+    MAX_RTU_FRAME_LENGTH, RTU_EXCEPTION_LENGTH, ascii_to_pdu, encode_ascii_frame
+)
+
+# Modos de transporte
+MODE_ASCII = 'ascii'   # Serie 7E1, tramas ':' HEX LRC CRLF
+MODE_RTU = 'rtu'       # Serie 8E1, tramas binarias con CRC16 y silencio de 3.5 caracteres
+MODE_TCP = 'tcp'       # Modbus TCP (MBAP) hacia un PLC o pasarela Ethernet
+MODE_LOOPBACK = 'loopback'  # En proceso, contra un simulador (tests/com_simulator.py)
+
+# Modos que usan un puerto serie físico
+SERIAL_MODES = (MODE_ASCII, MODE_RTU)
+
+MODBUS_TCP_PORT = 502
+
+# Solicitudes simultáneas por defecto en Modbus TCP
+TCP_MAX_IN_FLIGHT = 4
+
+# En Linux los modos serie usan el backend de baja latencia (services.linux_serial)
+LOW_LATENCY_BACKEND = True
+
+# Transacciones recientes sobre las que se informa el tiempo de respuesta
+TURNAROUND_SAMPLES = 200
+
+
+class TurnaroundStats:
+    """Tiempos por transacción: respuesta del PLC (fin de envío -> primer byte) y total."""
+
+    def __init__(self, samples=TURNAROUND_SAMPLES):
+        self.turnaround = collections.deque(maxlen=samples)
+        self.transaction = collections.deque(maxlen=samples)
+
+    def add(self, turnaround, transaction):
+        self.turnaround.append(turnaround)
+        self.transaction.append(transaction)
+
+    @staticmethod
+    def _summary(values):
+        if not values:
+            return None
+        ordered = sorted(values)
+        return {
+            'min_ms': ordered[0] * 1000.0,
+            'median_ms': statistics.median(ordered) * 1000.0,
+            'p95_ms': ordered[int(0.95 * (len(ordered) - 1))] * 1000.0,
+            'max_ms': ordered[-1] * 1000.0,
+        }
+
+    def summary(self):
+        return {
+            'samples': len(self.turnaround),
+            'turnaround': self._summary(self.turnaround),
+            'transaction': self._summary(self.transaction),
+        }
+
+    def describe(self):
+        """Línea de resumen para el registro (None sin muestras)."""
+        summary = self.summary()
+        if not summary['samples']:
+            return None
+        turnaround, transaction = summary['turnaround'], summary['transaction']
+        return (f"respuesta PLC {turnaround['median_ms']:.1f} ms (p95 {turnaround['p95_ms']:.1f}, "
+                f"máx {turnaround['max_ms']:.1f}), transacción {transaction['median_ms']:.1f} ms "
+                f"(p95 {transaction['p95_ms']:.1f}), {summary['samples']} muestras")
+
+
+class SerialAsciiTransport:
+    """Modbus ASCII sobre puerto serie."""
+
+    mode = MODE_ASCII
+    default_framing = DEFAULT_ASCII_FRAMING
+
+    def __init__(self, port, baudrate=9600, timeout=1, framing=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.framing = framing or self.default_framing
+        self.serial_port = None
+
+    def _open_serial(self, **kwargs):
+        self.serial_port = serial.Serial(
+            port=self.port,
+            baudrate=self.baudrate,
+            timeout=self.timeout,
+            **parse_framing(self.framing),
+            **kwargs
+        )
+
+    def open(self):
+        self._open_serial()
+
+    def close(self):
+        if self.serial_port and self.serial_port.is_open:
+            self.serial_port.close()
+
+    @property
+    def is_open(self):
+        return bool(self.serial_port and self.serial_port.is_open)
+
+    def _set_timeout(self, timeout):
+        # pyserial reconfigura el puerto al cambiar el timeout: solo si cambia
+        timeout = self.timeout if timeout is None else timeout
+        if self.serial_port.timeout != timeout:
+            self.serial_port.timeout = timeout
+
+    def transact(self, command_bytes, timeout=None):
+        """Envía una trama ASCII y retorna la respuesta ASCII validada (o None).
+
+        timeout (s) reemplaza al del puerto solo para esta transacción.
+        """
+        self._set_timeout(timeout)
+        self.serial_port.reset_input_buffer()
+        self.serial_port.write(command_bytes)
+        return self._read_response(command_bytes)
+
+    def transact_many(self, commands, timeout=None):
+        return [self.transact(command, timeout) for command in commands]
+
+    def broadcast(self, command_bytes):
+        """Envía sin esperar respuesta (esclavo 0)."""
+        self.serial_port.write(command_bytes)
+
+    def _read_response(self, command_bytes):
+        """Lee una trama ASCII completa: desde ':' hasta CRLF, con la longitud esperada"""
+        expected = expected_response_length(command_bytes) or MAX_ASCII_FRAME_LENGTH
+        # Descartar bytes sueltos previos al inicio de trama
+        leading = self.serial_port.read_until(b':', MAX_ASCII_FRAME_LENGTH)
+        if not leading.endswith(b':'):
+            print("[SerialAsciiTransport] ⚠️ Timeout esperando inicio de trama")
+            return None
+        if len(leading) > 1:
+            print(f"[SerialAsciiTransport] ⚠️ Descartados {len(leading) - 1} bytes sueltos: {leading[:-1]!r}")
+        response = b':' + self.serial_port.read_until(b'\r\n', expected - 1)
+        error = check_response_frame(command_bytes, response)
+        if error:
+            print(f"[SerialAsciiTransport] ❌ Respuesta rechazada ({error}): {response!r}")
+            return None
+        return response
+
+
+class SerialRtuTransport(SerialAsciiTransport):
+    """Modbus RTU sobre puerto serie; recibe y entrega tramas en formato ASCII."""
+
+    mode = MODE_RTU
+    default_framing = DEFAULT_RTU_FRAMING
+
+    def __init__(self, port, baudrate=9600, timeout=1, framing=None):
+        super().__init__(port, baudrate, timeout, framing)
+        self.silent_interval = rtu_silent_interval(baudrate)
+        self._last_frame_end = 0
+        # Conversión ASCII -> RTU de las tramas fijas (el caché vive con el transporte)
+        self._rtu_frames = {}
+
+    def open(self):
+        if parse_framing(self.framing)['bytesize'] != serial.EIGHTBITS:
+            raise ValueError("Modbus RTU requires 8 data bits")
+        self._open_serial(inter_byte_timeout=self.silent_interval)
+
+    def _to_rtu(self, command_bytes):
+        if not isinstance(command_bytes, bytes):
+            return ascii_to_rtu(command_bytes)
+        frame = self._rtu_frames.get(command_bytes)
+        if frame is None:
+            frame = ascii_to_rtu(command_bytes)
+            if len(self._rtu_frames) < FRAME_CACHE_SIZE:
+                self._rtu_frames[command_bytes] = frame
+        return frame
+
+    def transact(self, command_bytes, timeout=None):
+        """Envía el comando como trama RTU y retorna la respuesta convertida a ASCII"""
+        self._set_timeout(timeout)
+        self.serial_port.reset_input_buffer()
+        # Respetar el silencio de 3.5 caracteres desde la trama anterior
+        gap = self._last_frame_end + self.silent_interval - time.monotonic()
+        if gap > 0:
+            time.sleep(gap)
+        self.serial_port.write(self._to_rtu(command_bytes))
+        try:
+            head = self.serial_port.read(3)
+            if len(head) < 3:
+                print("[SerialRtuTransport] ⚠️ Timeout esperando respuesta RTU")
+                return None
+            if head[1] & 0x80:
+                expected = RTU_EXCEPTION_LENGTH
+            else:
+                expected = expected_rtu_response_length(command_bytes) or MAX_RTU_FRAME_LENGTH
+            # El fin de trama lo marca la longitud esperada o el silencio entre bytes
+            frame = head + self.serial_port.read(expected - 3)
+        finally:
+            self._last_frame_end = time.monotonic()
+        try:
+            response = rtu_to_ascii(frame)
+        except ValueError as ex:
+            print(f"[SerialRtuTransport] ❌ Trama RTU rechazada ({ex}): {frame.hex()}")
+            return None
+        error = check_response_frame(command_bytes, response)
+        if error:
+            print(f"[SerialRtuTransport] ❌ Respuesta rechazada ({error}): {frame.hex()}")
+            return None
+        return response
+
+    def broadcast(self, command_bytes):
+        gap = self._last_frame_end + self.silent_interval - time.monotonic()
+        if gap > 0:
+            time.sleep(gap)
+        self.serial_port.write(self._to_rtu(command_bytes))
+        self._last_frame_end = time.monotonic()
+
+
+class ModbusTcpTransport:
+    """Modbus TCP con identificadores de transacción MBAP.
+
+    Admite hasta max_in_flight solicitudes pendientes a la vez: un hilo lector
+    entrega cada respuesta a quien la espera según su transaction ID.
+    """
+
+    mode = MODE_TCP
+
+    def __init__(self, host, port=MODBUS_TCP_PORT, timeout=1, max_in_flight=TCP_MAX_IN_FLIGHT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.sock = None
+        self._tids = itertools.count(1)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._reader = None
+
+    def open(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(None)
+        self._reader = threading.Thread(target=self._read_loop, args=(self.sock,), daemon=True)
+        self._reader.start()
+
+    def close(self):
+        sock, self.sock = self.sock, None
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    @property
+    def is_open(self):
+        return self.sock is not None
+
+    def _recv_exact(self, sock, length):
+        data = b''
+        while len(data) < length:
+            chunk = sock.recv(length - len(data))
+            if not chunk:
+                raise ConnectionError("Connection closed by peer")
+            data += chunk
+        return data
+
+    def _read_loop(self, sock):
+        try:
+            while True:
+                header = self._recv_exact(sock, 7)
+                tid, _, length, unit = struct.unpack('>HHHB', header)
+                pdu = self._recv_exact(sock, length - 1)
+                with self._pending_lock:
+                    waiter = self._pending.pop(tid, None)
+                if waiter is None:
+                    print(f"[ModbusTcpTransport] ⚠️ Respuesta sin solicitud pendiente (tid={tid})")
+                    continue
+                waiter.put(bytes([unit]) + pdu)
+        except (OSError, ConnectionError) as ex:
+            print(f"[ModbusTcpTransport] ❌ Conexión perdida: {ex}")
+        finally:
+            if self.sock is sock:
+                self.sock = None
+            # Liberar a todos los que esperan respuesta
+            with self._pending_lock:
+                waiters = list(self._pending.values())
+                self._pending.clear()
+            for waiter in waiters:
+                waiter.put(None)
+
+    def submit(self, command_bytes, timeout=None):
+        """Envía la solicitud sin esperar y retorna (tid, cola de respuesta).
+
+        Si en timeout (s) no se libera un lugar entre las solicitudes en
+        curso se lanza TimeoutError.
+        """
+        sock = self.sock
+        if sock is None:
+            raise ConnectionError("Modbus TCP transport is not connected")
+        slave, pdu = ascii_to_pdu(command_bytes)
+        if not self._slots.acquire(timeout=self.timeout if timeout is None else timeout):
+            raise TimeoutError("No free Modbus TCP request slot")
+        tid = next(self._tids) & 0xFFFF
+        waiter = queue.Queue(maxsize=1)
+        with self._pending_lock:
+            self._pending[tid] = waiter
+        frame = struct.pack('>HHHB', tid, 0, len(pdu) + 1, slave) + pdu
+        try:
+            with self._send_lock:
+                sock.sendall(frame)
+        except OSError:
+            self._abandon(tid)
+            raise
+        return tid, waiter
+
+    def _abandon(self, tid):
+        """Deja de esperar la respuesta de tid y libera su lugar."""
+        with self._pending_lock:
+            self._pending.pop(tid, None)
+        self._slots.release()
+
+    def _wait(self, command_bytes, tid, waiter, timeout=None):
+        try:
+            data = waiter.get(timeout=self.timeout if timeout is None else timeout)
+        except queue.Empty:
+            with self._pending_lock:
+                self._pending.pop(tid, None)
+            print(f"[ModbusTcpTransport] ⚠️ Timeout esperando respuesta (tid={tid})")
+            return None
+        finally:
+            self._slots.release()
+        if data is None:
+            return None
+        response = encode_ascii_frame(data)
+        error = check_response_frame(command_bytes, response)
+        if error:
+            print(f"[ModbusTcpTransport] ❌ Respuesta rechazada ({error}): {data.hex()}")
+            return None
+        return response
+
+    def broadcast(self, command_bytes):
+        """Envía con unit 0 sin registrar respuesta; si la pasarela contesta se descarta."""
+        sock = self.sock
+        if sock is None:
+            raise ConnectionError("Modbus TCP transport is not connected")
+        slave, pdu = ascii_to_pdu(command_bytes)
+        tid = next(self._tids) & 0xFFFF
+        with self._send_lock:
+            sock.sendall(struct.pack('>HHHB', tid, 0, len(pdu) + 1, slave) + pdu)
+
+    def transact(self, command_bytes, timeout=None):
+        try:
+            tid, waiter = self.submit(command_bytes, timeout)
+        except TimeoutError as ex:
+            print(f"[ModbusTcpTransport] ⚠️ {ex}")
+            return None
+        return self._wait(command_bytes, tid, waiter, timeout)
+
+    def transact_many(self, commands, timeout=None):
+        """Envía varias solicitudes en paralelo (hasta max_in_flight) y retorna sus respuestas en orden.
+
+        Una solicitud que no consigue lugar a tiempo queda sin respuesta (None).
+        """
+        results = [None] * len(commands)
+        in_flight = []
+        try:
+            for i, command in enumerate(commands):
+                if len(in_flight) >= self.max_in_flight:
+                    j, tid, waiter = in_flight.pop(0)
+                    results[j] = self._wait(commands[j], tid, waiter, timeout)
+                try:
+                    tid, waiter = self.submit(command, timeout)
+                except TimeoutError as ex:
+                    print(f"[ModbusTcpTransport] ⚠️ {ex}")
+                    continue
+                in_flight.append((i, tid, waiter))
+            while in_flight:
+                j, tid, waiter = in_flight.pop(0)
+                results[j] = self._wait(commands[j], tid, waiter, timeout)
+        finally:
+            # Si el lote se interrumpe, las solicitudes en curso devuelven su lugar
+            for _, tid, _ in in_flight:
+                self._abandon(tid)
+        return results
+
+
+class LoopbackTransport:
+    """Modbus ASCII en proceso contra un simulador, sin puerto COM.
+
+    responder es cualquier objeto con handle_frame(trama ASCII) -> bytes
+    recibidos o None (por ejemplo tests.com_simulator.ModbusSimulator o
+    tests.fault_injection.FaultInjector). Como en el puerto serie, la
+    respuesta es la primera trama de ':' a CRLF. Sin baudrate las respuestas
+    son inmediatas; con baudrate se modela el tiempo de cada carácter en el
+    cable (bits de inicio, datos, paridad y parada según framing) en el envío
+    y en la respuesta. Una respuesta que falta, está incompleta o llega tarde
+    consume el timeout completo, como en el puerto real.
+    """
+
+    mode = MODE_LOOPBACK
+    default_framing = DEFAULT_ASCII_FRAMING
+
+    def __init__(self, responder, baudrate=None, timeout=1, framing=None, turnaround=0.0):
+        self.port = responder
+        self.responder = responder
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.framing = framing or self.default_framing
+        # Tiempo de procesamiento del PLC entre solicitud y respuesta (solo con baudrate)
+        self.turnaround = turnaround
+        self.char_time = character_time(baudrate, self.framing) if baudrate else 0.0
+        self.stats = TurnaroundStats()
+        self._open = False
+
+    def open(self):
+        if not callable(getattr(self.responder, 'handle_frame', None)):
+            raise TypeError(f"Loopback responder without handle_frame: {self.responder!r}")
+        self._open = True
+
+    def close(self):
+        self._open = False
+
+    @property
+    def is_open(self):
+        return self._open
+
+    def _wire(self, length):
+        if self.char_time:
+            time.sleep(length * self.char_time)
+
+    def _exchange(self, command_bytes):
+        if not self._open:
+            raise ConnectionError("Loopback transport is not connected")
+        self._wire(len(command_bytes))
+        return self.responder.handle_frame(bytes(command_bytes))
+
+    def transact(self, command_bytes, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        received = self._exchange(command_bytes)
+        sent_at = time.perf_counter()
+        response = first_ascii_frame(received) if received else None
+        if response is not None and self.char_time:
+            time.sleep(self.turnaround)
+            self._wire(1)
+            first_byte_at = time.perf_counter()
+            self._wire(len(received) - 1)
+        else:
+            first_byte_at = time.perf_counter()
+        if response is None or time.monotonic() - started > timeout:
+            remaining = started + timeout - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            print("[LoopbackTransport] ⚠️ Timeout esperando respuesta")
+            return None
+        self.stats.add(first_byte_at - sent_at, time.perf_counter() - sent_at)
+        error = check_response_frame(command_bytes, response)
+        if error:
+            print(f"[LoopbackTransport] ❌ Respuesta rechazada ({error}): {response!r}")
+            return None
+        return response
+
+    def transact_many(self, commands, timeout=None):
+        return [self.transact(command, timeout) for command in commands]
+
+    def broadcast(self, command_bytes):
+        self._exchange(command_bytes)
+
+
+def first_ascii_frame(data):
+    """Primera trama completa (de ':' a CRLF) de los bytes recibidos, o None."""
+    start = data.find(b':')
+    end = data.find(b'\r\n', start + 1) if start >= 0 else -1
+    if end < 0:
+        return None
+    return bytes(data[start:end + 2])
+
+
+def character_time(baudrate, framing=DEFAULT_ASCII_FRAMING):
+    """Segundos por carácter en el cable: inicio + datos + paridad + parada."""
+    settings = parse_framing(framing)
+    bits = 1 + settings['bytesize'] + (settings['parity'] != serial.PARITY_NONE) + settings['stopbits']
+    return bits / baudrate
+
+
+def parse_tcp_address(address):
+    """'host' o 'host:puerto' -> (host, puerto)"""
+    host, _, port = address.rpartition(':')
+    if not host:
+        return address, MODBUS_TCP_PORT
+    return host, int(port)
+
+
+def create_transport(mode, port, baudrate=9600, timeout=1, framing=None):
+    """Crea el transporte para el modo indicado (sin abrirlo).
+
+    framing ('7E1', '8N1', ...) solo aplica a los modos serie y al
+    loopback con baudrate. En loopback port es el simulador.
+    """
+    if mode in SERIAL_MODES and LOW_LATENCY_BACKEND:
+        from services import linux_serial
+        if linux_serial.low_latency_supported():
+            if mode == MODE_ASCII:
+                return linux_serial.LinuxSerialAsciiTransport(port, baudrate, timeout, framing)
+            return linux_serial.LinuxSerialRtuTransport(port, baudrate, timeout, framing)
+    if mode == MODE_ASCII:
+        return SerialAsciiTransport(port, baudrate, timeout, framing)
+    if mode == MODE_RTU:
+        return SerialRtuTransport(port, baudrate, timeout, framing)
+    if mode == MODE_TCP:
+        host, tcp_port = parse_tcp_address(port)
+        return ModbusTcpTransport(host, tcp_port, timeout)
+    if mode == MODE_LOOPBACK:
+        return LoopbackTransport(port, baudrate, timeout, framing)
+    raise ValueError(f"Unsupported Modbus mode: {mode}")
@@ -1,424 +1,437 @@
-import serial
-import time
+import os
+import sys
 import struct
-import random
+import threading
+from array import array
+
+# Permite ejecutarlo directamente: python tests/com_simulator.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.address_utils import resolve_address
+from tests.simulator_scenarios import ScenarioEngine
+from utils.modbus_utils import (
+    decode_ascii_frame, encode_ascii_frame, ascii_frame_length, pack_floats, unpack_floats,
+    MAX_ASCII_FRAME_LENGTH
+)
 
 # Cambia esto al COM que esté emparejado con el de tu app
 SIMULATED_PORT = 'COM2'
 BAUDRATE = 9600
 
-class ModbusSimulator:
+# Espacio de direcciones Modbus completo (registros y bobinas)
+ADDRESS_SPACE = 0x10000
+# Escenario que corre el simulador independiente (ver tests/simulator_scenarios.py)
+DEFAULT_SCENARIO = 'free_run'
+# Orden de palabras de los float32 en el PLC
+FLOAT_BYTE_ORDER = 'little_word'
+
+# Códigos de excepción Modbus
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_ADDRESS = 0x02
+ILLEGAL_DATA_VALUE = 0x03
+
+# Dirección Modbus de M0: los botones se identifican por su índice M
+M_BASE = resolve_address('M', 0)
+
+# Los registros se guardan en el orden nativo; en el bus van en big endian
+_SWAP_WORDS = sys.byteorder == 'little'
+
+
+class RegisterBank:
+    """Registros de 16 bits (array('H')) y bobinas (mapa de bits) de todo el espacio Modbus.
+
+    Se indexa por dirección Modbus (D136 -> 0x1088), igual que las tramas.
+    floats da acceso a pares de registros como float32 (floats[address]).
+    """
+
+    __slots__ = ('words', 'coils', 'floats')
+
+    def __init__(self, float_byte_order=FLOAT_BYTE_ORDER):
+        self.words = array('H', bytes(2 * ADDRESS_SPACE))
+        self.coils = bytearray(ADDRESS_SPACE // 8)
+        self.floats = FloatView(self, float_byte_order)
+
+    @staticmethod
+    def _check(address, quantity):
+        if quantity < 1 or address + quantity > ADDRESS_SPACE:
+            raise IndexError(f"Address out of range: {address}+{quantity}")
+
+    def read_words(self, address, quantity):
+        """Retorna quantity registros desde address como bytes big endian."""
+        self._check(address, quantity)
+        words = self.words[address:address + quantity]
+        if _SWAP_WORDS:
+            words.byteswap()
+        return words.tobytes()
+
+    def write_words(self, address, data):
+        """Escribe registros a partir de bytes big endian."""
+        words = array('H')
+        words.frombytes(data)
+        self._check(address, len(words))
+        if _SWAP_WORDS:
+            words.byteswap()
+        self.words[address:address + len(words)] = words
+
+    def read_coils(self, address, quantity):
+        """Retorna quantity bobinas desde address empaquetadas como en la función 1 (LSB primero)."""
+        self._check(address, quantity)
+        first = address >> 3
+        last = (address + quantity - 1) >> 3
+        bits = int.from_bytes(self.coils[first:last + 1], 'little') >> (address & 7)
+        bits &= (1 << quantity) - 1
+        return bits.to_bytes((quantity + 7) // 8, 'little')
+
+    def get_coil(self, address):
+        return (self.coils[address >> 3] >> (address & 7)) & 1
+
+    def set_coil(self, address, value):
+        if value:
+            self.coils[address >> 3] |= 1 << (address & 7)
+        else:
+            self.coils[address >> 3] &= ~(1 << (address & 7)) & 0xFF
+
+    def write_coils(self, address, bits):
+        self._check(address, len(bits))
+        for offset, bit in enumerate(bits):
+            self.set_coil(address + offset, bit)
+
+
+class FloatView:
+    """Vista float32 sobre dos registros consecutivos del banco."""
+
+    __slots__ = ('bank', 'byte_order')
+
+    def __init__(self, bank, byte_order=FLOAT_BYTE_ORDER):
+        self.bank = bank
+        self.byte_order = byte_order
+
+    def __getitem__(self, address):
+        return unpack_floats(self.bank.read_words(address, 2), self.byte_order)[0]
+
+    def __setitem__(self, address, value):
+        self.bank.write_words(address, pack_floats((value,), self.byte_order))
+
+
+def request_length(buffer, start):
+    """Longitud de la solicitud ASCII que empieza en buffer[start] (':').
+
+    Retorna None si aún faltan caracteres para saberla y 0 si la función
+    no tiene longitud conocida (se delimita por CRLF).
+    """
+    def byte_at(index):
+        pos = start + 1 + 2 * index
+        if len(buffer) < pos + 2:
+            return None
+        return int(buffer[pos:pos + 2], 16)
+
+    function_code = byte_at(1)
+    if function_code is None:
+        return None
+    if function_code in (1, 2, 3, 4, 5, 6):
+        return ascii_frame_length(6)
+    if function_code in (15, 16):
+        byte_count = byte_at(6)
+        return None if byte_count is None else ascii_frame_length(7 + byte_count)
+    if function_code == 23:
+        byte_count = byte_at(10)
+        return None if byte_count is None else ascii_frame_length(11 + byte_count)
+    return 0
+
+
+class FrameParser:
+    """Separa las solicitudes ASCII de un flujo de bytes.
+
+    La longitud de cada trama sale de su función (y del byte count en las
+    escrituras múltiples), así que las tramas concatenadas o partidas entre
+    lecturas se separan sin esperar a la siguiente ':'. Una trama que no
+    termina en CRLF donde debería se descarta y se busca la siguiente ':'.
+    """
+
     def __init__(self):
-        # Estados simulados de los registros
-        self.holding_registers = {}  # D registers
-        self.coil_states = {}       # M registers (bits)
-        
-        # Buffer para comandos parciales
-        self.command_buffer = ""
-        
+        self.buffer = bytearray()
+        self.discarded = 0
+
+    def feed(self, data):
+        """Agrega bytes recibidos y retorna la lista de tramas completas."""
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        pos = 0
+        while True:
+            start = buffer.find(b':', pos)
+            if start < 0:
+                self.discarded += len(buffer) - pos
+                pos = len(buffer)
+                break
+            self.discarded += start - pos
+            pos = start
+            try:
+                length = request_length(buffer, start)
+            except ValueError:
+                length = -1
+            if length == 0:
+                end = buffer.find(b'\r\n', start)
+                if end < 0 and len(buffer) - start < MAX_ASCII_FRAME_LENGTH:
+                    break
+                length = end + 2 - start if end >= 0 else -1
+            elif length is None:
+                break
+            elif length > 0 and len(buffer) < start + length:
+                break
+            if length < 0 or buffer[start + length - 2:start + length] != b'\r\n':
+                # Trama corrupta: resincronizar en la siguiente ':'
+                self.discarded += 1
+                pos = start + 1
+                continue
+            frames.append(bytes(buffer[start:start + length]))
+            pos = start + length
+        del buffer[:pos]
+        return frames
+
+
+class ModbusSimulator:
+    def __init__(self, slave=None, verbose=True, clock=None, seed=None):
+        # Esclavo al que responde (None: a cualquiera)
+        self.slave = slave
+        self.verbose = verbose
+        # Registros D y bobinas M, por dirección Modbus
+        self.bank = RegisterBank()
+        self.requests = 0
+        # Secuencias FC0-FC25 y perfiles de caudal/volumen sobre un reloj virtual
+        self.scenarios = ScenarioEngine(self.bank, clock, seed=seed, log=self.log)
+
+        self.handlers = {
+            1: self.handle_read_coils,
+            3: self.handle_read_holding_registers,
+            5: self.handle_write_single_coil,
+            6: self.handle_write_single_register,
+            8: self.handle_diagnostics,
+            15: self.handle_write_multiple_coils,
+            16: self.handle_write_multiple_registers,
+            23: self.handle_read_write_registers,
+        }
+
         # Inicializar valores por defecto
         self.init_default_values()
-        
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
     def init_default_values(self):
+        floats = self.bank.floats
         # Valores instantáneos (D136-D141) - Caudales Q1, Q2, Q3
-        self.holding_registers[136] = self.float_to_registers(125.5)  # Q1 flow
-        self.holding_registers[138] = self.float_to_registers(250.0)  # Q2 flow  
-        self.holding_registers[140] = self.float_to_registers(375.2)  # Q3 flow
-        
+        for index, value in ((136, 125.5), (138, 250.0), (140, 375.2)):
+            floats[resolve_address('D', index)] = value
+
         # Volúmenes instantáneos (D150-D157) - Q1, Q2, Q3, Q4
-        self.holding_registers[150] = self.float_to_registers(1000.0)  # Q1 volume
-        self.holding_registers[152] = self.float_to_registers(2000.0)  # Q2 volume
-        self.holding_registers[154] = self.float_to_registers(3000.0)  # Q3 volume
-        self.holding_registers[156] = self.float_to_registers(4000.0)  # Q4 volume
-        
-        # Valores de prueba (D112-D119) - Volúmenes de prueba
-        self.holding_registers[112] = 4500  # Q4 volume test
-        self.holding_registers[114] = 3200  # Q3 volume test
-        self.holding_registers[116] = 2100  # Q2 volume test
-        self.holding_registers[118] = 1050  # Q1 volume test
-        
+        for index, value in ((150, 1000.0), (152, 2000.0), (154, 3000.0), (156, 4000.0)):
+            floats[resolve_address('D', index)] = value
+
+        # Valores de prueba (D112-D119) - Volúmenes de prueba Q4..Q1
+        for index, value in ((112, 4500), (114, 3200), (116, 2100), (118, 1050)):
+            self.bank.words[resolve_address('D', index)] = value
+
         # Valores de configuración
-        self.holding_registers[122] = 100   # Ratio
-        self.holding_registers[144] = self.float_to_registers(375.0)  # Q3 flow test
-        
-        # Caudales de prueba (D142-D149)
-        self.holding_registers[142] = self.float_to_registers(400.0)  # Q4 flow test
-        self.holding_registers[143] = self.float_to_registers(300.0)  # Q3 flow test  
-        self.holding_registers[144] = self.float_to_registers(200.0)  # Q2 flow test
-        self.holding_registers[145] = self.float_to_registers(100.0)  # Q1 flow test
-        
-        # Estados FC (M277-M302) - Todos inician en False
-        for i in range(277, 303):
-            self.coil_states[i] = False
-            
-        # Estados de botones de prueba (M262-M269)
-        for i in range(262, 270):
-            self.coil_states[i] = False
-            
-        print("✅ Valores por defecto inicializados")
-
-    def float_to_registers(self, value):
-        """Convierte float a 2 registros (little_word format)"""
-        packed = struct.pack('>f', value)
-        # little_word: intercambiar palabras
-        return [
-            (packed[2] << 8) | packed[3],  # Low word first
-            (packed[0] << 8) | packed[1]   # High word second
-        ]
-
-    def registers_to_bytes(self, registers):
-        """Convierte lista de registros a bytes para respuesta Modbus"""
-        bytes_data = []
-        for reg in registers:
-            if isinstance(reg, list):  # Float (2 registros)
-                for r in reg:
-                    bytes_data.extend([(r >> 8) & 0xFF, r & 0xFF])
-            else:  # Int (1 registro)
-                bytes_data.extend([(reg >> 8) & 0xFF, reg & 0xFF])
-        return bytes_data
-
-    def simulate_dynamic_values(self):
-        """Simula cambios dinámicos en valores instantáneos"""
-        # Agregar pequeñas variaciones aleatorias a caudales
-        base_flows = [125.5, 250.0, 375.2]
-        for i, base in enumerate(base_flows):
-            variation = random.uniform(-5, 5)
-            new_value = base + variation
-            reg_addr = 136 + (i * 2)
-            self.holding_registers[reg_addr] = self.float_to_registers(new_value)
-        
-        # Incrementar volúmenes gradualmente
-        base_volumes = [1000.0, 2000.0, 3000.0, 4000.0]
-        for i, base in enumerate(base_volumes):
-            increment = random.uniform(0.1, 2.0)
-            reg_addr = 150 + (i * 2)
-            if reg_addr in self.holding_registers:
-                current = self.holding_registers[reg_addr]
-                if isinstance(current, list):
-                    # Convertir de vuelta a float, incrementar, y volver a convertir
-                    old_val = struct.unpack('>f', struct.pack('>HH', current[1], current[0]))[0]
-                    new_val = old_val + increment
-                    self.holding_registers[reg_addr] = self.float_to_registers(new_val)
-                    
-                    # 🔥 LOG para debugging
-                    print(f"[SIMULATOR] 📊 Volumen Q{i+1}: {old_val:.2f} → {new_val:.2f}")
-
-    def handle_read_holding_registers(self, start_addr, quantity):
+        self.bank.words[resolve_address('D', 122)] = 100  # Ratio
+
+        # Caudales de prueba (D142-D149) - Q4, Q3, Q2, Q1
+        for index, value in ((142, 400.0), (144, 300.0), (146, 200.0), (148, 100.0)):
+            floats[resolve_address('D', index)] = value
+
+        # Estados FC (M277-M302) y botones de prueba (M262-M269) inician en False
+
+        self.log("✅ Valores por defecto inicializados")
+
+    def handle_read_holding_registers(self, slave, function, pdu):
         """Función 3: Leer registros de retención"""
-        data = []
-        for addr in range(start_addr, start_addr + quantity):
-            if addr in self.holding_registers:
-                reg_value = self.holding_registers[addr]
-                if isinstance(reg_value, list):  # Float
-                    data.extend(reg_value)
-                else:  # Int
-                    data.append(reg_value)
-            else:
-                data.append(0)  # Valor por defecto
-        return data
-
-    def handle_read_coils(self, start_addr, quantity):
+        start_addr, quantity = struct.unpack_from('>HH', pdu, 1)
+        if not 1 <= quantity <= 125:
+            return self.exception(slave, function, ILLEGAL_DATA_VALUE)
+        data = self.bank.read_words(start_addr, quantity)
+        return bytes((slave, function, len(data))) + data
+
+    def handle_read_coils(self, slave, function, pdu):
         """Función 1: Leer bobinas"""
-        bits = []
-        for addr in range(start_addr, start_addr + quantity):
-            if addr in self.coil_states:
-                bits.append(1 if self.coil_states[addr] else 0)
-            else:
-                bits.append(0)
-        
-        # Convertir bits a bytes
-        bytes_data = []
-        for i in range(0, len(bits), 8):
-            byte_val = 0
-            for j in range(8):
-                if i + j < len(bits):
-                    byte_val |= (bits[i + j] << j)
-            bytes_data.append(byte_val)
-        
-        return bytes_data
-
-    def handle_write_single_coil(self, addr, value):
+        start_addr, quantity = struct.unpack_from('>HH', pdu, 1)
+        if not 1 <= quantity <= 2000:
+            return self.exception(slave, function, ILLEGAL_DATA_VALUE)
+        data = self.bank.read_coils(start_addr, quantity)
+        return bytes((slave, function, len(data))) + data
+
+    def handle_write_single_coil(self, slave, function, pdu):
         """Función 5: Escribir bobina simple"""
-        self.coil_states[addr] = (value == 0xFF00)
-        print(f"🔧 M{addr} = {self.coil_states[addr]}")
-        
-        # Simular activación de estados FC según los botones presionados
-        self.simulate_fc_states(addr)
-        
-        return True
-
-    def handle_write_single_register(self, addr, value):
+        addr, value = struct.unpack_from('>HH', pdu, 1)
+        if value not in (0x0000, 0xFF00):
+            return self.exception(slave, function, ILLEGAL_DATA_VALUE)
+        self.bank.set_coil(addr, value == 0xFF00)
+        self.log(f"🔧 M@{addr:04X} = {value == 0xFF00}")
+
+        # Los botones de la app lanzan su escenario (secuencia de FC)
+        self.scenarios.trigger(addr - M_BASE, value == 0xFF00)
+        return bytes((slave,)) + bytes(pdu[:5])
+
+    def handle_write_multiple_coils(self, slave, function, pdu):
+        """Función 15: Escribir múltiples bobinas"""
+        addr, quantity, byte_count = struct.unpack_from('>HHB', pdu, 1)
+        coil_bytes = pdu[6:6 + byte_count]
+        if not 1 <= quantity <= 1968 or len(coil_bytes) != (quantity + 7) // 8:
+            return self.exception(slave, function, ILLEGAL_DATA_VALUE)
+        bits = [(coil_bytes[i >> 3] >> (i & 7)) & 1 for i in range(quantity)]
+        self.bank.write_coils(addr, bits)
+        for offset, bit in enumerate(bits):
+            self.scenarios.trigger(addr + offset - M_BASE, bit)
+        self.log(f"🔧 M@{addr:04X} x{quantity} = {bits}")
+        return bytes((slave,)) + bytes(pdu[:5])
+
+    def handle_write_single_register(self, slave, function, pdu):
         """Función 6: Escribir registro simple"""
-        self.holding_registers[addr] = value
-        print(f"📝 D{addr} = {value}")
-        return True
+        addr, value = struct.unpack_from('>HH', pdu, 1)
+        self.bank.write_words(addr, pdu[3:5])
+        self.log(f"📝 D@{addr:04X} = {value}")
+        return bytes((slave,)) + bytes(pdu[:5])
 
-    def handle_write_multiple_registers(self, addr, values):
+    def handle_write_multiple_registers(self, slave, function, pdu):
         """Función 16: Escribir múltiples registros"""
-        for i, value in enumerate(values):
-            self.holding_registers[addr + i] = value
-            print(f"📝 D{addr + i} = {value}")
-        return True
-
-    def simulate_fc_states(self, button_addr):
-        """Simula activación de estados FC según botones presionados"""
-        fc_mapping = {
-            271: [0],      # Modo automático -> FC0
-            264: [2, 3, 4, 5, 6],    # Caudal Q1 -> FC2-FC6 (secuencia Q1)
-            265: [7, 8, 9, 10, 11],  # Caudal Q2 -> FC7-FC11 (secuencia Q2)
-            266: [12, 13, 14, 15],   # Caudal Q3 -> FC12-FC15 (secuencia Q3)
-            267: [16, 17, 18, 19],   # Caudal Q4 -> FC16-FC19 (secuencia Q4)
-            268: [20, 21],           # Hidrostática -> FC20-FC21
-            269: [1, 22, 23],        # Iniciar prueba -> FC1, FC22, FC23
-        }
-        
-        if button_addr in fc_mapping:
-            # Activar secuencialmente los FC correspondientes
-            def activate_sequence():
-                for fc_num in fc_mapping[button_addr]:
-                    fc_addr = 277 + fc_num
-                    self.coil_states[fc_addr] = True
-                    print(f"✅ FC{fc_num} (M{fc_addr}) activado")
-                    time.sleep(0.5)  # Simular tiempo entre activaciones
-                    
-                    # Desactivar después de un tiempo
-                    time.sleep(1.0)
-                    self.coil_states[fc_addr] = False
-                    print(f"⏹️ FC{fc_num} (M{fc_addr}) desactivado")
-            
-            # Ejecutar secuencia en hilo separado para no bloquear
-            import threading
-            threading.Thread(target=activate_sequence, daemon=True).start()
-
-    def calculate_lrc(self, data_bytes):
-        """Calcula LRC para respuesta Modbus ASCII"""
-        checksum = sum(data_bytes) % 256
-        complement = (0xFF - checksum) + 1
-        return complement & 0xFF
-
-    def create_response(self, slave_addr, function_code, data_bytes):
-        """Crea respuesta Modbus ASCII completa"""
-        response_data = [slave_addr, function_code] + data_bytes
-        lrc = self.calculate_lrc(response_data)
-        
-        hex_string = ''.join(f'{b:02X}' for b in response_data) + f'{lrc:02X}'
-        return f":{hex_string}\r\n"
-
-    # 🔥 NUEVA FUNCIÓN PARA SEPARAR COMANDOS MÚLTIPLES
-    def extract_commands(self, raw_data):
-        """Extrae comandos individuales de datos concatenados"""
-        self.command_buffer += raw_data
-        commands = []
-        
-        while ':' in self.command_buffer:
-            start_pos = self.command_buffer.find(':')
-            if start_pos == -1:
-                break
-                
-            # Buscar el final del comando (siguiente ':' o fin de buffer)
-            next_start = self.command_buffer.find(':', start_pos + 1)
-            
-            if next_start == -1:
-                # No hay siguiente comando, usar todo el buffer restante
-                if len(self.command_buffer) >= start_pos + 17:  # Comando mínimo completo
-                    command = self.command_buffer[start_pos:start_pos + 17]
-                    commands.append(command)
-                    self.command_buffer = self.command_buffer[start_pos + 17:]
-                else:
-                    # Comando incompleto, esperar más datos
-                    break
-            else:
-                # Hay siguiente comando
-                command = self.command_buffer[start_pos:next_start]
-                if len(command) >= 17:  # Comando completo
-                    commands.append(command)
-                self.command_buffer = self.command_buffer[next_start:]
-        
-        return commands
-
-    def parse_command(self, command):
-        """Parsea comando Modbus ASCII recibido"""
+        addr, quantity, byte_count = struct.unpack_from('>HHB', pdu, 1)
+        values = pdu[6:6 + byte_count]
+        if not 1 <= quantity <= 123 or byte_count != 2 * quantity or len(values) != byte_count:
+            return self.exception(slave, function, ILLEGAL_DATA_VALUE)
+        self.bank.write_words(addr, values)
+        self.log(f"📝 D@{addr:04X} x{quantity} = {bytes(values).hex().upper()}")
+        return bytes((slave,)) + bytes(pdu[:5])
+
+    def handle_read_write_registers(self, slave, function, pdu):
+        """Función 23: Escribir y leer registros (la escritura se ejecuta antes que la lectura)"""
+        read_addr, read_quantity, write_addr, write_quantity, byte_count = struct.unpack_from('>HHHHB', pdu, 1)
+        values = pdu[10:10 + byte_count]
+        if (not 1 <= read_quantity <= 125 or not 1 <= write_quantity <= 121
+                or byte_count != 2 * write_quantity or len(values) != byte_count):
+            return self.exception(slave, function, ILLEGAL_DATA_VALUE)
+        self.bank.write_words(write_addr, values)
+        data = self.bank.read_words(read_addr, read_quantity)
+        return bytes((slave, function, len(data))) + data
+
+    def handle_diagnostics(self, slave, function, pdu):
+        """Función 8: Diagnóstico; solo la subfunción 0 (eco)"""
+        if struct.unpack_from('>H', pdu, 1)[0] != 0:
+            return self.exception(slave, function, ILLEGAL_FUNCTION)
+        return bytes((slave,)) + bytes(pdu)
+
+    @staticmethod
+    def exception(slave, function, code):
+        return bytes((slave, function | 0x80, code))
+
+    def handle_request(self, data):
+        """Atiende esclavo + PDU (sin LRC/CRC) y retorna la respuesta en el mismo formato.
+
+        Retorna None si la solicitud no es para este esclavo o es broadcast
+        (esclavo 0 ejecuta la escritura pero no responde).
+        """
+        slave = data[0]
+        if self.slave is not None and slave not in (0, self.slave):
+            return None
+        self.requests += 1
+        self.scenarios.tick()
+        pdu = memoryview(data)[1:]
+        function = pdu[0]
+        handler = self.handlers.get(function)
+        if handler is None:
+            response = self.exception(slave, function, ILLEGAL_FUNCTION)
+        else:
+            try:
+                response = handler(slave, function, pdu)
+            except IndexError:
+                response = self.exception(slave, function, ILLEGAL_DATA_ADDRESS)
+            except struct.error:
+                response = self.exception(slave, function, ILLEGAL_DATA_VALUE)
+        return None if slave == 0 else response
+
+    def handle_frame(self, frame):
+        """Atiende una trama ASCII completa y retorna la respuesta ASCII (bytes) o None.
+
+        Es la interfaz que usa services.transports.LoopbackTransport para
+        correr la app contra el simulador sin puerto COM. Como el PLC, no
+        responde a tramas con LRC o formato inválido.
+        """
         try:
-            if not command.startswith(':'):
-                return None
-            
-            # Limpiar comando (quitar espacios, \r, \n)
-            clean_command = command.strip().replace('\r', '').replace('\n', '')
-            
-            if len(clean_command) < 9:  # Comando muy corto
-                return None
-                
-            hex_data = clean_command[1:-2]  # Quitar ':' y LRC (últimos 2 chars)
-            
-            # 🔥 VERIFICAR QUE SOLO CONTIENE CARACTERES HEX VÁLIDOS
-            if not all(c in '0123456789ABCDEFabcdef' for c in hex_data):
-                print(f"❌ Comando contiene caracteres no hexadecimales: {hex_data}")
-                return None
-                
-            data_bytes = bytes.fromhex(hex_data)
-            
-            if len(data_bytes) < 2:
-                return None
-                
-            slave_addr = data_bytes[0]
-            function_code = data_bytes[1]
-            
-            if function_code == 3:  # Read Holding Registers
-                if len(data_bytes) >= 6:
-                    start_addr = (data_bytes[2] << 8) | data_bytes[3]
-                    quantity = (data_bytes[4] << 8) | data_bytes[5]
-                    return {
-                        'slave': slave_addr,
-                        'function': function_code,
-                        'start_addr': start_addr,
-                        'quantity': quantity
-                    }
-                    
-            elif function_code == 1:  # Read Coils
-                if len(data_bytes) >= 6:
-                    start_addr = (data_bytes[2] << 8) | data_bytes[3]
-                    quantity = (data_bytes[4] << 8) | data_bytes[5]
-                    return {
-                        'slave': slave_addr,
-                        'function': function_code,
-                        'start_addr': start_addr,
-                        'quantity': quantity
-                    }
-                    
-            elif function_code == 5:  # Write Single Coil
-                if len(data_bytes) >= 6:
-                    addr = (data_bytes[2] << 8) | data_bytes[3]
-                    value = (data_bytes[4] << 8) | data_bytes[5]
-                    return {
-                        'slave': slave_addr,
-                        'function': function_code,
-                        'addr': addr,
-                        'value': value
-                    }
-                    
-            elif function_code == 6:  # Write Single Register
-                if len(data_bytes) >= 6:
-                    addr = (data_bytes[2] << 8) | data_bytes[3]
-                    value = (data_bytes[4] << 8) | data_bytes[5]
-                    return {
-                        'slave': slave_addr,
-                        'function': function_code,
-                        'addr': addr,
-                        'value': value
-                    }
-                    
-            elif function_code == 16:  # Write Multiple Registers
-                if len(data_bytes) >= 7:
-                    addr = (data_bytes[2] << 8) | data_bytes[3]
-                    quantity = (data_bytes[4] << 8) | data_bytes[5]
-                    byte_count = data_bytes[6]
-                    values = []
-                    for i in range(0, byte_count, 2):
-                        if 7 + i + 1 < len(data_bytes):
-                            val = (data_bytes[7 + i] << 8) | data_bytes[7 + i + 1]
-                            values.append(val)
-                    return {
-                        'slave': slave_addr,
-                        'function': function_code,
-                        'addr': addr,
-                        'quantity': quantity,
-                        'values': values
-                    }
-                    
-        except Exception as e:
-            print(f"❌ Error parseando comando '{command}': {e}")
+            data = decode_ascii_frame(frame)
+        except ValueError as e:
+            self.log(f"❌ Trama inválida {bytes(frame)!r}: {e}")
             return None
+        response = self.handle_request(data)
+        return None if response is None else encode_ascii_frame(response)
+
 
-    def process_command(self, parsed_cmd):
-        """Procesa comando parseado y genera respuesta"""
-        if not parsed_cmd:
-            return ":010182B6\r\n"  # Error response
-            
-        slave = parsed_cmd['slave']
-        function = parsed_cmd['function']
-        
+class SimulatedBus:
+    """Varios PLC simulados en el mismo bus, uno por número de esclavo."""
+
+    def __init__(self, slaves, verbose=False, clock=None, seed=None):
+        self.simulators = {slave: ModbusSimulator(slave, verbose, clock, seed) for slave in slaves}
+
+    def handle_request(self, data):
+        if data[0] == 0:
+            for simulator in self.simulators.values():
+                simulator.handle_request(data)
+            return None
+        simulator = self.simulators.get(data[0])
+        return simulator.handle_request(data) if simulator else None
+
+    def handle_frame(self, frame):
         try:
-            if function == 3:  # Read Holding Registers
-                data = self.handle_read_holding_registers(
-                    parsed_cmd['start_addr'], 
-                    parsed_cmd['quantity']
-                )
-                byte_count = len(data) * 2
-                data_bytes = [byte_count] + self.registers_to_bytes(data)
-                
-                # 🔥 LOG ESPECIAL PARA VOLÚMENES INSTANTÁNEOS
-                if parsed_cmd['start_addr'] == 150 and parsed_cmd['quantity'] == 4:
-                    print(f"[SIMULATOR] 📊 Enviando volúmenes instantáneos:")
-                    for i in range(4):
-                        addr = 150 + (i * 2)
-                        if addr in self.holding_registers:
-                            vol_data = self.holding_registers[addr]
-                            if isinstance(vol_data, list):
-                                val = struct.unpack('>f', struct.pack('>HH', vol_data[1], vol_data[0]))[0]
-                                print(f"  📊 Q{i+1} Volume: {val:.2f}")
-                
-                return self.create_response(slave, function, data_bytes)
-                
-            elif function == 1:  # Read Coils
-                data = self.handle_read_coils(
-                    parsed_cmd['start_addr'],
-                    parsed_cmd['quantity']
-                )
-                byte_count = len(data)
-                data_bytes = [byte_count] + data
-                return self.create_response(slave, function, data_bytes)
-                
-            elif function == 5:  # Write Single Coil
-                success = self.handle_write_single_coil(
-                    parsed_cmd['addr'],
-                    parsed_cmd['value']
-                )
-                if success:
-                    # Echo back the command for write confirmation
-                    data_bytes = [
-                        (parsed_cmd['addr'] >> 8) & 0xFF,
-                        parsed_cmd['addr'] & 0xFF,
-                        (parsed_cmd['value'] >> 8) & 0xFF,
-                        parsed_cmd['value'] & 0xFF
-                    ]
-                    return self.create_response(slave, function, data_bytes)
-                    
-            elif function == 6:  # Write Single Register
-                success = self.handle_write_single_register(
-                    parsed_cmd['addr'],
-                    parsed_cmd['value']
-                )
-                if success:
-                    data_bytes = [
-                        (parsed_cmd['addr'] >> 8) & 0xFF,
-                        parsed_cmd['addr'] & 0xFF,
-                        (parsed_cmd['value'] >> 8) & 0xFF,
-                        parsed_cmd['value'] & 0xFF
-                    ]
-                    return self.create_response(slave, function, data_bytes)
-                    
-            elif function == 16:  # Write Multiple Registers
-                success = self.handle_write_multiple_registers(
-                    parsed_cmd['addr'],
-                    parsed_cmd['values']
-                )
-                if success:
-                    data_bytes = [
-                        (parsed_cmd['addr'] >> 8) & 0xFF,
-                        parsed_cmd['addr'] & 0xFF,
-                        (parsed_cmd['quantity'] >> 8) & 0xFF,
-                        parsed_cmd['quantity'] & 0xFF
-                    ]
-                    return self.create_response(slave, function, data_bytes)
-                    
-        except Exception as e:
-            print(f"❌ Error procesando comando: {e}")
-            
-        return ":010182B6\r\n"  # Error response por defecto
+            data = decode_ascii_frame(frame)
+        except ValueError:
+            return None
+        response = self.handle_request(data)
+        return None if response is None else encode_ascii_frame(response)
+
+
+def open_pty_simulator(simulator=None):
+    """Atiende al simulador en un par pty (solo POSIX) y retorna (simulador, dispositivo).
+
+    simulator puede ser cualquier objeto con handle_frame (p. ej. un FaultInjector).
+
+    El dispositivo ('/dev/pts/N') se abre como un puerto serie normal:
+    ModbusService().connect(dispositivo).
+    """
+    import pty
+    import tty
+    simulator = simulator or ModbusSimulator()
+    master, slave = pty.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    device = os.ttyname(slave)
+
+    def serve():
+        parser = FrameParser()
+        try:
+            while True:
+                # os.read bloquea hasta que llegan datos: sin sondeo
+                for frame in parser.feed(os.read(master, MAX_ASCII_FRAME_LENGTH)):
+                    try:
+                        response = simulator.handle_frame(frame)
+                    except ConnectionError:
+                        # Desconexión simulada (tests/fault_injection.py): el PLC no contesta
+                        response = None
+                    if response:
+                        os.write(master, response)
+        except OSError as e:
+            print(f"❌ Simulador pty detenido: {e}")
+
+    threading.Thread(target=serve, daemon=True).start()
+    print(f"✅ COM Simulator activo en {device}")
+    return simulator, device
+
 
 def run_simulator():
+    # pyserial solo hace falta para el modo con puerto COM emparejado
+    import serial
     simulator = ModbusSimulator()
-    
+    # Los valores avanzan con el reloj virtual en cada solicitud atendida
+    simulator.scenarios.start(DEFAULT_SCENARIO)
+    parser = FrameParser()
+
     try:
         ser = serial.Serial(
             port=SIMULATED_PORT,
@@ -426,42 +439,20 @@ def run_simulator():
             bytesize=serial.SEVENBITS,
             parity=serial.PARITY_EVEN,
             stopbits=serial.STOPBITS_ONE,
-            timeout=1
+            # La lectura bloquea hasta que llega un byte
+            timeout=None
         )
         print(f"✅ COM Simulator activo en {SIMULATED_PORT}")
         print("📊 Simulando datos en tiempo real...")
-        
-        last_dynamic_update = time.time()
-        
+
         while True:
-            # Actualizar valores dinámicos cada 2 segundos
-            if time.time() - last_dynamic_update > 2:
-                simulator.simulate_dynamic_values()
-                last_dynamic_update = time.time()
-            
-            # Procesar comandos recibidos
-            if ser.in_waiting:
-                raw_data = ser.read(500).decode(errors='ignore')
-                if not raw_data:
-                    continue
-
-                print(f"📥 Datos brutos recibidos: {repr(raw_data)}")
-                
-                # 🔥 EXTRAER COMANDOS INDIVIDUALES
-                commands = simulator.extract_commands(raw_data)
-                
-                for command in commands:
-                    print(f"📥 Procesando comando: {command}")
-                    
-                    # Parsear y procesar comando
-                    parsed_cmd = simulator.parse_command(command)
-                    response = simulator.process_command(parsed_cmd)
-                    
-                    print(f"📤 Enviando: {response.strip()}")
-                    ser.write(response.encode('ascii'))
-                    time.sleep(0.01)  # Pequeña pausa entre respuestas
-
-            time.sleep(0.05)
+            raw_data = ser.read(ser.in_waiting or 1)
+            for frame in parser.feed(raw_data):
+                print(f"📥 Procesando comando: {frame!r}")
+                response = simulator.handle_frame(frame)
+                if response:
+                    print(f"📤 Enviando: {response.strip()!r}")
+                    ser.write(response)
 
     except Exception as e:
         print(f"❌ Error en simulador: {e}")
@@ -474,7 +465,7 @@ if __name__ == "__main__":
     print("   - Lectura/escritura de valores de prueba")
     print("   - Estados FC (M277-M302)")
     print("   - Botones de control (M262-M269)")
-    print("   - Valores dinámicos con variaciones aleatorias")
+    print("   - Escenarios FC0-FC25 y perfiles de caudal (tests/simulator_scenarios.py)")
     print("   - Manejo de comandos concatenados")
     print()
-    run_simulator()
\ No newline at end of file
+    run_simulator()
@@ -0,0 +1,134 @@
+import collections
+import random
+import time
+from utils.modbus_utils import encode_ascii_frame, HEX_PAIRS
+
+# Código de excepción por defecto: 06 (esclavo ocupado)
+SLAVE_DEVICE_BUSY = 0x06
+
+HEX_DIGITS = b'0123456789ABCDEF'
+
+
+class FaultProfile:
+    """Condiciones de línea: latencia/jitter (s) y probabilidad (0-1) de cada falla por solicitud.
+
+    drop_response  el PLC no contesta
+    drop_byte      se pierde un carácter de la respuesta
+    flip_hex       un carácter HEX llega cambiado (el LRC ya no cuadra)
+    bad_lrc        la respuesta llega con el LRC equivocado
+    duplicate      la respuesta se repite y llega delante de la siguiente
+    exception      el PLC contesta con una excepción (exception_code)
+    disconnect     el enlace cae durante disconnect_duration segundos
+    """
+
+    __slots__ = (
+        'latency', 'jitter', 'drop_response', 'drop_byte', 'flip_hex', 'bad_lrc',
+        'duplicate', 'exception', 'exception_code', 'disconnect', 'disconnect_duration'
+    )
+
+    def __init__(self, latency=0.0, jitter=0.0, drop_response=0.0, drop_byte=0.0, flip_hex=0.0,
+                 bad_lrc=0.0, duplicate=0.0, exception=0.0, exception_code=SLAVE_DEVICE_BUSY,
+                 disconnect=0.0, disconnect_duration=1.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_response = drop_response
+        self.drop_byte = drop_byte
+        self.flip_hex = flip_hex
+        self.bad_lrc = bad_lrc
+        self.duplicate = duplicate
+        self.exception = exception
+        self.exception_code = exception_code
+        self.disconnect = disconnect
+        self.disconnect_duration = disconnect_duration
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**values)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+# Perfiles de referencia para comparar políticas de reintento, timeouts y tramas
+PROFILES = {
+    'clean': FaultProfile(),
+    'slow_plc': FaultProfile(latency=0.02, jitter=0.03),
+    'noisy_line': FaultProfile(latency=0.005, jitter=0.005, drop_byte=0.01, flip_hex=0.02, bad_lrc=0.01),
+    'busy_plc': FaultProfile(latency=0.01, jitter=0.02, exception=0.05),
+    'lossy_link': FaultProfile(drop_response=0.05, duplicate=0.02),
+    'flaky_adapter': FaultProfile(drop_response=0.01, disconnect=0.002, disconnect_duration=2.0),
+}
+
+
+class FaultInjector:
+    """Inyecta fallas entre el cliente y un simulador (cualquier objeto con handle_frame).
+
+    Se usa en lugar del simulador: ModbusService().connect(FaultInjector(sim,
+    'noisy_line', seed=1), mode=MODE_LOOPBACK) o open_pty_simulator(injector).
+    Cada falla se sortea por solicitud con un generador sembrado, así un
+    mismo perfil y semilla producen la misma secuencia de fallas. stats
+    cuenta las fallas inyectadas.
+    """
+
+    def __init__(self, responder, profile=None, seed=None):
+        self.responder = responder
+        if isinstance(profile, str):
+            profile = PROFILES[profile]
+        self.profile = profile or FaultProfile()
+        self.random = random.Random(seed)
+        self.stats = collections.Counter()
+        self._down_until = 0.0
+        self._stale = None
+
+    def _roll(self, probability):
+        return probability > 0 and self.random.random() < probability
+
+    def handle_frame(self, frame):
+        profile = self.profile
+        self.stats['requests'] += 1
+        now = time.monotonic()
+        if now < self._down_until:
+            self.stats['while_disconnected'] += 1
+            raise ConnectionError("Simulated link disconnect")
+        if self._roll(profile.disconnect):
+            self.stats['disconnect'] += 1
+            self._down_until = now + profile.disconnect_duration
+            raise ConnectionError("Simulated link disconnect")
+
+        response = self.responder.handle_frame(frame)
+        delay = profile.latency + (self.random.uniform(0, profile.jitter) if profile.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+        if response is None:
+            return None
+        if self._roll(profile.drop_response):
+            self.stats['drop_response'] += 1
+            return None
+        if self._roll(profile.exception):
+            self.stats['exception'] += 1
+            slave, function = int(response[1:3], 16), int(response[3:5], 16)
+            response = encode_ascii_frame(bytes((slave, function | 0x80, profile.exception_code)))
+        if self._roll(profile.bad_lrc):
+            self.stats['bad_lrc'] += 1
+            lrc = int(response[-4:-2], 16)
+            response = response[:-4] + HEX_PAIRS[(lrc + 1) & 0xFF] + b'\r\n'
+        if self._roll(profile.flip_hex):
+            self.stats['flip_hex'] += 1
+            response = self._flip_hex(response)
+        if self._roll(profile.drop_byte):
+            self.stats['drop_byte'] += 1
+            position = self.random.randrange(len(response))
+            response = response[:position] + response[position + 1:]
+
+        # Un duplicado llega con retraso, delante de la respuesta siguiente
+        stale, self._stale = self._stale, None
+        if self._roll(profile.duplicate):
+            self.stats['duplicate'] += 1
+            self._stale = response
+        return stale + response if stale else response
+
+    def _flip_hex(self, response):
+        position = self.random.randrange(1, len(response) - 2)
+        current = response[position]
+        replacement = self.random.choice([digit for digit in HEX_DIGITS if digit != current])
+        return response[:position] + bytes((replacement,)) + response[position + 1:]
@@ -0,0 +1,65 @@
+import os
+import socketserver
+import struct
+import sys
+import threading
+
+# Permite ejecutarlo directamente: python tests/modbus_tcp_server.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.com_simulator import ModbusSimulator
+
+# Servidor Modbus TCP local que responde con ModbusSimulator (sin hardware)
+HOST = '127.0.0.1'
+PORT = 5020
+
+
+class ModbusTcpHandler(socketserver.BaseRequestHandler):
+    def _recv_exact(self, length):
+        data = b''
+        while len(data) < length:
+            chunk = self.request.recv(length - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def handle(self):
+        server = self.server
+        while True:
+            header = self._recv_exact(7)
+            if header is None:
+                return
+            tid, pid, length, unit = struct.unpack('>HHHB', header)
+            pdu = self._recv_exact(length - 1)
+            if pdu is None:
+                return
+            with server.simulator_lock:
+                data = server.simulator.handle_request(bytes([unit]) + pdu)
+            if data is None:
+                continue
+            reply = struct.pack('>HHHB', tid, pid, len(data), data[0]) + data[1:]
+            self.request.sendall(reply)
+
+
+class ModbusTcpServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address=(HOST, PORT), simulator=None):
+        super().__init__(address, ModbusTcpHandler)
+        self.simulator = simulator or ModbusSimulator()
+        self.simulator_lock = threading.Lock()
+
+
+def start_tcp_server(host=HOST, port=PORT, simulator=None):
+    """Arranca el servidor en un hilo y lo retorna (port=0 elige un puerto libre)."""
+    server = ModbusTcpServer((host, port), simulator)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    print(f"🚀 Servidor Modbus TCP simulado en {HOST}:{PORT}")
+    with ModbusTcpServer() as tcp_server:
+        tcp_server.serve_forever()
@@ -0,0 +1,309 @@
+import json
+import random
+import threading
+import time
+from utils.address_utils import resolve_address
+from utils.poll_map import POINTS_BY_NAME
+
+# Los caudales se expresan por minuto: volumen += caudal * dt / FLOW_TIME_UNIT
+FLOW_TIME_UNIT = 60.0
+
+LINES = ('q1', 'q2', 'q3', 'q4')
+
+# Caudal nominal de cada línea durante calibración y prueba
+NOMINAL_FLOWS = {'q1': 125.5, 'q2': 250.0, 'q3': 375.2, 'q4': 500.0}
+
+# Primer bit de los estados FC0-FC25
+FC_BASE = 277
+
+
+def _line_phases(line, fcs, purge=True, calibration=20.0, test=60.0):
+    """Fases de una línea: [purga], calibración, fin de calibración, prueba y fin de prueba."""
+    flow = NOMINAL_FLOWS[line]
+    fcs = iter(fcs)
+    phases = []
+    if purge:
+        phases.append({'name': f'purge_{line}', 'fc': (next(fcs),), 'duration': 10.0,
+                       'flows': {line: (0.0, flow)}})
+    phases += [
+        {'name': f'calibrate_{line}', 'fc': (next(fcs),), 'duration': calibration,
+         'flows': {line: flow}, 'noise': 2.0},
+        {'name': f'calibrated_{line}', 'fc': (next(fcs),), 'duration': 1.0, 'flows': {line: flow}},
+        {'name': f'test_{line}', 'fc': (next(fcs),), 'duration': test,
+         'flows': {line: flow}, 'noise': 1.0, 'reset_volumes': (line,)},
+        {'name': f'tested_{line}', 'fc': (next(fcs),), 'duration': 2.0, 'flows': {line: (flow, 0.0)}},
+    ]
+    return phases
+
+
+# Escenarios declarados como datos: lista de fases. Cada fase admite
+#   fc             FC activos mientras dura (los demás se apagan)
+#   duration       segundos virtuales (None: hasta que empiece otro escenario)
+#   flows          caudal por línea: constante o rampa [inicio, fin]; las
+#                  líneas no indicadas quedan en 0
+#   noise          amplitud del ruido sobre el caudal mostrado (no se integra)
+#   reset_volumes  líneas cuyo volumen vuelve a 0 al empezar la fase
+#   coils          {'M262': 1} y registers {'D122': 100} escritos al empezar
+SCENARIOS = {
+    'select_mode': [{'name': 'select_mode', 'fc': (0,), 'duration': 2.0}],
+    'start_test': [
+        {'name': 'setup', 'fc': (1,), 'duration': 2.0},
+        {'name': 'drive_off', 'fc': (22,), 'duration': 2.0},
+        {'name': 'waiting', 'fc': (23,), 'duration': 2.0},
+    ],
+    'q1': _line_phases('q1', range(2, 7)),
+    'q2': _line_phases('q2', range(7, 12)),
+    'q3': _line_phases('q3', range(12, 16), purge=False),
+    'q4': _line_phases('q4', range(16, 20), purge=False),
+    'hydrostatic': [
+        {'name': 'hydrostatic', 'fc': (20,), 'duration': 30.0},
+        {'name': 'close_inlet', 'fc': (21,), 'duration': 5.0},
+    ],
+    'maintenance': [
+        {'name': 'maintenance', 'fc': (24,), 'duration': 10.0},
+        {'name': 'maintenance_end', 'fc': (25,), 'duration': 1.0},
+    ],
+    # Fallas
+    'emergency_stop': [{'name': 'emergency_stop', 'fc': (), 'duration': None, 'coils': {'M262': 1}}],
+    'reset': [{'name': 'reset', 'fc': (23,), 'duration': 2.0, 'coils': {'M262': 0}}],
+    'flow_loss_q1': [
+        {'name': 'test_q1', 'fc': (5,), 'duration': 20.0, 'flows': {'q1': NOMINAL_FLOWS['q1']},
+         'reset_volumes': ('q1',)},
+        {'name': 'flow_loss_q1', 'fc': (5,), 'duration': 5.0, 'flows': {'q1': (NOMINAL_FLOWS['q1'], 0.0)}},
+        {'name': 'stalled_q1', 'fc': (5,), 'duration': None},
+    ],
+    # Marcha libre: caudales nominales con ruido y volúmenes creciendo (modo demo)
+    'free_run': [{'name': 'free_run', 'fc': (), 'duration': None,
+                  'flows': {line: NOMINAL_FLOWS[line] for line in LINES}, 'noise': 5.0}],
+}
+
+# Lote completo de un medidor: selección, datos, Q1-Q4, hidrostática y espera
+SCENARIOS['batch'] = (
+    SCENARIOS['select_mode'] + SCENARIOS['start_test'][:1]
+    + SCENARIOS['q1'] + SCENARIOS['q2'] + SCENARIOS['q3'] + SCENARIOS['q4']
+    + SCENARIOS['hydrostatic'] + SCENARIOS['start_test'][1:]
+)
+
+# Bobinas M que, al ponerse en 1, lanzan un escenario (botones de la app)
+TRIGGERS = {
+    262: 'emergency_stop',
+    263: 'reset',
+    264: 'q1',
+    265: 'q2',
+    266: 'q3',
+    267: 'q4',
+    268: 'hydrostatic',
+    269: 'start_test',
+    271: 'select_mode',
+}
+
+
+def load_scenarios(path):
+    """Lee escenarios adicionales de un JSON {nombre: [fases]} y los retorna."""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def scenario_duration(phases):
+    """Duración total (s virtuales) de un escenario; None si alguna fase no termina."""
+    total = 0.0
+    for phase in phases:
+        if phase.get('duration') is None:
+            return None
+        total += phase['duration']
+    return total
+
+
+class VirtualClock:
+    """Reloj del simulador en segundos virtuales.
+
+    Con speed avanza speed veces más rápido que el reloj real
+    (time.monotonic). Con speed=None solo avanza con advance(), para
+    pruebas deterministas.
+    """
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self._origin = time.monotonic()
+        self._offset = 0.0
+
+    def now(self):
+        if self.speed is None:
+            return self._offset
+        return self._offset + (time.monotonic() - self._origin) * self.speed
+
+    def advance(self, seconds):
+        self._offset += seconds
+
+
+class ScenarioEngine:
+    """Ejecuta escenarios sobre el banco de registros del simulador.
+
+    No usa hilos: el estado se recalcula en tick(), que el simulador llama
+    antes de atender cada solicitud. Los volúmenes se integran exactamente
+    sobre los perfiles de caudal entre dos ticks, así que el resultado no
+    depende de cada cuánto se sondee.
+    """
+
+    def __init__(self, bank, clock=None, scenarios=None, seed=None, log=None):
+        self.bank = bank
+        self.clock = clock or VirtualClock()
+        self.scenarios = dict(SCENARIOS, **(scenarios or {}))
+        self.random = random.Random(seed)
+        self.log = log or (lambda message: None)
+        self.flow_registers = self._registers('flow')
+        self.volume_registers = self._registers('volume')
+        # Escenarios terminados: (nombre, inicio, fin) en segundos virtuales
+        self.completed = []
+        self._lock = threading.Lock()
+        self._name = None
+        self._phases = ()
+        self._index = 0
+        self._phase_start = 0.0
+        self._scenario_start = 0.0
+        self._last = 0.0
+
+    @staticmethod
+    def _registers(kind):
+        registers = {}
+        for line in LINES:
+            point = POINTS_BY_NAME.get(f'{kind}_{line}')
+            if point:
+                registers[line] = resolve_address(point['device'], point['index'])
+        return registers
+
+    @property
+    def active(self):
+        self.tick()
+        return self._name
+
+    @property
+    def phase(self):
+        self.tick()
+        with self._lock:
+            return self._phases[self._index]['name'] if self._name else None
+
+    def start(self, scenario):
+        """Lanza un escenario por nombre o como lista de fases; reemplaza al activo."""
+        phases = self.scenarios[scenario] if isinstance(scenario, str) else scenario
+        name = scenario if isinstance(scenario, str) else 'custom'
+        with self._lock:
+            now = self.clock.now()
+            if self._name:
+                self._advance(now)
+            if self._name:
+                self._set_fcs(self._phases[self._index], False)
+            self._name = name
+            self._phases = phases
+            self._scenario_start = now
+            self._last = now
+            self._enter(0, now)
+        self.log(f"[SCENARIO] ▶️ {name}")
+
+    def trigger(self, coil_index, value):
+        """Botón M escrito por la app: lanza el escenario asociado si se activó."""
+        name = TRIGGERS.get(coil_index)
+        if value and name in self.scenarios:
+            self.start(name)
+
+    def stop(self):
+        with self._lock:
+            now = self.clock.now()
+            if self._name:
+                self._advance(now)
+            if self._name:
+                self._finish(now)
+
+    def remaining(self):
+        """Segundos virtuales hasta que termine el escenario activo (None si no termina)."""
+        with self._lock:
+            if not self._name:
+                return 0.0
+            rest = scenario_duration(self._phases[self._index:])
+            if rest is None:
+                return None
+            return max(0.0, rest - (self.clock.now() - self._phase_start))
+
+    def tick(self):
+        if self._name is None:
+            return
+        with self._lock:
+            if self._name is not None:
+                self._advance(self.clock.now())
+
+    # --- Internos (con _lock tomado) ---
+
+    def _enter(self, index, at):
+        self._index = index
+        self._phase_start = at
+        phase = self._phases[index]
+        self._set_fcs(phase, True)
+        for line in phase.get('reset_volumes', ()):
+            if line in self.volume_registers:
+                self.bank.floats[self.volume_registers[line]] = 0.0
+        for symbol, value in phase.get('coils', {}).items():
+            self.bank.set_coil(resolve_address(symbol), value)
+        for symbol, value in phase.get('registers', {}).items():
+            self.bank.words[resolve_address(symbol)] = value & 0xFFFF
+        self.log(f"[SCENARIO] {self._name}: {phase['name']} (FC{list(phase.get('fc', ()))})")
+
+    def _set_fcs(self, phase, value):
+        for fc in phase.get('fc', ()):
+            self.bank.set_coil(resolve_address('M', FC_BASE + fc), value)
+
+    def _finish(self, at):
+        self._set_fcs(self._phases[self._index], False)
+        self.completed.append((self._name, self._scenario_start, at))
+        self.log(f"[SCENARIO] ⏹️ {self._name} terminado")
+        self._name = None
+        self._phases = ()
+
+    def _flow(self, phase, line, elapsed):
+        profile = phase.get('flows', {}).get(line, 0.0)
+        if isinstance(profile, (int, float)):
+            return float(profile)
+        start, end = profile
+        duration = phase.get('duration')
+        if not duration:
+            return float(end)
+        return start + (end - start) * min(1.0, elapsed / duration)
+
+    def _integrate(self, phase, t0, t1):
+        # Perfiles lineales: el trapecio es exacto
+        if t1 <= t0 or not phase.get('flows'):
+            return
+        e0, e1 = t0 - self._phase_start, t1 - self._phase_start
+        floats = self.bank.floats
+        for line, address in self.volume_registers.items():
+            if line in phase['flows']:
+                average = (self._flow(phase, line, e0) + self._flow(phase, line, e1)) / 2
+                floats[address] = floats[address] + average * (t1 - t0) / FLOW_TIME_UNIT
+
+    def _advance(self, now):
+        while True:
+            phase = self._phases[self._index]
+            duration = phase.get('duration')
+            end = now if duration is None else min(now, self._phase_start + duration)
+            self._integrate(phase, self._last, end)
+            self._last = end
+            if duration is None or now < self._phase_start + duration:
+                break
+            self._set_fcs(phase, False)
+            boundary = self._phase_start + duration
+            if self._index + 1 >= len(self._phases):
+                self._show_flows(phase, duration)
+                self._finish(boundary)
+                return
+            self._enter(self._index + 1, boundary)
+
+        noise = phase.get('noise', 0.0)
+        elapsed = now - self._phase_start
+        self._show_flows(phase, elapsed, noise)
+
+    def _show_flows(self, phase, elapsed, noise=0.0):
+        floats = self.bank.floats
+        for line, address in self.flow_registers.items():
+            flow = self._flow(phase, line, elapsed)
+            if noise and flow:
+                flow += self.random.uniform(-noise, noise)
+            floats[address] = flow
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+from services.async_modbus_client import AsyncModbusClient, SyncModbusClient, _PriorityGate
+from services.command_scheduler import PRIORITY_OPERATOR, PRIORITY_POLL
+from services.transports import MODE_LOOPBACK
+from tests.com_simulator import ModbusSimulator
+from utils.poll_map import INSTANT_POINTS
+
+
+class BlockingResponder:
+    """Simulador que retiene cada respuesta hasta que release se activa."""
+
+    def __init__(self):
+        self.simulator = ModbusSimulator(verbose=False)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def handle_frame(self, frame):
+        self.started.set()
+        self.release.wait(5)
+        return self.simulator.handle_frame(frame)
+
+
+def test_gate_cancelled_after_handoff_passes_the_bus_on():
+    async def scenario():
+        gate = _PriorityGate()
+        await gate.acquire(PRIORITY_OPERATOR)
+        waiter = asyncio.ensure_future(gate.acquire(PRIORITY_POLL))
+        await asyncio.sleep(0)
+        # release() le cede el bus y se cancela antes de llegar a usarlo
+        gate.release()
+        waiter.cancel()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+        await asyncio.wait_for(gate.acquire(PRIORITY_OPERATOR), 1)
+        gate.release()
+        return gate._busy
+
+    assert asyncio.run(scenario()) is False
+
+
+def test_cancel_queued_read_while_bus_is_held():
+    async def scenario():
+        responder = BlockingResponder()
+        client = AsyncModbusClient()
+        assert await client.connect(responder, None, MODE_LOOPBACK)
+        holder = asyncio.ensure_future(client.read_coils(277, 26))
+        await asyncio.get_running_loop().run_in_executor(None, responder.started.wait, 5)
+        queued = asyncio.ensure_future(client.read_coils(277, 26, priority=PRIORITY_POLL))
+        await asyncio.sleep(0.01)
+        queued.cancel()
+        responder.release.set()
+        bits = await asyncio.wait_for(holder, 5)
+        try:
+            await queued
+        except asyncio.CancelledError:
+            pass
+        # El bus quedó libre: la siguiente lectura no espera a nadie
+        again = await asyncio.wait_for(client.read_coils(277, 26), 5)
+        await client.close()
+        return queued.cancelled(), bits, again
+
+    cancelled, bits, again = asyncio.run(scenario())
+    assert cancelled
+    assert bits is not None and len(bits) == 26
+    assert again == bits
+
+
+def test_sync_client_over_loopback():
+    client = SyncModbusClient()
+    try:
+        assert client.connect(ModbusSimulator(verbose=False), None, MODE_LOOPBACK)
+        values = client.read_points(INSTANT_POINTS)
+        assert set(values) == set(INSTANT_POINTS)
+        assert values['flow_q1'] == 125.5
+        assert client.write_setpoints({'ratio': 123}) == {'ratio': True}
+        assert client.read_points(['ratio'], max_age_ms=1000) == {'ratio': 123}
+        assert client.send_coil_pulse(269) == [True, True]
+        assert all(isinstance(message, str) for message in client.read_system_status())
+    finally:
+        client.close()
@@ -1,37 +1,87 @@
+import functools
+import re
+
+# Mapa de direcciones Modbus de los PLC Delta (serie DVP).
+# Por dispositivo: tramos (primer índice, último índice, dirección base).
+# X e Y se numeran en octal, como en el PLC (X0-X377).
+DEVICE_RANGES = {
+    'X': ((0o0, 0o377, 0x0400),),
+    'Y': ((0o0, 0o377, 0x0500),),
+    'T': ((0, 255, 0x0600),),
+    'M': ((0, 1535, 0x0800), (1536, 4095, 0xB000)),
+    'C': ((0, 255, 0x0E00),),
+    'D': ((0, 4095, 0x1000), (4096, 9999, 0x9000)),
+}
+
+OCTAL_DEVICES = ('X', 'Y')
+
+_SYMBOL = re.compile(r'^\s*([A-Za-z])(\d+)\s*$')
+
+
+class AddressError(ValueError):
+    """Dispositivo o índice que no existe en el mapa del PLC."""
+
+
+def _build_tables():
+    tables = {}
+    for device, ranges in DEVICE_RANGES.items():
+        table = {}
+        for first, last, base in ranges:
+            for number in range(first, last + 1):
+                # Las claves son el número tal como se escribe en el PLC (X17 -> 17)
+                key = int(oct(number)[2:]) if device in OCTAL_DEVICES else number
+                table[key] = base + number - first
+        tables[device] = table
+    return tables
+
+
+# Tablas precalculadas {dispositivo: {índice: dirección}}
+ADDRESS_TABLES = _build_tables()
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_symbol(symbol):
+    """'D136' -> ('D', 136). Lanza AddressError si el nombre no es válido."""
+    match = _SYMBOL.match(symbol)
+    if not match:
+        raise AddressError(f"Invalid PLC address '{symbol}'")
+    return match.group(1).upper(), int(match.group(2))
+
+
+def resolve_address(device, index=None):
+    """Dirección Modbus (entero) de un dispositivo del PLC.
+
+    Acepta resolve_address('D', 136) o resolve_address('D136'). Para X/Y el
+    índice se escribe en octal como en el PLC. Lanza AddressError si el
+    dispositivo o el índice no existen.
+    """
+    if index is None:
+        device, index = parse_symbol(device)
+    table = ADDRESS_TABLES.get(device)
+    if table is None:
+        raise AddressError(f"Device '{device}' not found.")
+    try:
+        return table[index]
+    except (KeyError, TypeError):
+        raise AddressError(f"Index {index} not found for device '{device}'.") from None
+
+
+def address_bytes(device, index=None):
+    """(byte alto, byte bajo) de la dirección Modbus."""
+    address = resolve_address(device, index)
+    return address >> 8, address & 0xFF
+
+
 def get_address(device, index):
-    tables = {
-        'M': [
-            {'range': (0, 255), 'address': ('0800', '08FF')},
-            {'range': (256, 511), 'address': ('0900', '09FF')},
-            {'range': (512, 767), 'address': ('0A00', '0AFF')},
-            {'range': (768, 1023), 'address': ('0B00', '0BFF')},
-        ],
-        'D': [
-            {'range': (0, 255), 'address': ('1000', '10FF')},
-            {'range': (256, 511), 'address': ('1100', '11FF')},
-            {'range': (512, 767), 'address': ('1200', '12FF')},
-            {'range': (768, 1023), 'address': ('1300', '13FF')},
-            {'range': (1024, 1279), 'address': ('1400', '14FF')},
-            {'range': (1280, 1535), 'address': ('1500', '15FF')},
-        ]
+    """Formato anterior en texto HEX; retorna el mensaje de error si no existe."""
+    try:
+        address = resolve_address(device, index)
+    except AddressError as ex:
+        return str(ex)
+    full_address_hex = f'{address:04X}'
+    return {
+        'device': f"{device}{index}",
+        'hex_address': full_address_hex,
+        'high_byte': full_address_hex[:2],
+        'low_byte': full_address_hex[2:],
     }
-
-    if device not in tables:
-        return f"Device '{device}' not found."
-
-    for entry in tables[device]:
-        start, end = entry['range']
-        if start <= index <= end:
-            base_address_hex = entry['address'][0]
-            offset = index - start
-            full_address_hex = hex(int(base_address_hex, 16) + offset)[2:].upper().zfill(4)
-            high_byte = full_address_hex[:2]
-            low_byte = full_address_hex[2:]
-            return {
-                'device': f"{device}{index}",
-                'hex_address': full_address_hex,
-                'high_byte': high_byte,
-                'low_byte': low_byte,
-            }
-
-    return f"Index {index} not found for device '{device}'."
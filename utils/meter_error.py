@@ -0,0 +1,53 @@
+# Cálculo de la tabla de pruebas (views/widgets/table_tests.py), sin dependencias de la UI
+
+# Volumen patrón mínimo: evita dividir por cero antes de recibir lecturas
+MIN_PATTERN_VOLUME = 0.1
+
+
+def tolerance_for(meter_status, test_type):
+    """Tolerancia (%) según el estado del medidor y el tipo de prueba."""
+    return 5.0 if meter_status == "Nuevo" else 10.0 if test_type == "Q1" else 4.0
+
+
+def calculate_error(start_str, end_str, test_type, instant_values, meter_status):
+    """Error (%) de una fila frente al volumen patrón de su caudal.
+
+    Retorna (error redondeado, "PASA"/"NO PASA", color) o (0, "Error", "gray")
+    si las lecturas no son numéricas.
+    """
+    try:
+        start = float(start_str) if start_str else 0
+        end = float(end_str) if end_str else 0
+        pattern = max(instant_values.get(test_type, 0), MIN_PATTERN_VOLUME)
+        error = (((end - start - pattern) / pattern) * 100)
+        tolerance = tolerance_for(meter_status, test_type)
+        passed = abs(error) <= tolerance
+        return round(error, 2), "PASA" if passed else "NO PASA", "green" if passed else "red"
+    except Exception as e:
+        print(f"[TABLE_TESTS] ❌ Error calculando: {e}")
+        return 0, "Error", "gray"
+
+
+def recalculate_rows(rows, instant_values, meter_status):
+    """Recalcula número de prueba, error y estado de todas las filas.
+
+    rows son las filas de la tabla [#, serial, tipo, inicial, final, error,
+    estado, ...]; se actualizan las columnas de error y estado. El número de
+    prueba es cuántas filas hasta la actual tienen el mismo serial y tipo,
+    contado en una sola pasada. Retorna [(número, error, estado, color)].
+    """
+    counts = {}
+    results = []
+    for row in rows:
+        serial, test_type = row[1], row[2]
+        if serial:
+            key = (serial, test_type)
+            counts[key] = counts.get(key, 0) + 1
+            test_num = counts[key]
+        else:
+            test_num = ""
+        error, status_text, status_color = calculate_error(row[3], row[4], test_type, instant_values, meter_status)
+        row[5] = str(error)
+        row[6] = status_text
+        results.append((test_num, error, status_text, status_color))
+    return results
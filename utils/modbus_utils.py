@@ -1,41 +1,132 @@
+import binascii
+import functools
 import struct
 
+# Longitud máxima de un ADU Modbus ASCII (':' + 2x252 bytes + LRC + CRLF)
+MAX_ASCII_FRAME_LENGTH = 513
+# ':' + esclavo + función + código de excepción + LRC + CRLF
+EXCEPTION_RESPONSE_LENGTH = 11
+# Longitud máxima de un ADU Modbus RTU
+MAX_RTU_FRAME_LENGTH = 256
+# esclavo + función + código de excepción + CRC
+RTU_EXCEPTION_LENGTH = 5
+
+def _build_crc16_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 0x0001 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+CRC16_TABLE = _build_crc16_table()
+
+# Par de caracteres HEX (mayúsculas) de cada byte, para codificar sin formatear
+HEX_PAIRS = tuple(f'{byte:02X}'.encode('ascii') for byte in range(256))
+
 def calculate_lrc(data_bytes):
     checksum = sum(data_bytes) % 256
     complement = (0xFF - checksum) + 1
     return complement & 0xFF
 
+# Orden de palabras/bytes de un float32 en dos registros: (endianness de struct,
+# permutación de bytes respecto a big endian o None). Las permutaciones son
+# involutivas, así que sirven tanto para decodificar como para codificar.
+FLOAT_BYTE_ORDERS = {
+    'big': ('>', None),
+    'big_word': ('>', None),
+    'little': ('<', None),
+    'little_word': ('>', (2, 3, 0, 1)),
+    'little_word_byte': ('>', (1, 0, 3, 2)),
+}
+
+@functools.lru_cache(maxsize=64)
+def _float_struct(endian, count):
+    return struct.Struct(f'{endian}{count}f')
+
+def _float_layout(byte_order):
+    try:
+        return FLOAT_BYTE_ORDERS[byte_order]
+    except KeyError:
+        raise ValueError("Unsupported byte order") from None
+
+def float_permutation(byte_order):
+    """Permutación de bytes de un float32 respecto a big endian (None si no hace falta)"""
+    endian, permutation = _float_layout(byte_order)
+    if endian == '<':
+        return (3, 2, 1, 0)
+    return permutation
+
+def permute_words(data, permutation):
+    """Reordena los bytes de cada float de un bloque en una sola pasada por slices"""
+    reordered = bytearray(len(data))
+    for target, source in enumerate(permutation):
+        reordered[target::4] = data[source::4]
+    return reordered
+
+def unpack_floats(data_bytes, byte_order='big'):
+    """Decodifica un bloque de float32 (4 bytes cada uno) en una sola llamada"""
+    endian, permutation = _float_layout(byte_order)
+    if len(data_bytes) % 4:
+        raise ValueError("Float block length must be a multiple of 4")
+    if permutation:
+        data_bytes = permute_words(data_bytes, permutation)
+    return list(_float_struct(endian, len(data_bytes) // 4).unpack(data_bytes))
+
+def pack_floats(values, byte_order='big'):
+    """Codifica una secuencia de float32 en bytes con el orden indicado"""
+    endian, permutation = _float_layout(byte_order)
+    packed = _float_struct(endian, len(values)).pack(*values)
+    if permutation:
+        return bytes(permute_words(packed, permutation))
+    return packed
+
 def pack_float(value: float, byte_order: str = 'big') -> bytes:
-    if byte_order == 'big':
-        return struct.pack('>f', value)
-    elif byte_order == 'little':
-        return struct.pack('<f', value)
-    elif byte_order == 'big_word':
-        return struct.pack('>f', value)
-    elif byte_order == 'little_word':
-        packed = struct.pack('>f', value)
-        return packed[2:4] + packed[0:2]
-    elif byte_order == 'little_word_byte':
-        packed = struct.pack('>f', value)
-        return bytes([packed[1], packed[0], packed[3], packed[2]])
-    else:
-        raise ValueError("Unsupported byte order")
+    return pack_floats((value,), byte_order)
+
+def pack_registers(values, value_type='int', float_byte_order='little_word'):
+    """Convierte una lista de enteros (16 bits) o floats en bytes de datos"""
+    if value_type == 'float':
+        return list(pack_floats(values, float_byte_order))
+    data_field = []
+    for v in values:
+        data_field += [(v >> 8) & 0xFF, v & 0xFF]
+    return data_field
+
+def pack_coils(values):
+    """Empaqueta una lista de bits en bytes (LSB primero), como función 15"""
+    data_field = []
+    for i in range(0, len(values), 8):
+        byte = 0
+        for j, bit in enumerate(values[i:i + 8]):
+            if bit:
+                byte |= 1 << j
+        data_field.append(byte)
+    return data_field
 
 def build_modbus_ascii_command(
     slave_address, function_code, address_high, address_low,
     quantity=1, value=None, value_type=None,
-    custom_bytes=None, float_byte_order='little_word'
+    custom_bytes=None, float_byte_order='little_word',
+    write_address=None
 ):
-    data_bytes = [slave_address, function_code, address_high, address_low]
+    """Construye una trama Modbus ASCII y la retorna en bytes.
+
+    Para la función 8 address_high/address_low son la subfunción y value el
+    dato de 16 bits. Para la función 23 address_* y quantity describen la
+    lectura, y write_address + value/custom_bytes la escritura.
+    """
+    data_bytes = bytearray((slave_address, function_code, address_high, address_low))
 
     if function_code == 3:  # Read holding registers
-        data_bytes += [0x00, quantity]
+        data_bytes.extend([(quantity >> 8) & 0xFF, quantity & 0xFF])
 
     elif function_code == 6:  # Write single register
         if value_type == "int":
             high = (value >> 8) & 0xFF
             low = value & 0xFF
-            data_bytes += [high, low]
+            data_bytes.extend([high, low])
 
     elif function_code == 16:  # Write multiple registers
         if value is None and custom_bytes is None:
@@ -44,89 +135,243 @@ def build_modbus_ascii_command(
         if custom_bytes:
             data_field = custom_bytes
         elif value_type == 'float':
-            for f in value:
-                packed = pack_float(f, float_byte_order)
-                data_field += list(packed)
-        data_bytes += [(quantity >> 8) & 0xFF, quantity & 0xFF]
+            data_field = pack_floats(value, float_byte_order)
+        data_bytes.extend([(quantity >> 8) & 0xFF, quantity & 0xFF])
         data_bytes.append(len(data_field))
-        data_bytes += data_field
+        data_bytes.extend(data_field)
 
     elif function_code == 5:  # Write single coil
-        data_bytes += [0xFF, 0x00] if value else [0x00, 0x00]
+        data_bytes.extend([0xFF, 0x00] if value else [0x00, 0x00])
 
     elif function_code == 1:  # Read coils
-        data_bytes += [(quantity >> 8) & 0xFF, quantity & 0xFF]
+        data_bytes.extend([(quantity >> 8) & 0xFF, quantity & 0xFF])
+
+    elif function_code == 15:  # Write multiple coils
+        if value is None:
+            raise ValueError("Value required")
+        data_field = pack_coils(value)
+        data_bytes.extend([(len(value) >> 8) & 0xFF, len(value) & 0xFF])
+        data_bytes.append(len(data_field))
+        data_bytes.extend(data_field)
+
+    elif function_code == 23:  # Read/write multiple registers
+        if write_address is None or (value is None and custom_bytes is None):
+            raise ValueError("write_address and value or custom_bytes required")
+        if custom_bytes:
+            data_field = list(custom_bytes)
+        else:
+            data_field = pack_registers(value, value_type, float_byte_order)
+        write_quantity = len(data_field) // 2
+        data_bytes.extend([(quantity >> 8) & 0xFF, quantity & 0xFF])
+        data_bytes.extend([(write_address >> 8) & 0xFF, write_address & 0xFF])
+        data_bytes.extend([(write_quantity >> 8) & 0xFF, write_quantity & 0xFF])
+        data_bytes.append(len(data_field))
+        data_bytes.extend(data_field)
+
+    elif function_code == 8:  # Diagnostics (subfunción 0 = loopback)
+        data = value or 0
+        data_bytes.extend([(data >> 8) & 0xFF, data & 0xFF])
 
     else:
         raise NotImplementedError("Function code not supported")
 
-    lrc = calculate_lrc(data_bytes)
-    command = ':' + ''.join(f'{b:02X}' for b in data_bytes) + f'{lrc:02X}\r\n'
-    return command
+    return encode_ascii_frame(data_bytes)
+
+def encode_ascii_frame(data):
+    """Codifica esclavo + PDU como trama ':' HEX LRC CRLF (bytes)."""
+    pairs = HEX_PAIRS
+    lrc = -sum(data) & 0xFF
+    return b''.join((b':', *map(pairs.__getitem__, data), pairs[lrc], b'\r\n'))
+
+def _frame_content(frame):
+    """memoryview del HEX entre ':' y el CRLF final, sin copiar"""
+    if isinstance(frame, str):
+        frame = frame.encode('ascii')
+    view = memoryview(frame)
+    end = len(view)
+    while end and view[end - 1] in (0x0D, 0x0A):
+        end -= 1
+    if not end or view[0] != 0x3A:
+        raise ValueError("Invalid Modbus format")
+    return view[1:end]
+
+def ascii_frame_to_bytes(frame):
+    """Decodifica el contenido HEX de una trama ASCII (sin ':' ni CRLF, con el LRC)"""
+    try:
+        return binascii.unhexlify(_frame_content(frame))
+    except binascii.Error:
+        raise ValueError("Invalid HEX content") from None
+
+def decode_ascii_frame(frame):
+    """Decodifica una trama ASCII verificando su LRC.
+
+    Retorna un memoryview de esclavo + PDU (sin el LRC). Lanza ValueError si
+    el formato, el HEX o el LRC no son válidos.
+    """
+    data = ascii_frame_to_bytes(frame)
+    if len(data) < 3:
+        raise ValueError("Frame too short")
+    # La suma de todos los bytes más el LRC es 0 módulo 256
+    if sum(data) & 0xFF:
+        raise ValueError("Invalid LRC")
+    return memoryview(data)[:-1]
+
+def ascii_frame_length(data_length):
+    """Longitud en caracteres de una trama ASCII con data_length bytes (sin LRC)"""
+    return 1 + 2 * (data_length + 1) + 2
+
+def expected_response_length(command):
+    """Calcula la longitud de la respuesta ASCII esperada para un comando.
+
+    Retorna None si la función no tiene una longitud conocida de antemano.
+    """
+    data = ascii_frame_to_bytes(command)
+    function_code = data[1]
+    if function_code in (1, 3, 23):
+        quantity = (data[4] << 8) | data[5]
+        if function_code == 1:
+            return ascii_frame_length(3 + (quantity + 7) // 8)
+        return ascii_frame_length(3 + 2 * quantity)
+    if function_code in (5, 6, 15, 16):
+        return ascii_frame_length(6)
+    if function_code == 8:
+        # El eco repite subfunción y datos
+        return ascii_frame_length(len(data) - 1)
+    return None
+
+def check_response_frame(command, response):
+    """Valida que la respuesta corresponda al comando enviado.
+
+    Retorna None si la trama es válida o un mensaje con el motivo del rechazo.
+    """
+    if not response.endswith(b'\r\n'):
+        return "Incomplete frame (missing CRLF)"
+    try:
+        request = ascii_frame_to_bytes(command)
+        data = decode_ascii_frame(response)
+    except ValueError as ex:
+        return str(ex)
+    if data[0] != request[0]:
+        return f"Unexpected slave {data[0]} (expected {request[0]})"
+    if data[1] == (request[1] | 0x80):
+        if len(response) != EXCEPTION_RESPONSE_LENGTH:
+            return "Invalid exception frame length"
+        return None
+    if data[1] != request[1]:
+        return f"Unexpected function {data[1]} (expected {request[1]})"
+    expected = expected_response_length(command)
+    if expected is not None and len(response) != expected:
+        return f"Unexpected frame length {len(response)} (expected {expected})"
+    return None
+
+def calculate_crc16(data_bytes):
+    """CRC16 Modbus (polinomio 0xA001) por tabla"""
+    crc = 0xFFFF
+    table = CRC16_TABLE
+    for byte in data_bytes:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+def rtu_silent_interval(baudrate):
+    """Silencio de fin de trama RTU (3.5 caracteres de 11 bits; 1.75 ms sobre 19200)"""
+    if baudrate > 19200:
+        return 0.00175
+    return 3.5 * 11 / baudrate
+
+def ascii_to_rtu(command):
+    """Convierte una trama ASCII (':'...LRC CRLF) en la trama RTU equivalente"""
+    data = ascii_frame_to_bytes(command)[:-1]
+    crc = calculate_crc16(data)
+    return data + bytes([crc & 0xFF, crc >> 8])
+
+def rtu_to_ascii(frame):
+    """Verifica el CRC de una trama RTU y la retorna como trama ASCII en bytes"""
+    if len(frame) < 4:
+        raise ValueError("RTU frame too short")
+    data = bytes(frame[:-2])
+    crc = frame[-2] | (frame[-1] << 8)
+    if calculate_crc16(data) != crc:
+        raise ValueError("Invalid CRC")
+    return encode_ascii_frame(data)
+
+def ascii_to_pdu(command):
+    """Separa una trama ASCII en (esclavo, PDU) sin el LRC"""
+    data = ascii_frame_to_bytes(command)
+    return data[0], data[1:-1]
+
+def expected_rtu_response_length(command):
+    """Longitud en bytes de la respuesta RTU esperada para un comando (o None)"""
+    ascii_length = expected_response_length(command)
+    if ascii_length is None:
+        return None
+    return (ascii_length - 5) // 2 + 2
 
 def parse_float_modbus(data_bytes, byte_order='big'):
     if len(data_bytes) != 4:
         raise ValueError("Exactly 4 bytes are required")
-    if byte_order == 'big':
-        return struct.unpack('>f', data_bytes)[0]
-    elif byte_order == 'little':
-        return struct.unpack('<f', data_bytes)[0]
-    elif byte_order == 'big_word':
-        return struct.unpack('>f', data_bytes)[0]
-    elif byte_order == 'little_word':
-        reordered = bytes([data_bytes[2], data_bytes[3], data_bytes[0], data_bytes[1]])
-        return struct.unpack('>f', reordered)[0]
-    elif byte_order == 'little_word_byte':
-        reordered = bytes([data_bytes[1], data_bytes[0], data_bytes[3], data_bytes[2]])
-        return struct.unpack('>f', reordered)[0]
-    else:
-        raise ValueError("Unsupported byte order")
+    return unpack_floats(data_bytes, byte_order)[0]
 
-def parse_modbus_ascii_response(response_bytes, float_byte_order='little_word'):
-    try:
-        text = response_bytes.decode('ascii').strip()
-    except Exception:
-        return {"type": "error", "message": "Invalid ASCII response"}
+def exception_message(data):
+    """Mensaje de una respuesta de excepción (esclavo, función | 0x80, código)"""
+    if len(data) < 3:
+        return "Modbus exception response without exception code"
+    return f"Modbus error code {data[2]}"
+
+def response_data(response):
+    """Bytes de datos de una respuesta de lectura (funciones 1, 3 y 23), sin interpretarlos.
+
+    Lanza ValueError si la trama no es válida o es una respuesta de excepción.
+    """
+    data = decode_ascii_frame(response)
+    if data[1] & 0x80:
+        raise ValueError(exception_message(data))
+    return bytes(data[3:3 + data[2]])
 
-    if not text.startswith(':'):
-        return {"type": "error", "message": "Invalid Modbus format"}
+def parse_modbus_ascii_response(response_bytes, float_byte_order='little_word', plan=None):
+    """Interpreta una respuesta ASCII.
 
-    content = text[1:-2]
+    Para lecturas de registros con plan (ver utils.poll_map.DecodePlan) los
+    valores se decodifican según el esquema del bloque pedido; sin plan se
+    mantiene la interpretación por tamaño (float si byte_count es múltiplo de 4).
+    """
     try:
-        data = bytes.fromhex(content)
-    except ValueError:
-        return {"type": "error", "message": "Invalid HEX content"}
+        data = decode_ascii_frame(response_bytes)
+    except (ValueError, UnicodeError) as ex:
+        # Una trama corrupta nunca se interpreta como datos
+        return {"type": "error", "message": str(ex)}
 
     slave_address = data[0]
     function_code = data[1]
 
     if function_code & 0x80:
-        return {"type": "error", "code": data[2], "message": f"Modbus error code {data[2]}"}
+        if len(data) < 3:
+            return {"type": "error", "message": exception_message(data)}
+        return {"type": "error", "code": data[2], "message": exception_message(data)}
 
-    if function_code == 3:
+    if function_code in (3, 23):
         byte_count = data[2]
         raw_data = data[3:3 + byte_count]
 
+        if plan is not None:
+            try:
+                values = plan.decode(raw_data)
+            except (ValueError, struct.error) as ex:
+                return {"type": "error", "message": str(ex)}
+            return {"type": "read", "subtype": "typed", "values": values, "raw_bytes": bytes(raw_data)}
+
         if byte_count % 4 == 0:
-            floats = []
-            for i in range(0, byte_count, 4):
-                chunk = raw_data[i:i+4]
-                try:
-                    val = parse_float_modbus(chunk, float_byte_order)
-                    floats.append(val)
-                except:
-                    floats.append(None)
-            return {"type": "read", "subtype": "float", "data": floats}
+            floats = unpack_floats(raw_data, float_byte_order)
+            return {"type": "read", "subtype": "float", "data": floats, "raw_bytes": bytes(raw_data)}
 
         elif byte_count % 2 == 0:
             integers = []
             for i in range(0, byte_count, 2):
                 val = (raw_data[i] << 8) + raw_data[i+1]
                 integers.append(val)
-            return {"type": "read", "subtype": "int", "data": integers}
+            return {"type": "read", "subtype": "int", "data": integers, "raw_bytes": bytes(raw_data)}
 
         else:
-            return {"type": "read", "raw_bytes": raw_data}
+            return {"type": "read", "raw_bytes": bytes(raw_data)}
 
     elif function_code == 1:
         byte_count = data[2]
@@ -137,7 +382,23 @@ def parse_modbus_ascii_response(response_bytes, float_byte_order='little_word'):
                 bits.append((byte >> i) & 0x01)
         return {"type": "read", "subtype": "bits", "bits": bits}
 
-    elif function_code in [5, 6, 15, 16]:
+    elif function_code == 15:
+        return {
+            "type": "write", "subtype": "coils",
+            "address": (data[2] << 8) | data[3],
+            "quantity": (data[4] << 8) | data[5],
+            "message": "Command executed successfully"
+        }
+
+    elif function_code in [5, 6, 16]:
         return {"type": "write", "message": "Command executed successfully"}
 
+    elif function_code == 8:
+        return {
+            "type": "diagnostic",
+            "subfunction": (data[2] << 8) | data[3],
+            "data": list(data[4:]),
+            "message": "Diagnostic echo received"
+        }
+
     return {"type": "error", "message": f"Function code {function_code} not supported"}
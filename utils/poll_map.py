@@ -0,0 +1,274 @@
+import functools
+import struct
+from array import array
+from utils.modbus_utils import pack_float, float_permutation, permute_words
+
+# Límite de registros por lectura con función 3 (Modbus)
+MAX_READ_REGISTERS = 125
+# Límite de registros por escritura con función 16 (Modbus)
+MAX_WRITE_REGISTERS = 123
+# Registros intermedios que se reescriben con su valor actual para unir dos escrituras
+MAX_WRITE_GAP = 4
+
+DEFAULT_WORD_ORDER = 'little_word'
+
+# Tamaño en registros de 16 bits por tipo de dato
+TYPE_SIZES = {
+    'int16': 1,
+    'uint16': 1,
+    'float32': 2,
+}
+
+# Código struct (big endian) por tipo de dato
+TYPE_CODES = {
+    'int16': 'h',
+    'uint16': 'H',
+    'float32': 'f',
+}
+
+# Mapa declarativo de los valores que lee la aplicación.
+# refresh_ms es el periodo de sondeo del punto (ver points_by_refresh);
+# refresh_ms=None indica lectura bajo demanda (no entra en el sondeo periódico).
+# Claves opcionales: 'word_order' (float32, por defecto DEFAULT_WORD_ORDER) y
+# 'scale' (el valor de ingeniería es el valor crudo multiplicado por scale).
+POLL_MAP = [
+    # Caudales instantáneos (D136-D141)
+    {'name': 'flow_q1', 'device': 'D', 'index': 136, 'type': 'float32', 'refresh_ms': 500},
+    {'name': 'flow_q2', 'device': 'D', 'index': 138, 'type': 'float32', 'refresh_ms': 500},
+    {'name': 'flow_q3', 'device': 'D', 'index': 140, 'type': 'float32', 'refresh_ms': 500},
+    # Volúmenes instantáneos (D150-D157)
+    {'name': 'volume_q1', 'device': 'D', 'index': 150, 'type': 'float32', 'refresh_ms': 500},
+    {'name': 'volume_q2', 'device': 'D', 'index': 152, 'type': 'float32', 'refresh_ms': 500},
+    {'name': 'volume_q3', 'device': 'D', 'index': 154, 'type': 'float32', 'refresh_ms': 500},
+    {'name': 'volume_q4', 'device': 'D', 'index': 156, 'type': 'float32', 'refresh_ms': 500},
+    # Valores de prueba
+    {'name': 'ratio', 'device': 'D', 'index': 122, 'type': 'int16', 'refresh_ms': None},
+    {'name': 'test_flow_q4', 'device': 'D', 'index': 142, 'type': 'float32', 'refresh_ms': None},
+    {'name': 'test_flow_q3', 'device': 'D', 'index': 144, 'type': 'float32', 'refresh_ms': None},
+    {'name': 'test_flow_q2', 'device': 'D', 'index': 146, 'type': 'float32', 'refresh_ms': None},
+    {'name': 'test_flow_q1', 'device': 'D', 'index': 148, 'type': 'float32', 'refresh_ms': None},
+    {'name': 'test_volume_q4', 'device': 'D', 'index': 112, 'type': 'int16', 'refresh_ms': None},
+    {'name': 'test_volume_q3', 'device': 'D', 'index': 114, 'type': 'int16', 'refresh_ms': None},
+    {'name': 'test_volume_q2', 'device': 'D', 'index': 116, 'type': 'int16', 'refresh_ms': None},
+    {'name': 'test_volume_q1', 'device': 'D', 'index': 118, 'type': 'int16', 'refresh_ms': None},
+]
+
+POINTS_BY_NAME = {point['name']: point for point in POLL_MAP}
+
+
+def points_by_refresh(points=POLL_MAP):
+    """Grupos del sondeo periódico: [(refresh_ms, (nombres, ...))].
+
+    Ordenados del periodo más corto al más largo, con los nombres en el
+    orden del mapa. Los puntos con refresh_ms=None no aparecen.
+    """
+    groups = {}
+    for point in points:
+        if point['refresh_ms'] is not None:
+            groups.setdefault(point['refresh_ms'], []).append(point['name'])
+    return [(refresh_ms, tuple(names)) for refresh_ms, names in sorted(groups.items())]
+
+
+POLL_GROUPS = points_by_refresh()
+
+# Valores del sondeo periódico (los instantáneos de la UI, en el orden del mapa)
+INSTANT_POINTS = [point['name'] for point in POLL_MAP if point['refresh_ms'] is not None]
+
+# Valores bajo demanda: consignas y resultados de la prueba
+TEST_POINTS = [point['name'] for point in POLL_MAP if point['refresh_ms'] is None]
+
+
+def register_count(point):
+    return TYPE_SIZES[point['type']]
+
+
+def resolve_points(points):
+    """Acepta nombres o definiciones y retorna definiciones del mapa."""
+    return [POINTS_BY_NAME[p] if isinstance(p, str) else p for p in points]
+
+
+def plan_reads(points, max_registers=MAX_READ_REGISTERS):
+    """Agrupa los puntos en el menor número de lecturas contiguas (función 3).
+
+    Retorna una lista de bloques {'device', 'start', 'quantity', 'points',
+    'plan'}, donde plan es el DecodePlan compilado del bloque. Dos puntos se
+    leen en la misma trama mientras el bloque resultante no supere
+    max_registers, aunque haya registros sin usar entre ellos.
+    """
+    blocks = []
+    ordered = sorted(resolve_points(points), key=lambda p: (p['device'], p['index']))
+    for point in ordered:
+        end = point['index'] + register_count(point)
+        block = blocks[-1] if blocks else None
+        if (block and block['device'] == point['device']
+                and end - block['start'] <= max_registers):
+            block['quantity'] = max(block['quantity'], end - block['start'])
+            block['points'].append(point)
+        else:
+            blocks.append({
+                'device': point['device'],
+                'start': point['index'],
+                'quantity': end - point['index'],
+                'points': [point],
+            })
+    for block in blocks:
+        block['plan'] = compile_plan(block)
+    return blocks
+
+
+@functools.lru_cache(maxsize=128)
+def compile_reads(points, max_registers=MAX_READ_REGISTERS):
+    """plan_reads en caché para una tupla de nombres del mapa (p. ej. los del sondeo)."""
+    return tuple(plan_reads(points, max_registers))
+
+
+def _point_signature(point):
+    return (point['name'], point['index'], point['type'],
+            point.get('word_order', DEFAULT_WORD_ORDER), point.get('scale'))
+
+
+# Permutaciones de un float32 respecto a big endian (ver utils.modbus_utils.float_permutation)
+# con las que todo el bloque se lee con un solo struct
+_BIG_ENDIAN_FLOAT = None
+_WORD_SWAPPED_FLOAT = (2, 3, 0, 1)
+
+
+class DecodePlan:
+    """Decodificación precompilada de un bloque de registros.
+
+    Un solo struct.Struct recorre el bloque completo (los registros sin usar
+    se saltan con 'x'). El orden de palabras va en la compilación: si todos
+    los float32 son big endian se lee tal cual con '>'; si todos tienen las
+    palabras invertidas (little_word), se invierten los bytes de cada
+    registro y se lee con '<', que deja también los enteros en su valor.
+    Solo los bloques que mezclan órdenes reordenan cada tramo con slices.
+    """
+
+    __slots__ = ('names', 'size', '_struct', '_word_swap', '_swaps', '_scales')
+
+    def __init__(self, start, quantity, signatures):
+        fmt = []
+        names = []
+        swaps = []
+        scales = []
+        permutations = set()
+        position = start
+        for name, index, point_type, word_order, scale in sorted(signatures, key=lambda s: s[1]):
+            if point_type not in TYPE_CODES:
+                raise ValueError(f"Unsupported point type: {point_type}")
+            if index < position:
+                raise ValueError(f"Point {name} overlaps the previous point in the block")
+            if index > position:
+                fmt.append(f'{2 * (index - position)}x')
+            fmt.append(TYPE_CODES[point_type])
+            if point_type == 'float32':
+                permutation = float_permutation(word_order)
+                permutations.add(permutation)
+                offset = 2 * (index - start)
+                if permutation:
+                    if swaps and swaps[-1][1] == offset and swaps[-1][2] == permutation:
+                        swaps[-1][1] = offset + 4
+                    else:
+                        swaps.append([offset, offset + 4, permutation])
+            if scale is not None:
+                scales.append((name, scale))
+            names.append(name)
+            position = index + TYPE_SIZES[point_type]
+        if start + quantity > position:
+            fmt.append(f'{2 * (start + quantity - position)}x')
+        self.names = tuple(names)
+        self.size = 2 * quantity
+        self._word_swap = permutations == {_WORD_SWAPPED_FLOAT}
+        if self._word_swap or permutations <= {_BIG_ENDIAN_FLOAT}:
+            swaps = []
+        self._struct = struct.Struct(('<' if self._word_swap else '>') + ''.join(fmt))
+        self._swaps = tuple((begin, end, permutation) for begin, end, permutation in swaps)
+        self._scales = tuple(scales)
+
+    def decode(self, raw_bytes):
+        """Retorna {nombre: valor} a partir de los bytes crudos del bloque."""
+        if len(raw_bytes) < self.size:
+            raise ValueError(f"Block expected {self.size} bytes, got {len(raw_bytes)}")
+        if self._word_swap:
+            words = array('H')
+            words.frombytes(raw_bytes[:self.size])
+            words.byteswap()
+            raw_bytes = words
+        elif self._swaps:
+            raw_bytes = bytearray(raw_bytes[:self.size])
+            for begin, end, permutation in self._swaps:
+                raw_bytes[begin:end] = permute_words(raw_bytes[begin:end], permutation)
+        values = dict(zip(self.names, self._struct.unpack_from(raw_bytes)))
+        if self._scales:
+            for name, scale in self._scales:
+                values[name] *= scale
+        return values
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(start, quantity, signatures):
+    return DecodePlan(start, quantity, signatures)
+
+
+def compile_plan(block):
+    """Retorna el DecodePlan del bloque (compilado una vez por esquema)."""
+    return _compile(block['start'], block['quantity'],
+                    tuple(_point_signature(point) for point in block['points']))
+
+
+def decode_block(block, raw_bytes):
+    """Separa la respuesta de un bloque en valores tipados por nombre."""
+    plan = block.get('plan') or compile_plan(block)
+    try:
+        return plan.decode(raw_bytes)
+    except ValueError as ex:
+        raise ValueError(f"Block {block['device']}{block['start']}: {ex}") from None
+
+
+def encode_point(point, value):
+    """Codifica un valor como lista de palabras de 16 bits según el tipo del punto."""
+    scale = point.get('scale')
+    if scale is not None:
+        value = value / scale
+    if point['type'] == 'float32':
+        raw = pack_float(float(value), point.get('word_order', DEFAULT_WORD_ORDER))
+    elif point['type'] == 'int16':
+        raw = struct.pack('>h', int(round(value)))
+    elif point['type'] == 'uint16':
+        raw = struct.pack('>H', int(round(value)))
+    else:
+        raise ValueError(f"Unsupported point type: {point['type']}")
+    return [(raw[i] << 8) | raw[i + 1] for i in range(0, len(raw), 2)]
+
+
+def plan_writes(values, max_gap=MAX_WRITE_GAP, max_registers=MAX_WRITE_REGISTERS):
+    """Agrupa {nombre: valor} en bloques de escritura función 16.
+
+    Cada bloque es {'device', 'start', 'words', 'points'} donde words tiene
+    una palabra por registro del bloque y None en los huecos (registros no
+    pedidos que deben reescribirse con su valor actual). Solo se unen puntos
+    separados por como máximo max_gap registros.
+    """
+    blocks = []
+    ordered = sorted(
+        ((POINTS_BY_NAME[name], value) for name, value in values.items()),
+        key=lambda item: (item[0]['device'], item[0]['index'])
+    )
+    for point, value in ordered:
+        words = encode_point(point, value)
+        block = blocks[-1] if blocks else None
+        if block:
+            end = block['start'] + len(block['words'])
+            gap = point['index'] - end
+            fits = point['index'] + len(words) - block['start'] <= max_registers
+            if block['device'] == point['device'] and 0 <= gap <= max_gap and fits:
+                block['words'] += [None] * gap + words
+                block['points'].append(point)
+                continue
+        blocks.append({
+            'device': point['device'],
+            'start': point['index'],
+            'words': list(words),
+            'points': [point],
+        })
+    return blocks
@@ -1,23 +1,25 @@
 import flet as ft
 import threading
 from controllers.modbus_controller import ModbusController
-from utils.modbus_utils import build_modbus_ascii_command, parse_modbus_ascii_response
-from utils.address_utils import get_address
+from utils.poll_map import TEST_POINTS
 from .widgets.table_tests import table_tests
 from services.modbus_service import ModbusService
 
-def send_bool_m(bit, update_messages_ui, read_fc_states):
+# Tras enviar consignas, la lectura de verificación ya dejó los valores en la imagen
+SETPOINT_READ_MAX_AGE_MS = 1000
+
+def send_bool_m(bit, update_messages_ui, read_fc_states, page=None):
     try:
-        info = get_address('M', bit)
-        comand_on = build_modbus_ascii_command(
-            1, 5, int(info['high_byte'], 16), int(info['low_byte'], 16), value=1)
-        comand_off = build_modbus_ascii_command(
-            1, 5, int(info['high_byte'], 16), int(info['low_byte'], 16), value=0)
         service = ModbusService()
-        print(f"[MODBUS] Enviando ON a M{bit}: {comand_on.strip()}")
-        service.send_command(comand_on)
-        print(f"[MODBUS] Enviando OFF a M{bit}: {comand_off.strip()}")
-        service.send_command(comand_off)
+        print(f"[MODBUS] Enviando ON/OFF a M{bit}")
+        responses = service.send_coil_pulse(bit)
+        if not responses[0]:
+            print(f"[MODBUS] ❌ M{bit} sin respuesta del PLC")
+            if page:
+                page.snack_bar = ft.SnackBar(ft.Text(f"El PLC no confirmó M{bit}. Repita la orden."), bgcolor="red")
+                page.snack_bar.open = True
+                page.update()
+            return
         print(f"[MODBUS] Bit M{bit} activado/desactivado")
         # Forzar una lectura inmediata después de enviar comando
         threading.Timer(0.2, lambda: threading.Timer(0.1, lambda: update_messages_ui(read_fc_states())).start()).start()
@@ -108,65 +110,42 @@ def get_automatic_mode_view(page, meter_group_id, selected_batch):
     def create_test_button(name, bit):
         def on_click(e):
             print(f"[BOTÓN] Presionado: {name} (M{bit})")
-            send_bool_m(bit, update_system_status_from_automatic, controller.service.read_system_status)
+            send_bool_m(bit, update_system_status_from_automatic, controller.service.read_system_status, e.page)
         return ft.ElevatedButton(content=ft.Text(name), width=180, on_click=on_click)
 
     # Setup controller
     controller = ModbusController(update_ui)
-    port = controller.service.detect_port()
-    if port:
-        controller.service.connect(port)
-        controller.start_reading(1)
+    if not controller.service.connected:
+        port = controller.service.detect_port()
+        if port:
+            controller.service.connect(port)
+    controller.start_reading(controller.service.slave)
 
     # Read from Modbus
-    def read_test_values():
+    def read_test_values(max_age_ms=None):
         try:
-            info_ratio = get_address('D', 122)
-            cmd_ratio = build_modbus_ascii_command(1, 3, int(info_ratio['high_byte'], 16), int(info_ratio['low_byte'], 16), value=1)
-            try:
-                res_ratio = controller.service.send_command(cmd_ratio)
-                ratio_input.value = str(parse_modbus_ascii_response(res_ratio)["data"][0])
-            except Exception as ex:
-                print(f"Error leyendo ratio: {ex}")
+            # D112-D149 en una sola lectura coalescida
+            values = controller.service.read_points(TEST_POINTS, max_age_ms=max_age_ms)
+            if 'ratio' in values:
+                ratio_input.value = str(values['ratio'])
+            else:
+                print("Error leyendo ratio")
 
-            info_flows = get_address('D', 142)
-            cmd_flows = build_modbus_ascii_command(1, 3, int(info_flows['high_byte'], 16), int(info_flows['low_byte'], 16), quantity=8)
-            try:
-                res_flows = controller.service.send_command(cmd_flows)
-                flow_data = parse_modbus_ascii_response(res_flows, float_byte_order='little_word')["data"]
-                q1_flow.value = flow_data[3]
-                q2_flow.value = flow_data[2]
-                q3_flow_input.value = flow_data[1]
-                q4_flow.value = flow_data[0]
-            except Exception as ex:
-                print(f"Error leyendo caudales de prueba: {ex}")
+            if 'test_flow_q1' in values:
+                q1_flow.value = values['test_flow_q1']
+                q2_flow.value = values['test_flow_q2']
+                q3_flow_input.value = values['test_flow_q3']
+                q4_flow.value = values['test_flow_q4']
+            else:
+                print("Error leyendo caudales de prueba")
 
-            try:
-                # Q1 - D118
-                info_q1 = get_address('D', 118)
-                cmd_q1 = build_modbus_ascii_command(1, 3, int(info_q1['high_byte'], 16), int(info_q1['low_byte'], 16), quantity=1)
-                res_q1 = controller.service.send_command(cmd_q1)
-                q1_volume_input.value = int(parse_modbus_ascii_response(res_q1)["data"][0])
-            
-                # Q2 - D116
-                info_q2 = get_address('D', 116)
-                cmd_q2 = build_modbus_ascii_command(1, 3, int(info_q2['high_byte'], 16), int(info_q2['low_byte'], 16), quantity=1)
-                res_q2 = controller.service.send_command(cmd_q2)
-                q2_volume_input.value = int(parse_modbus_ascii_response(res_q2)["data"][0])
-            
-                # Q3 - D114
-                info_q3 = get_address('D', 114)
-                cmd_q3 = build_modbus_ascii_command(1, 3, int(info_q3['high_byte'], 16), int(info_q3['low_byte'], 16), quantity=1)
-                res_q3 = controller.service.send_command(cmd_q3)
-                q3_volume_input.value = int(parse_modbus_ascii_response(res_q3)["data"][0])
-            
-                # Q4 - D112
-                info_q4 = get_address('D', 112)
-                cmd_q4 = build_modbus_ascii_command(1, 3, int(info_q4['high_byte'], 16), int(info_q4['low_byte'], 16), quantity=1)
-                res_q4 = controller.service.send_command(cmd_q4)
-                q4_volume.value = int(parse_modbus_ascii_response(res_q4)["data"][0])
-            except Exception as ex:
-                print(f"Error leyendo volúmenes de prueba: {ex}")
+            if 'test_volume_q1' in values:
+                q1_volume_input.value = values['test_volume_q1']
+                q2_volume_input.value = values['test_volume_q2']
+                q3_volume_input.value = values['test_volume_q3']
+                q4_volume.value = values['test_volume_q4']
+            else:
+                print("Error leyendo volúmenes de prueba")
 
             page.update()
         except Exception as e:
@@ -176,41 +155,28 @@ def get_automatic_mode_view(page, meter_group_id, selected_batch):
     def on_send_values(e):
         try:
             campos = [
-                ("Ratio", ratio_input, "D122", "int"),
-                ("Caudal Q3 (Prueba)", q3_flow_input, "D144", "float"),
-                ("Volumen Q1 (Prueba)", q1_volume_input, "D118", "int"),
-                ("Volumen Q2 (Prueba)", q2_volume_input, "D116", "int"),
-                ("Volumen Q3 (Prueba)", q3_volume_input, "D114", "int"),
-                ("Volumen Q4 (Prueba)", q4_volume, "D112", "int"),
+                ("Ratio", ratio_input, "ratio", "int"),
+                ("Caudal Q3 (Prueba)", q3_flow_input, "test_flow_q3", "float"),
+                ("Volumen Q1 (Prueba)", q1_volume_input, "test_volume_q1", "int"),
+                ("Volumen Q2 (Prueba)", q2_volume_input, "test_volume_q2", "int"),
+                ("Volumen Q3 (Prueba)", q3_volume_input, "test_volume_q3", "int"),
+                ("Volumen Q4 (Prueba)", q4_volume, "test_volume_q4", "int"),
             ]
-            for name, widget, address, type_value in campos:
+            valores = {}
+            for name, widget, point, type_value in campos:
                 value = widget.value
                 if str(value).strip() == "":
                     continue
                 try:
-                    val = int(float(value)) if type_value == "int" else float(value)
+                    valores[point] = int(float(value)) if type_value == "int" else float(value)
                 except Exception as ex:
                     print(f"Valor inválido en {name}: {value} ({ex})")
-                    continue
-                info = get_address('D', int(address[1:]))
-                if not isinstance(info, dict):
-                    print(f"Dirección inválida para {address}")
-                    continue
-                quantity = 1 if type_value == "int" else 2
-                funtion = 6 if type_value == "int" else 16
-                value_param = val if funtion == 6 else [val]
-                comand = build_modbus_ascii_command(
-                    slave_address=1,
-                    function_code=funtion,
-                    address_high=int(info['high_byte'], 16),
-                    address_low=int(info['low_byte'], 16),
-                    quantity=quantity,
-                    value=value_param,
-                    value_type=type_value
-                )
-                controller.service.send_command(comand)
-                print(f"Escribiendo {name}: {comand.strip()}")
-            read_test_values()
+            # Escritura agrupada + una lectura de verificación que refresca todos los valores de prueba
+            resultados = controller.service.write_setpoints(valores, read_back=TEST_POINTS)
+            for name, widget, point, type_value in campos:
+                if point in resultados:
+                    print(f"Escribiendo {name}: {'OK' if resultados[point] else 'ERROR'}")
+            read_test_values(max_age_ms=SETPOINT_READ_MAX_AGE_MS)
             update_system_status_from_automatic()
         except Exception as ex:
             print(f"Error al enviar valores: {ex}")
@@ -10,15 +10,9 @@ def get_connection_view(page, on_connection_ready):
         page.update()
 
     def on_ready():
-        # Abrir el puerto COM aquí
-        service = ModbusService()
-        port = service.detect_port()
-        if port and service.connect(port):
-            print(f"[CONNECTION_VIEW] Puerto COM abierto: {port}")
-            on_connection_ready()
-        else:
-            update_status("❌ No se pudo abrir el puerto COM")
-            print("[CONNECTION_VIEW] No se pudo abrir el puerto COM")
+        # El vigilante ya abrió el puerto y lo reconecta si se desconecta
+        print(f"[CONNECTION_VIEW] Puerto COM abierto: {ModbusService().port}")
+        on_connection_ready()
 
     monitor_com_connection(on_ready, update_status)
 
@@ -1,9 +1,8 @@
 import flet as ft
 import time
 import threading
-from utils.modbus_utils import build_modbus_ascii_command
-from utils.address_utils import get_address
-from services.modbus_service import ModbusService
+from services.modbus_service import ModbusService, SafetyCommandError, STATUS_MAX_AGE_MS
+from services.command_scheduler import PRIORITY_POLL
 from views.automatic_mode_view import get_automatic_mode_view
 
 def get_mode_selection_view(on_auto, on_manual):
@@ -64,26 +63,11 @@ def get_mode_selection_view(on_auto, on_manual):
             if not service.connected:
                 return []
 
-            # Leer desde M277 hasta M302 (26 bits)
-            info = get_address('M', 277)
-            cmd = build_modbus_ascii_command(
-                1, 1,  # Función 1 = Read Coils
-                int(info['high_byte'], 16), int(info['low_byte'], 16),
-                quantity=26
-            )
-            
-            response = service.send_command(cmd)
-            if not response:
-                return []
-
-            # Parsear respuesta
-            from utils.modbus_utils import parse_modbus_ascii_response
-            parsed = parse_modbus_ascii_response(response)
-            if parsed.get('type') != 'read' or 'bits' not in parsed:
+            # Leer desde M277 hasta M302 (26 bits); comparte la imagen con read_system_status
+            bits = service.read_coils(277, 26, max_age_ms=STATUS_MAX_AGE_MS, priority=PRIORITY_POLL)
+            if not bits:
                 return []
             
-            bits = parsed['bits']
-            
             # Recopilar mensajes activos
             active_messages = []
             for i, bit_value in enumerate(bits[:26]):  # Solo los primeros 26 bits
@@ -156,21 +140,23 @@ def get_mode_selection_view(on_auto, on_manual):
         print("⏹️ Monitoreo de estados FC detenido")
 
     # Enviar booleanos a bits específicos
-    def send_bool_m(bit):
+    def send_bool_m(bit, page=None):
         try:
-            info = get_address('M', bit)
-            comand_on = build_modbus_ascii_command(
-                1, 5, int(info['high_byte'], 16), int(info['low_byte'], 16), value=1)
-            comand_off = build_modbus_ascii_command(
-                1, 5, int(info['high_byte'], 16), int(info['low_byte'], 16), value=0)
-            service = ModbusService()
-            service.send_command(comand_on)
-            service.send_command(comand_off)
+            # M262/M263 salen con prioridad de seguridad por delante de las lecturas
+            ModbusService().send_coil_pulse(bit)
             print(f"[MODBUS] Bit M{bit} activado/desactivado")
             
             # Forzar una lectura inmediata después de enviar comando
             threading.Timer(0.2, lambda: threading.Timer(0.1, lambda: update_messages_ui(read_fc_states())).start()).start()
             
+        except SafetyCommandError as ex:
+            print(f"❌ Orden de seguridad M{bit} no enviada: {ex}")
+            if page:
+                page.snack_bar = ft.SnackBar(
+                    ft.Text(f"⛔ El PLC no confirmó M{bit}. Verifique el enlace y repita la orden."),
+                    bgcolor="red")
+                page.snack_bar.open = True
+                page.update()
         except Exception as ex:
             print(f"❌ Error al enviar a M{bit}: {ex}")
 
@@ -234,10 +220,10 @@ def get_mode_selection_view(on_auto, on_manual):
 
     # Botones de seguridad (también activarán la lectura de estados)
     def emergency_stop(e):
-        send_bool_m(262)
+        send_bool_m(262, e.page)
     
     def rearme(e):
-        send_bool_m(263)
+        send_bool_m(263, e.page)
 
     seguridad_buttons_column = ft.Column(
         [
@@ -1,4 +1,5 @@
 import flet as ft
+from utils.meter_error import recalculate_rows, tolerance_for, MIN_PATTERN_VOLUME
 
 DROPDOWN_OPTIONS = ["Escoja una opción", "Q1", "Q2", "Q3", "Q4"]
 INPUT_BG = "#f3f4f6"
@@ -38,47 +39,26 @@ def table_tests():
         data_row_min_height=48,
     )
 
-    def get_test_count(serial, test_type, max_idx):
-        count = 0
-        for i in range(max_idx + 1):
-            if rows[i][1] == serial and rows[i][2] == test_type:
-                count += 1
-        return count if serial else ""
-
-    def calculate_error(start_str, end_str, test_type):
-        try:
-            start = float(start_str) if start_str else 0
-            end = float(end_str) if end_str else 0
-            pattern = max(instant_values.get(test_type, 0), 0.1)
-
-            error = (((end - start - pattern) / pattern) * 100)
-            status = meter_status_dropdown.value
-            tolerance = 5.0 if status == "Nuevo" else 10.0 if test_type == "Q1" else 4.0
-
-            # 🔥 LOGS DETALLADOS
-            print(f"[TABLE_TESTS] 🧮 Calculando error:")
-            print(f"  📝 Tipo de prueba: {test_type}")
-            print(f"  📊 Lectura inicial: {start}")
-            print(f"  📊 Lectura final: {end}")
-            print(f"  📊 Volumen patrón (instantáneo): {pattern}")
-            print(f"  📊 Error calculado: {error:.2f}%")
-            print(f"  📊 Tolerancia aplicada: {tolerance}%")
-            print(f"  📊 Estado del medidor: {status}")
-
-            return round(error, 2), "PASA" if abs(error) <= tolerance else "NO PASA", \
-                "green" if abs(error) <= tolerance else "red"
-        except Exception as e:
-            print(f"[TABLE_TESTS] ❌ Error calculando: {e}")
-            return 0, "Error", "gray"
+    def log_error_calculation(row, error):
+        # 🔥 LOGS DETALLADOS
+        test_type = row[2]
+        status = meter_status_dropdown.value
+        print(f"[TABLE_TESTS] 🧮 Calculando error:")
+        print(f"  📝 Tipo de prueba: {test_type}")
+        print(f"  📊 Lectura inicial: {row[3]}")
+        print(f"  📊 Lectura final: {row[4]}")
+        print(f"  📊 Volumen patrón (instantáneo): {max(instant_values.get(test_type, 0), MIN_PATTERN_VOLUME)}")
+        print(f"  📊 Error calculado: {error:.2f}%")
+        print(f"  📊 Tolerancia aplicada: {tolerance_for(status, test_type)}%")
+        print(f"  📊 Estado del medidor: {status}")
 
     def update_table():
         try:
             data_rows = []
-            for idx, row in enumerate(rows):
-                test_num = get_test_count(row[1], row[2], idx)
-                error, status_text, status_color = calculate_error(row[3], row[4], row[2])
-                rows[idx][5] = str(error)
-                rows[idx][6] = status_text
+            results = recalculate_rows(rows, instant_values, meter_status_dropdown.value)
+            for idx, (row, (test_num, error, status_text, status_color)) in enumerate(zip(rows, results)):
+                if status_text != "Error":
+                    log_error_calculation(row, error)
 
                 data_rows.append(ft.DataRow(cells=[
                     ft.DataCell(ft.Text(str(test_num))),